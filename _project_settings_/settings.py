@@ -16,7 +16,7 @@ ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS').split(' ')
 
 INSTALLED_APPS = [
     'api.api_user',
-    'api.api_post',
+    'api.api_post.apps.ApiConfig',
     'django_templates.users',
     'django_templates.posts',
     'ckeditor',
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.api_post.instrumentation.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -103,11 +104,129 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# 'locmem' keeps the cache in every process; 'file', 'database' (run
+# createcachetable), 'memcached' and 'redis' share it between workers at
+# CACHE_LOCATION. The default cache is a TieredCache over it, which keeps
+# versioned keys in the process too and counts hits per key kind.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+SHARED_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', ''),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache',
+             os.path.join(BASE_DIR, 'cache')),
+    'database': ('django.core.cache.backends.db.DatabaseCache',
+                 'cache_entries'),
+    'memcached': ('django.core.cache.backends.memcached.MemcachedCache',
+                  '127.0.0.1:11211'),
+    'redis': ('django_redis.cache.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'api.api_post.cache_backends.TieredCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            # keys embedding generations, a local copy is never stale;
+            # locmem is in the process already
+            'L1_PREFIXES': () if CACHE_BACKEND == 'locmem' else (
+                'response:', 'entries_count:', 'template.cache.',
+            ),
+            'L1_TIMEOUT': 60,
+            'L1_MAX_ENTRIES': 1000,
+        },
+    },
+    'shared': {
+        'BACKEND': SHARED_CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION',
+                                   SHARED_CACHE_BACKENDS[CACHE_BACKEND][1]),
+        # memcached and redis evict keys themselves and pass OPTIONS on
+        # to their clients
+        'OPTIONS': ({} if CACHE_BACKEND in ('memcached', 'redis')
+                    else {'MAX_ENTRIES': 10000}),
+    },
+}
+
+# seconds to keep rendered list responses, writes invalidate them
+# earlier by generation; 0 turns the response cache off
+RESPONSE_CACHE_TIMEOUT = 300
+# seconds to keep the groups of the navigation, posts moved to another
+# group are counted there after that
+NAV_GROUPS_TIMEOUT = 60
+# one worker recomputes an expired or invalidated value under a lock of
+# CACHE_LOCK_TIMEOUT seconds, the others serve the old value, kept
+# CACHE_STALE_TIMEOUT seconds longer, or wait CACHE_LOCK_WAIT seconds
+# for the first one
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 2
+CACHE_STALE_TIMEOUT = 600
+# how early hot values are recomputed before they expire, 0 never
+CACHE_EARLY_EXPIRATION = 1.0
+# seconds to keep entries_count of a post list
+ENTRIES_COUNT_CACHE_TIMEOUT = 30
+# estimate the unfiltered posts count from pg_class.reltuples (PostgreSQL)
+ENTRIES_COUNT_ESTIMATE = int(os.environ.get('ENTRIES_COUNT_ESTIMATE', 0))
+ENTRIES_COUNT_ESTIMATE_MIN = 100000
+
+# keep vote toggles in memory and write them in bulk every
+# VOTES_FLUSH_INTERVAL seconds instead of on every click
+VOTES_WRITE_BEHIND = int(os.environ.get('VOTES_WRITE_BEHIND', 0))
+VOTES_FLUSH_INTERVAL = 2
+
+# authors with more followers are not copied into follow timelines,
+# their posts are read when the feed is requested
+FEED_FANOUT_LIMIT = 1000
+# sync_feeds copies the posts of such authors again once they are down
+# to this many followers
+FEED_FANOUT_RESUME = 800
+# latest posts of an author copied into the timeline on follow, older
+# ones are read from the posts when the feed reaches them
+FEED_BACKFILL = 100
+# latest posts of a pulled author cached for merging into feeds
+FEED_AUTHOR_POSTS = 200
+FEED_AUTHOR_POSTS_TIMEOUT = 600
+
+# 'mptt' keeps nested sets (lft/rght) of comment threads, 'path' keeps
+# only materialized paths, so a reply doesn't shift the rest of the thread;
+# run rebuild_comment_tree after switching back to 'mptt'
+COMMENTS_TREE_STORAGE = os.environ.get('COMMENTS_TREE_STORAGE', 'mptt')
+# replies shown under every thread of a page of comment threads
+COMMENTS_PREVIEW = 3
+
+# text search configuration of post search on PostgreSQL
+SEARCH_CONFIG = os.environ.get('SEARCH_CONFIG', 'russian')
+# 'database' searches the PostgreSQL/FTS5 table, 'index' the in-process
+# inverted index persisted in SEARCH_INDEX_DIR
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'database')
+SEARCH_INDEX_DIR = os.environ.get('SEARCH_INDEX_DIR',
+                                  os.path.join(BASE_DIR, 'search_index'))
+# documents buffered in memory before they are written as a segment,
+# changes made by signals are written SEARCH_INDEX_FLUSH_INTERVAL
+# seconds after their transaction commits, other processes see them then
+SEARCH_INDEX_FLUSH_DOCS = 1000
+SEARCH_INDEX_FLUSH_INTERVAL = 2
+SEARCH_INDEX_MAX_SEGMENTS = 8
+# best matches ranked by the index, the rest is not returned
+SEARCH_INDEX_MAX_RESULTS = 1000
+
+# seconds before the suggestion index of a process is reloaded, changes
+# made by other processes are not seen until then
+SUGGEST_INDEX_MAX_AGE = 300
+
+# queries allowed per view name in GET, HEAD and OPTIONS requests, more
+# are logged as a warning or raise QueryBudgetExceeded with
+# QUERY_BUDGET_STRICT (on in test_queries)
+QUERY_BUDGETS = {
+    'posts-list': 5,
+    # a merged feed loads the counts and latest posts of pulled authors,
+    # past the horizon older posts are counted and read too
+    'posts-follow': 10,
+    'posts-detail': 4,
+    'comments-list': 5,
+    'comments-replies': 5,
+    'profile': 6,
+    'group-list': 3,
+    'tag-list': 3,
+    'suggest': 3,
 }
+QUERY_BUDGET_STRICT = int(os.environ.get('QUERY_BUDGET_STRICT', 0))
 
 TEST_CACHES = {
     'default': {
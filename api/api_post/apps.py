@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 
 class ApiConfig(AppConfig):
-    name = 'api_post'
+    name = 'api.api_post'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,162 @@
+import math
+import random
+import secrets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+GENERATION_KEY = 'generation:{}'
+STALE_KEY = 'stale:{}'
+LOCK_KEY = 'lock:{}'
+LOCK_POLL = 0.02
+
+
+def count_namespace(model):
+    return f'count:{model._meta.label_lower}'
+
+
+def get_generation(namespace):
+    """Current generation of namespace, cached keys embed it."""
+    key = GENERATION_KEY.format(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # start from the clock, so a lost counter never reuses old keys
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace):
+    """Invalidate every key built on namespace without deleting them.
+
+    Inside a transaction the namespace is bumped again on commit: a
+    reader in between could cache the old rows under the new generation.
+    """
+    key = GENERATION_KEY.format(namespace)
+
+    def bump():
+        # a random value rather than incr(): file and database caches
+        # don't increment atomically, two bumps could end on the same
+        # generation
+        cache.set(key, secrets.randbits(62), None)
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def response_namespace(model):
+    return f'response:{model._meta.label_lower}'
+
+
+def get_generations(namespaces):
+    """get_generation() of several namespaces with one cache read."""
+    keys = [GENERATION_KEY.format(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else get_generation(namespace)
+            for key, namespace in zip(keys, namespaces)]
+
+
+def object_namespace(model, pk):
+    return f'object:{model._meta.label_lower}:{pk}'
+
+
+def list_namespace(model, ordering=''):
+    """Lists of model in ordering, bumped when rows enter or move."""
+    return f'list:{model._meta.label_lower}:{ordering}'
+
+
+def get_version(namespaces):
+    """Version of an entry built from namespaces, a part of its key."""
+    return '.'.join(map(str, get_generations(namespaces)))
+
+
+def invalidate_votes(model, object_id):
+    """Bump the object and the lists ordered by rating.
+
+    Pages keep the generations of their objects, so the other pages of
+    the model stay cached.
+    """
+    bump_generation(object_namespace(model, object_id))
+    bump_generation(list_namespace(model, 'rating'))
+
+
+def acquire_lock(key):
+    """Token of the lock of key, None if another worker holds it."""
+    token = secrets.token_hex(8)
+    if cache.add(LOCK_KEY.format(key), token, settings.CACHE_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def release_lock(key, token):
+    # a lock that timed out may be somebody else's by now
+    if cache.get(LOCK_KEY.format(key)) == token:
+        cache.delete(LOCK_KEY.format(key))
+
+
+def expires_early(expires, delta):
+    """Whether to recompute an entry before it expires (XFetch).
+
+    The closer the expiry and the longer the value took to compute, the
+    likelier one of the readers refreshes it ahead of the others.
+    """
+    beta = settings.CACHE_EARLY_EXPIRATION
+    return time.time() - delta * beta * math.log(1 - random.random()) >= (
+        expires)
+
+
+def cached_value(key, compute, timeout, version='', fresh=None):
+    """compute() cached under key and version for timeout seconds.
+
+    Only one worker at a time recomputes a key. Meanwhile the others get
+    the value of an older version or of an expired entry, kept
+    CACHE_STALE_TIMEOUT seconds longer, or wait up to CACHE_LOCK_WAIT
+    seconds when there is none. Entries under a version never change,
+    a cached value fresh(value) rejects is recomputed like an expiring
+    one.
+    """
+    entry_key = f'{key}:{version}' if version else key
+    entry = cache.get(entry_key)
+    if entry is not None:
+        value, expires, delta = entry
+        if ((fresh is None or fresh(value)) and
+                not expires_early(expires, delta)):
+            return value
+        token = acquire_lock(key)
+        if token is None:
+            return value
+    else:
+        token = acquire_lock(key)
+        if token is None:
+            stale = cache.get(STALE_KEY.format(key))
+            if stale is not None:
+                return stale[0]
+            entry = wait_for_entry(entry_key)
+            if entry is not None:
+                return entry[0]
+    try:
+        started = time.time()
+        value = compute()
+        now = time.time()
+        entry = (value, now + timeout, now - started)
+        cache.set(entry_key, entry, timeout)
+        cache.set(STALE_KEY.format(key), entry,
+                  timeout + settings.CACHE_STALE_TIMEOUT)
+        return value
+    finally:
+        if token is not None:
+            release_lock(key, token)
+
+
+def wait_for_entry(entry_key):
+    """The entry another worker is computing, None if it's late."""
+    deadline = time.monotonic() + settings.CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL)
+        entry = cache.get(entry_key)
+        if entry is not None:
+            return entry
+    return None
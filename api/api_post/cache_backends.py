@@ -0,0 +1,183 @@
+"""Cache tier shared by the workers with an in-process L1 on top.
+
+TieredCache is the default cache. It keeps the data in the SHARED cache
+alias, a file, database, memcached or redis cache in production and a
+LocMemCache in development and tests. Keys starting with one of
+L1_PREFIXES are also kept in memory of the process for L1_TIMEOUT
+seconds: their keys embed generations, so a value under a key never
+changes and other workers can't make the copy stale. Generation
+counters and keys invalidated by delete always go to the shared cache.
+
+Gets are counted per key kind (the part before the first ':') in
+cache_stats, served by CacheStatsView.
+"""
+import threading
+from collections import defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.functional import cached_property
+
+MISSING = object()
+
+
+def key_kind(key):
+    kind, colon, _ = key.partition(':')
+    # template fragment keys are dotted, without the md5 of vary_on
+    return kind if colon else key.rpartition('.')[0] or key
+
+
+class KindStats:
+    def __init__(self):
+        self.l1_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        gets = self.l1_hits + self.hits + self.misses
+        return {
+            'gets': gets,
+            'l1_hits': self.l1_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round((self.l1_hits + self.hits) / gets, 3)
+            if gets else None,
+        }
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.kinds = defaultdict(KindStats)
+
+    def add(self, key, result):
+        with self.lock:
+            stats = self.kinds[key_kind(key)]
+            setattr(stats, result, getattr(stats, result) + 1)
+
+    def snapshot(self):
+        with self.lock:
+            total = KindStats()
+            for stats in self.kinds.values():
+                total.l1_hits += stats.l1_hits
+                total.hits += stats.hits
+                total.misses += stats.misses
+            return {
+                'total': total.as_dict(),
+                'kinds': {kind: stats.as_dict()
+                          for kind, stats in sorted(self.kinds.items())},
+            }
+
+    def reset(self):
+        with self.lock:
+            self.kinds.clear()
+
+
+cache_stats = CacheStats()
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.l1_prefixes = tuple(options.get('L1_PREFIXES', ()))
+        self.l1_timeout = options.get('L1_TIMEOUT', 60)
+        self.l1 = LocMemCache(f'l1:{location}', {
+            'TIMEOUT': self.l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000)},
+        })
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def in_l1(self, key):
+        return key.startswith(self.l1_prefixes)
+
+    def l1_set(self, key, value, timeout, version):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            timeout = self.l1_timeout
+        self.l1.set(key, value, min(timeout, self.l1_timeout), version)
+
+    def get(self, key, default=None, version=None):
+        in_l1 = self.in_l1(key)
+        if in_l1:
+            value = self.l1.get(key, MISSING, version)
+            if value is not MISSING:
+                cache_stats.add(key, 'l1_hits')
+                return value
+        value = self.shared.get(key, MISSING, version)
+        if value is MISSING:
+            cache_stats.add(key, 'misses')
+            return default
+        cache_stats.add(key, 'hits')
+        if in_l1:
+            self.l1_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        for key in keys:
+            if self.in_l1(key):
+                value = self.l1.get(key, MISSING, version)
+                if value is not MISSING:
+                    cache_stats.add(key, 'l1_hits')
+                    found[key] = value
+        rest = [key for key in keys if key not in found]
+        shared = self.shared.get_many(rest, version) if rest else {}
+        for key in rest:
+            if key in shared:
+                cache_stats.add(key, 'hits')
+                if self.in_l1(key):
+                    self.l1_set(key, shared[key], DEFAULT_TIMEOUT, version)
+            else:
+                cache_stats.add(key, 'misses')
+        return {**found, **shared}
+
+    def has_key(self, key, version=None):
+        return (self.in_l1(key) and self.l1.has_key(key, version) or
+                self.shared.has_key(key, version))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added and self.in_l1(key):
+            self.l1_set(key, value, timeout, version)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        if self.in_l1(key):
+            self.l1_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if self.in_l1(key) and key not in failed:
+                self.l1_set(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.shared.incr(key, delta, version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.shared.decr(key, delta, version)
+
+    def delete(self, key, version=None):
+        self.l1.delete(key, version)
+        self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        self.l1.delete_many(keys, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self.l1.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
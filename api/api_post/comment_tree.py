@@ -0,0 +1,98 @@
+"""Nested comment threads built from flat preorder rows.
+
+Comment.path_storage() picks the preorder: (tree_id, lft) of the MPTT
+nested sets, or the materialized path when lft/rght are not kept.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Comment
+
+# first replies of every thread by path, a window over the page's threads
+PATH_PREVIEW_SQL = '''
+{table}.id IN (
+    SELECT id FROM (
+        SELECT id, ROW_NUMBER() OVER (
+            PARTITION BY tree_id ORDER BY path
+        ) AS position
+        FROM {table}
+        WHERE tree_id IN ({trees}) AND level > 0 AND level <= %s
+    ) AS preview
+    WHERE position <= %s
+)
+'''
+
+
+def nest(comments):
+    """Nest serialized comments in one pass, return the roots.
+
+    In preorder every parent comes before its replies, so each comment
+    is appended to an already seen parent.
+    """
+    roots, by_id = [], {}
+    for comment in comments:
+        comment['children'] = []
+        by_id[comment['id']] = comment
+        parent = by_id.get(comment['parent'])
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent['children'].append(comment)
+    return roots
+
+
+def thread_order(queryset):
+    """Comments in preorder: threads by tree, replies under their parent."""
+    if Comment.path_storage():
+        return queryset.order_by('path')
+    return queryset.order_by('tree_id', 'lft')
+
+
+def previews(queryset, roots, max_depth):
+    """The first COMMENTS_PREVIEW replies of every root, in preorder.
+
+    The k-th comment of a thread in preorder has lft <= 2k, so one
+    tree_id__in query bounded by lft reads at most twice the preview
+    per thread, however large the thread is. Paths give no such bound,
+    there a window function picks the replies inside the database.
+    Replies deeper than max_depth are left out of the preview, not
+    replaced.
+    """
+    limit = settings.COMMENTS_PREVIEW
+    if not roots or max_depth < 1 or limit < 1:
+        return []
+    trees = [root.tree_id for root in roots]
+    if Comment.path_storage():
+        table = connection.ops.quote_name(Comment._meta.db_table)
+        return list(thread_order(queryset.extra(
+            where=[PATH_PREVIEW_SQL.format(
+                table=table, trees=', '.join(['%s'] * len(trees))
+            )],
+            params=[*trees, max_depth, limit],
+        )))
+    comments = thread_order(queryset.filter(
+        tree_id__in=trees,
+        lft__lte=2 * limit + 1,
+        level__gt=0,
+        level__lte=max_depth,
+    ))
+    shown = defaultdict(int)
+    preview = []
+    for comment in comments:
+        if shown[comment.tree_id] < limit:
+            shown[comment.tree_id] += 1
+            preview.append(comment)
+    return preview
+
+
+def subtree(queryset, comment):
+    """Replies under comment, at any depth, in preorder."""
+    if Comment.path_storage():
+        return queryset.filter(
+            path__startswith=comment.path, path__gt=comment.path
+        ).order_by('path')
+    return queryset.filter(
+        tree_id=comment.tree_id, lft__gt=comment.lft, rght__lt=comment.rght
+    ).order_by('lft')
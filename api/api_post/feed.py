@@ -0,0 +1,319 @@
+"""Follow feed: fan-out-on-write timeline with fan-out-on-read fallback.
+
+A new post is copied into FeedEntry of every follower, so a feed page is
+one range scan of the (user, pub_date) index. Authors with more than
+FEED_FANOUT_LIMIT followers are not copied: their follows get
+fanout=False and their latest posts, cached per author, are merged into
+the timeline when the feed is requested (MergedFeed). A follow or an
+unfollow only switches the flags; the sync_feeds command deletes the
+copies of such authors and copies the posts again of those who have
+dropped to FEED_FANOUT_RESUME followers, so an author at the limit does
+not flip on every follow.
+
+A follow copies only the latest FEED_BACKFILL posts of the author and
+keeps the date of the oldest copied one in backfilled_until. Below the
+latest such date of a user's follows, the horizon, the timeline is not
+complete and the feed reads the posts of the followed authors instead.
+"""
+import heapq
+import operator
+from functools import reduce
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.utils.functional import cached_property
+
+from .cache import bump_generation, count_namespace
+from .models import FeedEntry, Follow, Post, User
+from .pagination import cached_count
+
+AUTHOR_POSTS_KEY = 'author_posts:{}'
+
+
+def timeline(user):
+    """Copied feed entries of user, newest first."""
+    return FeedEntry.objects.filter(user=user).order_by('-pub_date', '-post')
+
+
+def feed_sources(user):
+    """(pulled authors, horizon) of the feed of user.
+
+    Pulled authors are followed authors whose posts are not copied into
+    the timeline. Posts older than the horizon may be missing from it.
+    """
+    authors, horizon = [], None
+    for author, fanout, until in Follow.objects.filter(
+            user=user).values_list('author', 'fanout', 'backfilled_until'):
+        if not fanout:
+            authors.append(author)
+        elif until is not None and (horizon is None or until > horizon):
+            horizon = until
+    return authors, horizon
+
+
+def feed_posts(user):
+    """All posts of the authors user follows, for filtered feeds."""
+    return Post.objects.filter(
+        author__in=Follow.objects.filter(user=user).values('author')
+    )
+
+
+def add_entries(entries):
+    FeedEntry.objects.bulk_create(entries, batch_size=1000,
+                                  ignore_conflicts=True)
+    bump_generation(count_namespace(FeedEntry))
+
+
+def fan_out(post):
+    """Copy a new post into the timelines of its author's followers."""
+    followers = Follow.objects.filter(
+        author=post.author_id, fanout=True
+    ).values_list('user', flat=True)
+    add_entries(
+        FeedEntry(user_id=follower, post=post, author_id=post.author_id,
+                  pub_date=post.pub_date)
+        for follower in followers.iterator()
+    )
+
+
+def backfill(follows):
+    """Copy the latest posts of each followed author into the timeline."""
+    entries = []
+    for follow in follows:
+        posts = list(Post.objects.filter(author=follow.author_id).order_by(
+            '-pub_date'
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL])
+        entries.extend(
+            FeedEntry(user_id=follow.user_id, post_id=post,
+                      author_id=follow.author_id, pub_date=pub_date)
+            for post, pub_date in posts
+        )
+        # the author may have older posts, left out of the timeline
+        until = (posts[-1][1] if len(posts) == settings.FEED_BACKFILL
+                 else None)
+        if follow.backfilled_until != until:
+            Follow.objects.filter(pk=follow.pk).update(
+                backfilled_until=until
+            )
+            follow.backfilled_until = until
+    add_entries(entries)
+
+
+def follow_added(follow):
+    with transaction.atomic():
+        followers = Follow.objects.filter(author=follow.author_id)
+        pulled = followers.exclude(pk=follow.pk).filter(fanout=False)
+        if not pulled.exists():
+            if followers.count() <= settings.FEED_FANOUT_LIMIT:
+                backfill([follow])
+                return
+            # the author has just become a celebrity, their copies are
+            # deleted by sync_feeds
+        followers.filter(fanout=True).update(fanout=False)
+        follow.fanout = False
+
+
+def follow_removed(follow):
+    deleted, _ = FeedEntry.objects.filter(
+        user=follow.user_id, author=follow.author_id
+    ).delete()
+    if deleted:
+        bump_generation(count_namespace(FeedEntry))
+
+
+def delete_pulled_entries(batch_size=1000):
+    """Delete timeline copies of pulled authors, return their number."""
+    entries = FeedEntry.objects.filter(
+        author__in=Follow.objects.filter(fanout=False).values('author')
+    )
+    deleted = 0
+    while True:
+        batch = list(entries.order_by().values_list(
+            'pk', flat=True
+        )[:batch_size])
+        if not batch:
+            break
+        deleted += FeedEntry.objects.filter(pk__in=batch).delete()[0]
+    if deleted:
+        bump_generation(count_namespace(FeedEntry))
+    return deleted
+
+
+def resume_fanout():
+    """Copy pulled authors with FEED_FANOUT_RESUME followers at most back
+    into the timelines, return their number."""
+    resumed = 0
+    authors = Follow.objects.filter(fanout=False).values_list(
+        'author', flat=True
+    ).distinct()
+    for author in list(authors):
+        with transaction.atomic():
+            followers = Follow.objects.filter(author=author)
+            if followers.count() > settings.FEED_FANOUT_RESUME:
+                continue
+            followers.update(fanout=True)
+            backfill(followers)
+        resumed += 1
+    return resumed
+
+
+def author_posts(author_ids):
+    """{author: (posts count, [(pub_date, id), ...] newest first)}.
+
+    The latest FEED_AUTHOR_POSTS posts of every author are cached until
+    the author creates or deletes a post.
+    """
+    keys = {AUTHOR_POSTS_KEY.format(author): author for author in author_ids}
+    result = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = set(author_ids) - set(result)
+    if missing:
+        loaded = load_author_posts(missing)
+        cache.set_many({AUTHOR_POSTS_KEY.format(author): value
+                        for author, value in loaded.items()},
+                       settings.FEED_AUTHOR_POSTS_TIMEOUT)
+        result.update(loaded)
+    return result
+
+
+def load_author_posts(author_ids):
+    """author_posts() of any number of authors in two queries.
+
+    The first counts the posts of every author and finds the date of
+    the last post to keep, the second reads the posts down to it.
+    """
+    limit = settings.FEED_AUTHOR_POSTS
+    posts = Post.objects.filter(author=OuterRef('pk'))
+    authors = User.objects.filter(pk__in=author_ids).annotate(
+        posts_count=Subquery(posts.order_by().values('author').annotate(
+            count=Count('pk')
+        ).values('count')),
+        oldest=Subquery(posts.order_by('-pub_date', '-pk').values(
+            'pub_date'
+        )[limit - 1:limit]),
+    ).values_list('pk', 'posts_count', 'oldest')
+    result = {author: (0, []) for author in author_ids}
+    conditions = []
+    for author, count, oldest in authors:
+        if not count:
+            continue
+        result[author] = (count, [])
+        conditions.append(Q(author=author) if oldest is None else
+                          Q(author=author, pub_date__gte=oldest))
+    if conditions:
+        for author, pub_date, pk in Post.objects.filter(
+                reduce(operator.or_, conditions)
+        ).order_by('-pub_date', '-pk').values_list(
+            'author', 'pub_date', 'pk'
+        ):
+            latest = result[author][1]
+            if len(latest) < limit:
+                latest.append((pub_date, pk))
+    return result
+
+
+def forget_author_posts(author_id):
+    key = AUTHOR_POSTS_KEY.format(author_id)
+    cache.delete(key)
+    # a feed read before the commit could cache the old posts again
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+class MergedFeed:
+    """Timeline of user merged with the latest posts of pulled authors.
+
+    Sliced by the Paginator: a slice up to stop takes at most stop
+    entries from the timeline and from every author and merges them with
+    a heap, so a page costs its number times the page size per source,
+    whatever the total number of posts. Posts up to the horizon follow,
+    read from the posts of every followed author.
+    """
+
+    def __init__(self, user, authors, load_posts, horizon=None):
+        self.user = user
+        self.authors = author_posts(authors)
+        self.load_posts = load_posts
+        self.horizon = horizon
+
+    def newer(self, queryset):
+        if self.horizon is None:
+            return queryset
+        return queryset.filter(pub_date__gt=self.horizon)
+
+    def copied(self):
+        """Timeline entries newer than the horizon.
+
+        Copies of pulled authors left until sync_feeds deletes them are
+        skipped, their posts come from the cached ones.
+        """
+        return self.newer(timeline(self.user)).exclude(
+            author__in=list(self.authors)
+        )
+
+    def author_count(self, author, count, latest):
+        """Posts of a pulled author newer than the horizon."""
+        if self.horizon is None:
+            return count
+        if count > len(latest) and all(
+                pub_date > self.horizon for pub_date, _ in latest):
+            return self.newer(Post.objects.filter(author=author)).count()
+        return sum(pub_date > self.horizon for pub_date, _ in latest)
+
+    def older(self):
+        return feed_posts(self.user).filter(
+            pub_date__lte=self.horizon
+        ).order_by('-pub_date', '-pk')
+
+    @cached_property
+    def newer_count(self):
+        return cached_count(self.copied()) + sum(
+            self.author_count(author, *posts)
+            for author, posts in self.authors.items()
+        )
+
+    def count(self):
+        if self.horizon is None:
+            return self.newer_count
+        return self.newer_count + cached_count(self.older())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        start, stop = index.start or 0, index.stop
+        sources = [self.copied().values_list(
+            'pub_date', 'post'
+        )[:stop]]
+        deeper = []
+        for author, (count, latest) in self.authors.items():
+            if stop > len(latest) and count > len(latest):
+                deeper.append(author)
+                continue
+            if self.horizon is not None:
+                latest = [(pub_date, post) for pub_date, post in latest
+                          if pub_date > self.horizon]
+            sources.append(latest[:stop])
+        if deeper:
+            # the merge takes at most stop posts of these authors together
+            sources.append(self.newer(
+                Post.objects.filter(author__in=deeper)
+            ).order_by('-pub_date', '-pk').values_list(
+                'pub_date', 'pk'
+            )[:stop])
+        merged = heapq.merge(*sources, reverse=True)
+        ids = [post for _, post in islice(unique(merged), start, stop)]
+        if self.horizon is not None and stop > self.newer_count:
+            ids += self.older().values_list('pk', flat=True)[
+                max(start - self.newer_count, 0):stop - self.newer_count
+            ]
+        return self.load_posts(ids)
+
+
+def unique(entries):
+    seen = set()
+    for pub_date, post in entries:
+        if post not in seen:
+            seen.add(post)
+            yield pub_date, post
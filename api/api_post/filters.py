@@ -1,6 +1,10 @@
 import django_filters
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
 
 from .models import Post
+from .pagination import KeysetPagination
+from .search import search_posts
 
 
 class PostFilter(django_filters.FilterSet):
@@ -17,3 +21,20 @@ class PostFilter(django_filters.FilterSet):
     def filter_tag(self, queryset, field_name, tag):
         return queryset.filter(tags__slug=tag)
 
+
+class PostSearchFilter(SearchFilter):
+    """Full-text search of ?search=, ranked unless ordered otherwise.
+
+    Cursor pages seek by model fields, so they keep the queryset
+    ordering instead of the rank.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+        ranked = not (
+            request.query_params.get(api_settings.ORDERING_PARAM) or
+            KeysetPagination.is_requested(request)
+        )
+        return search_posts(queryset, terms, ranked)
@@ -0,0 +1,183 @@
+"""Per-view query count and timings.
+
+QueryStatsMiddleware counts queries and DB time of every request,
+RequestTimings collects serializer and render time on top of that. The
+totals go to the Server-Timing header and to in-process stats per
+resolved view name, served by RequestStatsView.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestTimings:
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.render = 0.0
+        self.total = 0.0
+        self.render_start = None
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;desc="{self.queries} queries";dur={self.db * 1000:.2f}',
+            f'serializer;dur={self.serializer * 1000:.2f}',
+            f'render;dur={self.render * 1000:.2f}',
+            f'total;dur={self.total * 1000:.2f}',
+        ))
+
+
+@contextmanager
+def timer(name):
+    """Add the time of the block to the current request's timings."""
+    timings = current_timings.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            setattr(timings, name,
+                    getattr(timings, name) + time.perf_counter() - start)
+
+
+class TimedSerializerMixin:
+    """Count time of serializer.data as serializer time of the request."""
+
+    @property
+    def data(self):
+        with timer('serializer'):
+            return super().data
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.over_budget = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.render = 0.0
+        self.total = 0.0
+
+    def add(self, timings, over_budget):
+        self.requests += 1
+        self.queries += timings.queries
+        self.max_queries = max(self.max_queries, timings.queries)
+        self.over_budget += over_budget
+        self.db += timings.db
+        self.serializer += timings.serializer
+        self.render += timings.render
+        self.total += timings.total
+
+    def as_dict(self, budget):
+        def average(value):
+            return round(value / self.requests * 1000, 3)
+        return {
+            'requests': self.requests,
+            'avg_queries': round(self.queries / self.requests, 2),
+            'max_queries': self.max_queries,
+            'query_budget': budget,
+            'over_budget': self.over_budget,
+            'avg_db_ms': average(self.db),
+            'avg_serializer_ms': average(self.serializer),
+            'avg_render_ms': average(self.render),
+            'avg_total_ms': average(self.total),
+        }
+
+
+class RequestStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewStats)
+
+    def add(self, view_name, timings, over_budget):
+        with self.lock:
+            self.views[view_name].add(timings, over_budget)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: stats.as_dict(settings.QUERY_BUDGETS.get(name))
+                for name, stats in sorted(self.views.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+request_stats = RequestStats()
+
+
+class QueryStatsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        timings.total = time.perf_counter() - start
+        response['Server-Timing'] = timings.server_timing()
+
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        # writes run their own queries, the budget is for reads
+        budget = (settings.QUERY_BUDGETS.get(view_name)
+                  if request.method in SAFE_METHODS else None)
+        over_budget = budget is not None and timings.queries > budget
+        request_stats.add(view_name, timings, over_budget)
+        if over_budget:
+            message = (f'{view_name} ran {timings.queries} queries, '
+                       f'the budget is {budget}')
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.render_start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: self.rendered(timings)
+            )
+        return response
+
+    @staticmethod
+    def rendered(timings):
+        timings.render += time.perf_counter() - timings.render_start
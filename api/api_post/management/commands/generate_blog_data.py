@@ -0,0 +1,331 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from api.api_post import search
+from api.api_post.models import (Comment, FeedEntry, Follow, Group,
+                                 LikeDislike, Post, Tag, User)
+
+BATCH_SIZE = 5000
+WORDS = ('блог', 'запись', 'django', 'python', 'новости', 'код', 'тест',
+         'сообщество', 'vue', 'docker', 'release', 'performance')
+# share of comments that start a new thread instead of answering
+ROOT_COMMENT_SHARE = 0.4
+
+
+def insert_rows(table, columns, rows):
+    """Insert rows with plain executemany, the ORM is too slow for this."""
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def zipf_weights(size, skew):
+    return [1 / rank ** skew for rank in range(1, size + 1)]
+
+
+def zipf_counts(total, size, skew, limit):
+    """Split total between size items by Zipf's law, each at most limit."""
+    weights = zipf_weights(size, skew)
+    norm = sum(weights)
+    return [min(limit, int(total * weight / norm)) for weight in weights]
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with synthetic users, groups, tags, posts, '
+            'follows, comment trees and votes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--votes', type=int, default=100000)
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=0.7,
+            help='Zipf exponent of posts per author, followers per author, '
+                 'posts per group and tag, comments and votes per post.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix',
+            default='gen',
+            help='Prefix of generated usernames.',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.skew = options['skew']
+        prefix = options['prefix']
+        with transaction.atomic():
+            users = self.generate_users(options['users'], prefix)
+            groups = self.generate_groups(options['groups'], prefix)
+            tags = self.generate_tags(options['tags'], prefix)
+            posts = self.generate_posts(options['posts'], users, groups)
+            if posts:
+                search.index_posts(Post.objects.filter(
+                    pk__range=(min(posts), max(posts))
+                ))
+            post_tags = self.generate_post_tags(posts, tags)
+            follows = self.generate_follows(options['follows'], users)
+            feed_entries = self.generate_timelines()
+            comments = self.generate_comments(
+                options['comments'], posts, users
+            )
+            votes = self.generate_votes(options['votes'], list(posts), users)
+        self.stdout.write(
+            f'Generated {len(users)} users, {len(groups)} groups, '
+            f'{len(tags)} tags, {len(posts)} posts with {post_tags} tags, '
+            f'{follows} follows, {feed_entries} feed entries, '
+            f'{comments} comments, {votes} votes.'
+        )
+
+    def skewed_choices(self, population, count):
+        """count picks, the first items of population are the popular ones."""
+        if not population:
+            return []
+        return self.random.choices(
+            population, zipf_weights(len(population), self.skew), k=count
+        )
+
+    def generate_users(self, count, prefix):
+        joined = connection.ops.adapt_datetimefield_value(self.now)
+        insert_rows(
+            User._meta.db_table,
+            ('password', 'is_superuser', 'username', 'first_name',
+             'last_name', 'email', 'is_staff', 'is_active', 'date_joined'),
+            [('!', False, f'{prefix}{i}', '', '', f'{prefix}{i}@example.com',
+              False, True, joined) for i in range(count)],
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix,
+        ).order_by('id').values_list('id', flat=True))
+
+    def generate_groups(self, count, prefix):
+        insert_rows(
+            Group._meta.db_table,
+            ('title', 'slug', 'description'),
+            [(f'{prefix} group {i}', f'{prefix}-group-{i}',
+              ' '.join(self.random.choices(WORDS, k=10)))
+             for i in range(count)],
+        )
+        return list(Group.objects.filter(
+            slug__startswith=f'{prefix}-group-',
+        ).order_by('id').values_list('id', flat=True))
+
+    def generate_tags(self, count, prefix):
+        insert_rows(
+            Tag._meta.db_table,
+            ('title', 'slug'),
+            [(f'{prefix} tag {i}', f'{prefix}-tag-{i}') for i in range(count)],
+        )
+        return list(Tag.objects.filter(
+            slug__startswith=f'{prefix}-tag-',
+        ).order_by('id').values_list('id', flat=True))
+
+    def generate_posts(self, count, users, groups):
+        """Insert posts over the last year, return {id: pub_date}."""
+        start = self.now - timedelta(days=365)
+        step = timedelta(days=365) / max(count, 1)
+        authors = self.skewed_choices(
+            self.random.sample(users, len(users)), count
+        )
+        post_groups = self.skewed_choices(groups, count)
+        rows = []
+        for i in range(count):
+            text = ' '.join(self.random.choices(WORDS, k=40))
+            pub_date = start + step * i
+            group = (post_groups[i] if groups and self.random.random() < 0.7
+                     else None)
+            rows.append((
+                text, text[:200] + '...',
+                connection.ops.adapt_datetimefield_value(pub_date),
+                authors[i], group, 0, 0, 0, 0,
+            ))
+        insert_rows(
+            Post._meta.db_table,
+            ('text', 'text_preview', 'pub_date', 'author_id', 'group_id',
+             'likes_count', 'dislikes_count', 'rating', 'comments_count'),
+            rows,
+        )
+        return dict(Post.objects.order_by('-id').values_list(
+            'id', 'pub_date'
+        )[:count])
+
+    def generate_post_tags(self, posts, tags):
+        rows = []
+        for post in posts:
+            picked = set(self.skewed_choices(tags, self.random.randint(0, 3)))
+            rows.extend((post, tag) for tag in picked)
+        insert_rows(Post.tags.through._meta.db_table,
+                    ('post_id', 'tag_id'), rows)
+        return len(rows)
+
+    def generate_follows(self, count, users):
+        """Uniform followers of skewed authors, a few have most of them."""
+        if len(users) < 2:
+            return 0
+        authors = self.random.sample(users, len(users))
+        pairs = set()
+        for _ in range(count * 3):
+            if len(pairs) >= count:
+                break
+            user = self.random.choice(users)
+            author = self.skewed_choices(authors, 1)[0]
+            if user != author:
+                pairs.add((user, author))
+        insert_rows(Follow._meta.db_table, ('user_id', 'author_id', 'fanout'),
+                    [(user, author, True) for user, author in sorted(pairs)])
+        return len(pairs)
+
+    def generate_timelines(self):
+        """Feed entries as api_post.feed would have made them."""
+        celebrities = Follow.objects.order_by().values('author').annotate(
+            followers=Count('id')
+        ).filter(followers__gt=settings.FEED_FANOUT_LIMIT).values('author')
+        Follow.objects.filter(author__in=celebrities).update(fanout=False)
+        latest = defaultdict(list)
+        for post, author, pub_date in Post.objects.order_by(
+                '-pub_date').values_list('id', 'author', 'pub_date'):
+            if len(latest[author]) < settings.FEED_BACKFILL:
+                latest[author].append(
+                    (post, connection.ops.adapt_datetimefield_value(pub_date))
+                )
+        rows = []
+        for user, author in Follow.objects.filter(
+                fanout=True).values_list('user', 'author'):
+            rows.extend((user, post, author, pub_date)
+                        for post, pub_date in latest[author])
+        insert_rows(FeedEntry._meta.db_table,
+                    ('user_id', 'post_id', 'author_id', 'pub_date'), rows)
+        return len(rows)
+
+    def generate_comments(self, count, posts, users):
+        """Comment trees with precomputed MPTT fields, one tree per root."""
+        popular = self.random.sample(list(posts), len(posts))
+        counts = zipf_counts(count, len(popular), self.skew, count)
+        next_id = (Comment.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        roots = []
+        rows = {}
+        comments_counts = []
+        for post, comments in zip(popular, counts):
+            if not comments:
+                continue
+            created = posts[post]
+            nodes = []
+            for _ in range(comments):
+                created += timedelta(seconds=self.random.randint(1, 3600))
+                parent = None
+                if nodes and self.random.random() > ROOT_COMMENT_SHARE:
+                    parent = self.random.choice(nodes)
+                    if parent['level'] >= Comment.MAX_LEVEL:
+                        parent = parent['parent']
+                node = {
+                    'id': next_id, 'parent': parent, 'children': [],
+                    'level': parent['level'] + 1 if parent else 0,
+                    'created': created, 'post': post,
+                }
+                next_id += 1
+                nodes.append(node)
+                if parent:
+                    parent['children'].append(node)
+                else:
+                    roots.append(node)
+            comments_counts.append((comments, post))
+
+        roots.sort(key=lambda node: node['created'])
+        tree_id = Comment.objects.aggregate(last=Max('tree_id'))['last'] or 0
+        for root in roots:
+            tree_id += 1
+            self.number_tree(root, tree_id, 1, '', rows, users)
+        insert_rows(
+            Comment._meta.db_table,
+            ('id', 'text', 'created', 'lft', 'rght', 'tree_id', 'level',
+             'author_id', 'parent_id', 'post_id',
+             'likes_count', 'dislikes_count', 'rating',
+             'path', 'replies_count'),
+            [rows[key] for key in sorted(rows)],
+        )
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(),
+                                                         [Comment]):
+                cursor.execute(sql)
+            cursor.executemany(
+                'UPDATE {} SET comments_count = %s WHERE id = %s'.format(
+                    connection.ops.quote_name(Post._meta.db_table)
+                ),
+                comments_counts,
+            )
+        return len(rows)
+
+    def number_tree(self, node, tree_id, left, path, rows, users):
+        """Set lft/rght of the subtree in preorder, return the next number."""
+        path = '{}{:0{}d}'.format(path, node['id'], Comment.PATH_SEGMENT)
+        right = left + 1
+        for child in node['children']:
+            right = self.number_tree(child, tree_id, right, path,
+                                     rows, users) + 1
+        rows[node['id']] = (
+            node['id'], ' '.join(self.random.choices(WORDS, k=12)),
+            connection.ops.adapt_datetimefield_value(node['created']),
+            left, right, tree_id, node['level'], self.random.choice(users),
+            node['parent']['id'] if node['parent'] else None, node['post'],
+            0, 0, 0, path, (right - left - 1) // 2,
+        )
+        return right
+
+    def generate_votes(self, count, posts, users):
+        content_type = ContentType.objects.get_for_model(Post).id
+        popular = self.random.sample(posts, len(posts))
+        counts = zipf_counts(count, len(popular), self.skew, len(users))
+        rows = []
+        counters = []
+        for post, votes in zip(popular, counts):
+            if not votes:
+                continue
+            like_share = self.random.uniform(0.5, 0.95)
+            likes = 0
+            for user in self.random.sample(users, votes):
+                vote = (LikeDislike.LIKE if self.random.random() < like_share
+                        else LikeDislike.DISLIKE)
+                likes += vote == LikeDislike.LIKE
+                rows.append((vote, user, content_type, post))
+            counters.append((likes, votes - likes, 2 * likes - votes, post))
+            if len(rows) >= BATCH_SIZE:
+                self.flush_votes(rows, counters)
+                rows, counters = [], []
+        self.flush_votes(rows, counters)
+        return sum(counts)
+
+    def flush_votes(self, rows, counters):
+        insert_rows(
+            LikeDislike._meta.db_table,
+            ('vote', 'user_id', 'content_type_id', 'object_id'),
+            rows,
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'UPDATE {} SET likes_count = %s, dislikes_count = %s, '
+                'rating = %s WHERE id = %s'.format(
+                    connection.ops.quote_name(Post._meta.db_table)
+                ),
+                counters,
+            )
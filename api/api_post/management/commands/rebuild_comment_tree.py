@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.api_post.models import Comment
+
+BATCH_SIZE = 1000
+
+
+def rebuild_paths():
+    """Set path and replies_count of every comment from lft/rght."""
+    paths, batch = {}, []
+    comments = Comment.objects.order_by('tree_id', 'lft').only(
+        'parent_id', 'lft', 'rght'
+    )
+    for comment in comments.iterator():
+        comment.path = '{}{:0{}d}'.format(
+            paths.get(comment.parent_id, ''), comment.pk, Comment.PATH_SEGMENT
+        )
+        comment.replies_count = (comment.rght - comment.lft - 1) // 2
+        if comment.rght - comment.lft > 1:
+            paths[comment.pk] = comment.path
+        batch.append(comment)
+        if len(batch) == BATCH_SIZE:
+            Comment.objects.bulk_update(batch, ['path', 'replies_count'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['path', 'replies_count'])
+
+
+class Command(BaseCommand):
+    help = ('Rebuild lft/rght, levels, paths and replies counters of '
+            'comments from their parents. Run it before switching '
+            'COMMENTS_TREE_STORAGE from path back to mptt.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Comment._tree_manager.rebuild()
+            rebuild_paths()
+        self.stdout.write(
+            f'Comment: {Comment.objects.count()} in '
+            f'{Comment.objects.filter(level=0).count()} threads rebuilt.'
+        )
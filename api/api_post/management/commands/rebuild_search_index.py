@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.api_post import search
+from api.api_post.models import Post
+from api.api_post.search_index import get_search_index
+
+
+class Command(BaseCommand):
+    help = ('Rewrite the full-text search rows of all posts, and the '
+            'search index with SEARCH_BACKEND = index.')
+
+    def handle(self, *args, **options):
+        if search.get_backend() is not None:
+            with transaction.atomic():
+                search.index_rows(search.get_backend(), connection,
+                                  Post.objects.all())
+            self.stdout.write(
+                f'Post: {Post.objects.count()} in the {connection.vendor} '
+                f'search table.'
+            )
+        if search.index_enabled():
+            index = get_search_index()
+            index.clear()
+            search.index_documents(Post.objects.all())
+            index.flush()
+            self.stdout.write(
+                f'Post: {index.doc_count} in the search index, '
+                f'{len(index.segments)} segments.'
+            )
@@ -0,0 +1,97 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.api_post.models import Comment, LikeDislike, Post
+
+BATCH_SIZE = 1000
+
+
+def count_votes(model, **filters):
+    votes = LikeDislike.objects.filter(
+        content_type=ContentType.objects.get_for_model(model),
+        object_id=OuterRef('pk'),
+        **filters
+    ).order_by().values('object_id').annotate(
+        count=Count('id')
+    ).values('count')
+    return Coalesce(Subquery(votes, output_field=IntegerField()), 0)
+
+
+def update_drifted(model, queryset, fields, dry_run=False):
+    """Copy actual_<field> annotations into fields, return rows fixed."""
+    fixed = 0
+    batch = []
+    with transaction.atomic():
+        for obj in queryset.iterator():
+            for field in fields:
+                setattr(obj, field, getattr(obj, f'actual_{field}'))
+            batch.append(obj)
+            if len(batch) == BATCH_SIZE:
+                fixed += len(batch)
+                if not dry_run:
+                    model._default_manager.bulk_update(batch, fields)
+                batch = []
+        fixed += len(batch)
+        if batch and not dry_run:
+            model._default_manager.bulk_update(batch, fields)
+    return fixed
+
+
+def reconcile_votes(model, dry_run=False):
+    queryset = model._default_manager.annotate(
+        actual_likes_count=count_votes(model, vote__gt=0),
+        actual_dislikes_count=count_votes(model, vote__lt=0),
+        actual_rating=F('actual_likes_count') - F('actual_dislikes_count'),
+    ).exclude(
+        likes_count=F('actual_likes_count'),
+        dislikes_count=F('actual_dislikes_count'),
+        rating=F('actual_rating'),
+    ).only('pk')
+    return update_drifted(
+        model, queryset, ('likes_count', 'dislikes_count', 'rating'), dry_run
+    )
+
+
+def reconcile_comments(dry_run=False):
+    comments = Comment.objects.filter(
+        post=OuterRef('pk'),
+    ).order_by().values('post').annotate(
+        count=Count('id')
+    ).values('count')
+    queryset = Post.objects.annotate(
+        actual_comments_count=Coalesce(
+            Subquery(comments, output_field=IntegerField()), 0
+        ),
+    ).exclude(
+        comments_count=F('actual_comments_count'),
+    ).only('pk')
+    return update_drifted(Post, queryset, ('comments_count',), dry_run)
+
+
+class Command(BaseCommand):
+    help = 'Recount denormalized counters of posts and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report drifted rows, do not fix them.',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        for model in (Post, Comment):
+            fixed = reconcile_votes(model, dry_run)
+            self.stdout.write(
+                f'{model.__name__}: '
+                f'{fixed} with drifted vote counters'
+                f'{"" if dry_run else " fixed"}.'
+            )
+        fixed = reconcile_comments(dry_run)
+        self.stdout.write(
+            f'Post: {fixed} with drifted comments counter'
+            f'{"" if dry_run else " fixed"}.'
+        )
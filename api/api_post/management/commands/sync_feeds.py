@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.api_post import feed
+
+
+class Command(BaseCommand):
+    help = ('Delete the timeline copies of authors past FEED_FANOUT_LIMIT '
+            'and copy again the authors back at FEED_FANOUT_RESUME.')
+
+    def handle(self, *args, **options):
+        deleted = feed.delete_pulled_entries()
+        self.stdout.write(f'FeedEntry: {deleted} of pulled authors deleted.')
+        resumed = feed.resume_fanout()
+        self.stdout.write(f'Follow: {resumed} authors copied again.')
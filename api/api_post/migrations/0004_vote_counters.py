@@ -0,0 +1,73 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_votes(apps, schema_editor):
+    """Fill the counters of the objects voted before the migration."""
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    LikeDislike = apps.get_model('api_post', 'LikeDislike')
+    for model_name in ('post', 'comment'):
+        content_type = ContentType.objects.filter(
+            app_label='api_post', model=model_name
+        ).first()
+        if content_type is None:
+            continue
+        model = apps.get_model('api_post', model_name)
+        votes = LikeDislike.objects.filter(content_type=content_type)
+
+        def count(**filters):
+            counts = votes.filter(
+                object_id=OuterRef('pk'), **filters
+            ).order_by().values('object_id').annotate(
+                count=Count('id')
+            ).values('count')
+            return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+        voted = model.objects.filter(pk__in=votes.values('object_id'))
+        voted.update(likes_count=count(vote__gt=0),
+                     dislikes_count=count(vote__lt=0))
+        voted.update(rating=F('likes_count') - F('dislikes_count'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0003_auto_20210413_0119'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество дизлайков.', verbose_name='Дизлайки'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество лайков.', verbose_name='Лайки'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='rating',
+            field=models.IntegerField(default=0, editable=False, help_text='Разница лайков и дизлайков.', verbose_name='Рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество дизлайков.', verbose_name='Дизлайки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество лайков.', verbose_name='Лайки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rating',
+            field=models.IntegerField(default=0, editable=False, help_text='Разница лайков и дизлайков.', verbose_name='Рейтинг'),
+        ),
+        migrations.RunPython(count_votes, migrations.RunPython.noop),
+    ]
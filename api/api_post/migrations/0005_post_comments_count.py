@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    """Fill the counters of the posts commented before the migration."""
+    Post = apps.get_model('api_post', 'Post')
+    Comment = apps.get_model('api_post', 'Comment')
+    counts = Comment.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post').annotate(
+        count=Count('id')
+    ).values('count')
+    Post.objects.filter(pk__in=Comment.objects.values('post')).update(
+        comments_count=Coalesce(Subquery(counts,
+                                         output_field=IntegerField()), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0004_vote_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Количество комментариев к записи.', verbose_name='Комментарии'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['comments_count', 'pub_date'], name='post_comments_count_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0005_post_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['rating', 'pub_date'], name='post_rating_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:14
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """The old key had no content_type and was never created in the db."""
+    LikeDislike = apps.get_model('api_post', 'LikeDislike')
+    duplicates = LikeDislike.objects.order_by().values(
+        'content_type', 'object_id', 'user'
+    ).annotate(
+        last_id=Max('id'), count=Count('id')
+    ).filter(count__gt=1)
+    for row in duplicates:
+        LikeDislike.objects.filter(
+            content_type=row['content_type'],
+            object_id=row['object_id'],
+            user=row['user'],
+        ).exclude(id=row['last_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api_post', '0006_post_rating_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes,
+                             migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='likedislike',
+            unique_together={('content_type', 'object_id', 'user')},
+        ),
+        migrations.AddIndex(
+            model_name='likedislike',
+            index=models.Index(fields=['content_type', 'object_id', 'vote'], name='likedislike_object_vote_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:23
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Copy the latest posts of followed authors, mark celebrities."""
+    Follow = apps.get_model('api_post', 'Follow')
+    FeedEntry = apps.get_model('api_post', 'FeedEntry')
+    Post = apps.get_model('api_post', 'Post')
+    celebrities = Follow.objects.order_by().values('author').annotate(
+        followers=Count('id')
+    ).filter(followers__gt=settings.FEED_FANOUT_LIMIT).values('author')
+    Follow.objects.filter(author__in=celebrities).update(fanout=False)
+    for follow in Follow.objects.filter(fanout=True).iterator():
+        posts = Post.objects.filter(author=follow.author_id).order_by(
+            '-pub_date'
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL]
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=follow.user_id, post_id=post,
+                      author_id=follow.author_id, pub_date=pub_date)
+            for post, pub_date in posts
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api_post', '0007_likedislike_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='fanout',
+            field=models.BooleanField(default=True, editable=False, help_text='Записи автора копируются в ленту подписчика. Записи авторов с большим числом подписчиков читаются при запросе ленты.', verbose_name='Рассылка в ленту'),
+        ),
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(help_text='Копия даты публикации записи для сортировки ленты.', verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(help_text='Автор записи, для удаления при отписке.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(help_text='Запись в ленте.', on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='api_post.Post', verbose_name='Запись')),
+                ('user', models.ForeignKey(help_text='Владелец ленты.', on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Лента подписок',
+                'ordering': ('-pub_date', '-post'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'pub_date', 'post'], name='feedentry_user_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
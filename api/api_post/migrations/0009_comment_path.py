@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:32
+
+from django.db import migrations, models
+
+PATH_SEGMENT = 10
+
+
+def fill_paths(apps, schema_editor):
+    """Build paths and replies counts from the MPTT fields."""
+    Comment = apps.get_model('api_post', 'Comment')
+    paths, batch = {}, []
+    comments = Comment.objects.order_by('tree_id', 'lft').only(
+        'parent_id', 'lft', 'rght'
+    )
+    for comment in comments.iterator():
+        comment.path = '{}{:0{}d}'.format(
+            paths.get(comment.parent_id, ''), comment.pk, PATH_SEGMENT
+        )
+        comment.replies_count = (comment.rght - comment.lft - 1) // 2
+        if comment.rght - comment.lft > 1:
+            paths[comment.pk] = comment.path
+        batch.append(comment)
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ['path', 'replies_count'])
+            batch = []
+    Comment.objects.bulk_update(batch, ['path', 'replies_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0008_feed_entries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Номера комментариев от корня треда до этого, по PATH_SEGMENT цифр.', max_length=50, verbose_name='Путь'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Ответы на всех уровнях под комментарием.', verbose_name='Количество ответов'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,92 @@
+import html
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations
+from django.utils.html import strip_tags
+
+TABLE = 'api_post_post_search'
+BATCH_SIZE = 1000
+
+POSTGRESQL_CREATE_SQL = (
+    f'''
+    CREATE TABLE {TABLE} (
+        post_id integer PRIMARY KEY
+            REFERENCES api_post_post (id) ON DELETE CASCADE
+            DEFERRABLE INITIALLY DEFERRED,
+        document text NOT NULL,
+        author varchar(150) NOT NULL,
+        vector tsvector NOT NULL
+    )
+    ''',
+    f'CREATE INDEX {TABLE}_vector_idx ON {TABLE} USING GIN (vector)',
+)
+POSTGRESQL_INSERT_SQL = f'''
+    INSERT INTO {TABLE} (post_id, document, author, vector)
+    VALUES (%s, %s, %s,
+            setweight(to_tsvector(%s::regconfig, %s), 'A') ||
+            setweight(to_tsvector('simple', %s), 'B'))
+'''
+
+SQLITE_CREATE_SQL = (
+    f'''
+    CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        document, author, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    ''',
+)
+SQLITE_INSERT_SQL = (
+    f'INSERT INTO {TABLE} (rowid, document, author) VALUES (%s, %s, %s)'
+)
+
+DROP_SQL = f'DROP TABLE IF EXISTS {TABLE}'
+
+SQL = {
+    'postgresql': (POSTGRESQL_CREATE_SQL, POSTGRESQL_INSERT_SQL),
+    'sqlite': (SQLITE_CREATE_SQL, SQLITE_INSERT_SQL),
+}
+
+
+def document(text):
+    return ' '.join(html.unescape(strip_tags(text)).split())
+
+
+def create_search_index(apps, schema_editor):
+    """Create the search table of the database and fill it."""
+    vendor = schema_editor.connection.vendor
+    if vendor not in SQL:
+        return
+    create_sql, insert_sql = SQL[vendor]
+    Post = apps.get_model('api_post', 'Post')
+    rows = Post.objects.values_list(
+        'pk', 'text', 'author__username'
+    ).iterator()
+    with schema_editor.connection.cursor() as cursor:
+        for sql in create_sql:
+            cursor.execute(sql)
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                break
+            params = [(pk, document(text), author)
+                      for pk, text, author in batch]
+            if vendor == 'postgresql':
+                params = [(pk, text, author, settings.SEARCH_CONFIG,
+                           text, author) for pk, text, author in params]
+            cursor.executemany(insert_sql, params)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in SQL:
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0009_comment_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:05
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def mark_backfills(apps, schema_editor):
+    """Date of the oldest copied post of timelines missing older ones."""
+    Follow = apps.get_model('api_post', 'Follow')
+    FeedEntry = apps.get_model('api_post', 'FeedEntry')
+    Post = apps.get_model('api_post', 'Post')
+    for follow in Follow.objects.filter(fanout=True).iterator():
+        oldest = FeedEntry.objects.filter(
+            user=follow.user_id, author=follow.author_id
+        ).aggregate(oldest=Min('pub_date'))['oldest']
+        if oldest is not None and Post.objects.filter(
+                author=follow.author_id, pub_date__lt=oldest).exists():
+            Follow.objects.filter(pk=follow.pk).update(
+                backfilled_until=oldest
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_post', '0010_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='backfilled_until',
+            field=models.DateTimeField(editable=False, help_text='Более ранние записи автора не скопированы в ленту подписчика и читаются при запросе ленты.', null=True, verbose_name='Лента заполнена до'),
+        ),
+        migrations.RunPython(mark_backfills, migrations.RunPython.noop),
+    ]
@@ -1,37 +1,219 @@
-from django.contrib.contenttypes.models import ContentType
+import json
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.http import Http404, HttpResponse
+from rest_framework import serializers
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework import status
 
+from api.api_post.cache import (cached_value, get_generations, get_version,
+                                invalidate_votes, list_namespace,
+                                object_namespace, response_namespace)
+from api.api_post.instrumentation import timer
 from api.api_post.models import LikeDislike
+from api.api_post.vote_buffer import get_vote_buffer, pending_votes
+from api.api_post.votes import toggle_vote
+
+
+def get_eager_loading(model, serializer_class):
+    """Relations serializer_class reads: (select_related, prefetch_related).
+
+    Nested serializers and slug-like related fields need the related row,
+    to-many fields need a prefetch. Primary key fields read the local
+    column, so they are skipped.
+    """
+    select_related, prefetch_related = [], []
+    for field in serializer_class().fields.values():
+        if field.write_only or isinstance(
+                field, serializers.PrimaryKeyRelatedField):
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        if model_field.many_to_many or model_field.one_to_many:
+            if not isinstance(field, serializers.ManyRelatedField) or not (
+                    isinstance(field.child_relation,
+                               serializers.PrimaryKeyRelatedField)):
+                prefetch_related.append(field.source)
+        elif isinstance(field, (serializers.BaseSerializer,
+                                serializers.RelatedField)):
+            select_related.append(field.source)
+    return tuple(select_related), tuple(prefetch_related)
+
+
+class EagerLoadingMixin:
+    """Eager-load whatever the view's serializer is going to read."""
+    _eager_loading = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        key = (queryset.model, serializer_class)
+        if key not in self._eager_loading:
+            self._eager_loading[key] = get_eager_loading(*key)
+        select_related, prefetch_related = self._eager_loading[key]
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
+class CachedResponseMixin:
+    """Cache the rendered JSON of list responses.
+
+    The key is the path and the sorted query string, the version the
+    generations of cache_models and of the ordering's list namespaces,
+    bumped by their writes. The page keeps the versions of the objects
+    it shows and is rendered again once one of them changes. Pages go
+    through cached_value(): a new version or a page close to expiry is
+    rendered by a single worker while the others serve the last page.
+
+    The cached page is the one an anonymous viewer gets; with
+    cache_authenticated signed in viewers share it too, their votes on
+    overlay_model objects are set on a copy of the page with one query.
+    """
+    cache_models = ()
+    cache_authenticated = False
+    overlay_model = None
+    shared_page = False
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        overlay = (self.overlay_model is not None and
+                   request.user.is_authenticated)
+        computed = []
+
+        def compute():
+            self.shared_page = True
+            response = super(CachedResponseMixin, self).list(
+                request, *args, **kwargs
+            )
+            computed.append(response)
+            object_ids = [item['id'] for item in
+                          self.get_page_items(response.data)]
+            return (*self.render_shared_page(request, response.data),
+                    object_ids, self.get_object_versions(object_ids))
+
+        key, version = key
+        content, content_type, *_ = cached_value(
+            key, compute, settings.RESPONSE_CACHE_TIMEOUT, version,
+            fresh=self.page_is_fresh
+        )
+        if computed and not overlay:
+            return computed[0]
+        if not overlay:
+            return HttpResponse(content, content_type=content_type)
+        data = json.loads(content)
+        self.overlay_votes(request.user, self.get_page_items(data))
+        return Response(data)
+
+    def get_response_cache_key(self, request):
+        """(key, version) of the page, None if it isn't cached."""
+        if (self.action != 'list' or not settings.RESPONSE_CACHE_TIMEOUT or
+                request.accepted_renderer.format != 'json' or
+                request.user.is_authenticated and
+                not self.cache_authenticated):
+            return None
+        query = urlencode(sorted(request.query_params.lists()), doseq=True)
+        key = 'response:{}'.format(
+            md5(f'{request.path}?{query}'.encode()).hexdigest()
+        )
+        namespaces = [response_namespace(model) for model in self.cache_models]
+        if self.overlay_model is not None:
+            # a vote moves its object in the lists ordered by rating
+            ordering = request.query_params.get(api_settings.ORDERING_PARAM)
+            namespaces.extend(
+                list_namespace(self.overlay_model, order.strip().lstrip('-'))
+                for order in (ordering or '').split(',') if order.strip()
+            )
+        return key, get_version(namespaces)
+
+    def get_object_versions(self, object_ids):
+        """Generations of the overlay_model objects shown on a page."""
+        if self.overlay_model is None:
+            return []
+        return get_generations([object_namespace(self.overlay_model, pk)
+                                for pk in object_ids])
+
+    def page_is_fresh(self, page):
+        """Whether no object of a cached page was voted on since."""
+        _, _, object_ids, versions = page
+        return self.get_object_versions(object_ids) == versions
+
+    def get_serializer_context(self):
+        # serializers leave the viewer's votes out of a shared page
+        return {**super().get_serializer_context(),
+                'shared_page': self.shared_page}
+
+    def render_shared_page(self, request, data):
+        """(content, content type) of data as the response would have."""
+        renderer = request.accepted_renderer
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        with timer('render'):
+            content = renderer.render(data, request.accepted_media_type,
+                                      self.get_renderer_context())
+        return content, content_type
+
+    @staticmethod
+    def get_page_items(data):
+        return data['response'] if isinstance(data, dict) else data
+
+    def overlay_votes(self, user, items):
+        object_ids = [item['id'] for item in items]
+        votes = LikeDislike.objects.user_votes(self.overlay_model,
+                                               object_ids, user)
+        votes.update(pending_votes(self.overlay_model, object_ids, user))
+        for item in items:
+            vote = votes.get(item['id'])
+            item['liked'] = vote == LikeDislike.LIKE
+            item['disliked'] = vote == LikeDislike.DISLIKE
 
 
 class LikeDislikeMixins:
-    def _make_vote(self, user, obj, vote):
-        """GenericForeignKey does not support get_or_create"""
+    vote_model = None
+
+    def get_vote_filters(self):
+        """Extra lookups the voted object must match, e.g. its post."""
+        return {}
+
+    def _make_vote(self, user, vote):
+        """Toggle the vote without loading the voted object."""
+        model = self.vote_model
+        toggle = (get_vote_buffer().toggle if settings.VOTES_WRITE_BEHIND
+                  else toggle_vote)
         try:
-            likedislike = LikeDislike.objects.get(
-                content_type=ContentType.objects.get_for_model(obj),
-                object_id=self.kwargs['pk'],
-                user=user.pk
+            object_id = model._meta.pk.to_python(self.kwargs['pk'])
+            old_vote, vote, likes_count, dislikes_count = toggle(
+                model,
+                object_id,
+                user,
+                vote,
+                **self.get_vote_filters()
             )
-            if vote == likedislike.vote:
-                likedislike.delete()
-                vote = None
-            else:
-                likedislike.vote = vote
-                likedislike.save(update_fields=['vote'])
-            response_status = status.HTTP_200_OK
-        except LikeDislike.DoesNotExist:
-            obj.votes.create(user=user, vote=vote)
-            response_status = status.HTTP_201_CREATED
+        except (model.DoesNotExist, ValidationError):
+            raise Http404
+        invalidate_votes(model, object_id)
         return Response({
             'liked': vote == LikeDislike.LIKE,
             'disliked': vote == LikeDislike.DISLIKE,
-            'likes_count': obj.votes.likes().count(),
-            'dislikes_count': obj.votes.dislikes().count(),
-        }, status=response_status)
+            'likes_count': likes_count,
+            'dislikes_count': dislikes_count,
+        }, status=(status.HTTP_201_CREATED if old_vote is None and vote
+                   else status.HTTP_200_OK))
 
     @action(
         detail=True,
@@ -39,9 +221,7 @@ class LikeDislikeMixins:
         permission_classes=(IsAuthenticated,),
     )
     def like(self, request, *args, **kwargs):
-        return self._make_vote(request.user,
-                               self.get_queryset().get(pk=self.kwargs['pk']),
-                               LikeDislike.LIKE)
+        return self._make_vote(request.user, LikeDislike.LIKE)
 
     @action(
         detail=True,
@@ -49,6 +229,4 @@ class LikeDislikeMixins:
         permission_classes=(IsAuthenticated,),
     )
     def dislike(self, request, *args, **kwargs):
-        return self._make_vote(request.user,
-                               self.get_queryset().get(pk=self.kwargs['pk']),
-                               LikeDislike.DISLIKE)
+        return self._make_vote(request.user, LikeDislike.DISLIKE)
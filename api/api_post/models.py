@@ -1,9 +1,10 @@
 import os
 
 from ckeditor.fields import RichTextField
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import Exists, OuterRef, Sum
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Sum, Value
 from mptt.models import MPTTModel, TreeForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
@@ -13,25 +14,20 @@ User = get_user_model()
 
 class ModelQuerySet(models.QuerySet):
     def annotate_like_dislike(self, user):
-        return self.annotate(
-            liked=Exists(
-                LikeDislike.objects.filter(
-                    user=user.id,
-                    # content_type=ContentType.objects.get_for_model(self.model),
-                    content_type__model=self.model.__name__.lower(),
-                    object_id=OuterRef('id'),
-                    vote=LikeDislike.LIKE
-                ).only('id')
+        if not user.is_authenticated:
+            return self.annotate(
+                liked=Value(False, output_field=models.BooleanField()),
+                disliked=Value(False, output_field=models.BooleanField()),
             )
+        votes = LikeDislike.objects.filter(
+            user=user.id,
+            content_type=ContentType.objects.get_for_model(self.model),
+            object_id=OuterRef('id'),
+        ).only('id')
+        return self.annotate(
+            liked=Exists(votes.filter(vote=LikeDislike.LIKE))
         ).annotate(
-            disliked=Exists(
-                LikeDislike.objects.filter(
-                    user=user.id,
-                    content_type__model=self.model.__name__.lower(),
-                    object_id=OuterRef('id'),
-                    vote=LikeDislike.DISLIKE
-                ).only('id')
-            )
+            disliked=Exists(votes.filter(vote=LikeDislike.DISLIKE))
         )
 
 
@@ -49,6 +45,25 @@ class LikeDislikeManager(models.Manager):
             Sum('vote')
         ).get('vote__sum') or 0
 
+    def user_votes(self, model, object_ids, user):
+        """{object_id: vote} of user on objects of model, a single query."""
+        if not object_ids or user is None or not user.is_authenticated:
+            return {}
+        return dict(self.get_queryset().filter(
+            content_type=ContentType.objects.get_for_model(model),
+            object_id__in=object_ids,
+            user=user.pk,
+        ).values_list('object_id', 'vote'))
+
+    def attach_votes(self, objects, user):
+        """Set liked/disliked of user on objects with a single query."""
+        votes = self.user_votes(type(objects[0]) if objects else None,
+                                [obj.pk for obj in objects], user)
+        for obj in objects:
+            vote = votes.get(obj.pk)
+            obj.liked = vote == LikeDislike.LIKE
+            obj.disliked = vote == LikeDislike.DISLIKE
+
 
 class LikeDislike(models.Model):
     LIKE = 1
@@ -69,7 +84,36 @@ class LikeDislike(models.Model):
     objects = LikeDislikeManager()
 
     class Meta:
-        unique_together = ('user', 'object_id')
+        unique_together = ('content_type', 'object_id', 'user')
+        indexes = (
+            models.Index(fields=('content_type', 'object_id', 'vote'),
+                         name='likedislike_object_vote_idx'),
+        )
+
+
+class VotableModel(models.Model):
+    """Stores vote counters so lists don't have to count votes per row."""
+    likes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Лайки',
+        help_text='Количество лайков.'
+    )
+    dislikes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Дизлайки',
+        help_text='Количество дизлайков.'
+    )
+    rating = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг',
+        help_text='Разница лайков и дизлайков.'
+    )
+
+    class Meta:
+        abstract = True
 
 
 class Group(models.Model):
@@ -98,7 +142,7 @@ class Group(models.Model):
         verbose_name_plural = 'Сообщества'
 
 
-class Post(models.Model):
+class Post(VotableModel):
     text = RichTextField(
         verbose_name='Текст',
         help_text='Введите текст новой записи.'
@@ -142,6 +186,12 @@ class Post(models.Model):
         verbose_name='Теги',
         help_text='Теги, подходящие к записи.'
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Комментарии',
+        help_text='Количество комментариев к записи.'
+    )
     votes = GenericRelation(LikeDislike, related_query_name='posts')
 
     objects = ModelQuerySet.as_manager()
@@ -149,6 +199,12 @@ class Post(models.Model):
     class Meta:
         get_latest_by = 'pub_date'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('comments_count', 'pub_date'),
+                         name='post_comments_count_idx'),
+            models.Index(fields=('rating', 'pub_date'),
+                         name='post_rating_idx'),
+        )
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -167,7 +223,7 @@ class Post(models.Model):
         super().save(*args, **kwargs)
 
 
-class Comment(MPTTModel):
+class Comment(MPTTModel, VotableModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -198,13 +254,96 @@ class Comment(MPTTModel):
         blank=True,
         related_name='children'
     )
+    path = models.CharField(
+        max_length=50,
+        db_index=True,
+        default='',
+        editable=False,
+        verbose_name='Путь',
+        help_text='Номера комментариев от корня треда до этого, '
+                  'по PATH_SEGMENT цифр.'
+    )
+    replies_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество ответов',
+        help_text='Ответы на всех уровнях под комментарием.'
+    )
     votes = GenericRelation(LikeDislike, related_query_name='comments')
 
     objects = ModelQuerySet.as_manager()
 
+    # replies to deeper comments go to their parent
+    MAX_LEVEL = 3
+    PATH_SEGMENT = 10
+
     def __str__(self):
         return self.text[:15]
 
+    @staticmethod
+    def path_storage():
+        """Whether threads are kept by path only, without lft/rght."""
+        return settings.COMMENTS_TREE_STORAGE == 'path'
+
+    def ancestor_ids(self):
+        size = self.PATH_SEGMENT
+        return [int(self.path[start:start + size])
+                for start in range(0, len(self.path) - size, size)]
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        with transaction.atomic():
+            if created and self.path_storage():
+                # level and thread come from the parent, no tree shifts
+                parent = self.parent
+                self.level = parent.level + 1 if parent else 0
+                self.tree_id = parent.tree_id if parent else 0
+                self.lft = self.rght = 0
+                with type(self)._tree_manager.disable_mptt_updates():
+                    super().save(*args, **kwargs)
+            else:
+                super().save(*args, **kwargs)
+            if created:
+                self.add_to_thread()
+                Post.objects.filter(pk=self.post_id).update(
+                    comments_count=F('comments_count') + 1
+                )
+
+    def add_to_thread(self):
+        """Set the path and count the reply in every ancestor."""
+        parent = self.parent
+        self.path = '{}{:0{}d}'.format(parent.path if parent else '',
+                                       self.pk, self.PATH_SEGMENT)
+        fields = {'path': self.path}
+        if parent is None and self.path_storage():
+            self.tree_id = fields['tree_id'] = self.pk
+        Comment.objects.filter(pk=self.pk).update(**fields)
+        Comment.objects.filter(pk__in=self.ancestor_ids()).update(
+            replies_count=F('replies_count') + 1
+        )
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            if self.path_storage():
+                _, deleted = Comment.objects.filter(
+                    path__startswith=self.path
+                ).delete()
+                removed = deleted.get(Comment._meta.label, 0)
+            else:
+                super().delete(*args, **kwargs)
+                # mptt refreshes lft/rght before deleting the whole subtree
+                removed = (self.rght - self.lft + 1) // 2
+            self.uncount(removed)
+
+    def uncount(self, removed):
+        """Take the removed comments of this subtree off the counters."""
+        Comment.objects.filter(pk__in=self.ancestor_ids()).update(
+            replies_count=F('replies_count') - removed
+        )
+        Post.objects.filter(pk=self.post_id).update(
+            comments_count=F('comments_count') - removed
+        )
+
     class MPTTMeta:
         order_insertion_by = ['created']
         get_latest_by = 'created'
@@ -228,6 +367,21 @@ class Follow(models.Model):
         verbose_name='Автор',
         help_text='Пользователь, на которого подписываются.'
     )
+    fanout = models.BooleanField(
+        default=True,
+        editable=False,
+        verbose_name='Рассылка в ленту',
+        help_text='Записи автора копируются в ленту подписчика. '
+                  'Записи авторов с большим числом подписчиков '
+                  'читаются при запросе ленты.'
+    )
+    backfilled_until = models.DateTimeField(
+        null=True,
+        editable=False,
+        verbose_name='Лента заполнена до',
+        help_text='Более ранние записи автора не скопированы в ленту '
+                  'подписчика и читаются при запросе ленты.'
+    )
 
     class Meta:
         ordering = ('user',)
@@ -236,6 +390,44 @@ class Follow(models.Model):
         verbose_name_plural = 'Подписки'
 
 
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+        help_text='Владелец ленты.'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Запись',
+        help_text='Запись в ленте.'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        help_text='Автор записи, для удаления при отписке.'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        help_text='Копия даты публикации записи для сортировки ленты.'
+    )
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        unique_together = ('user', 'post')
+        indexes = (
+            models.Index(fields=('user', 'pub_date', 'post'),
+                         name='feedentry_user_date_idx'),
+        )
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+
+
 class Tag(models.Model):
     title = models.CharField(
         max_length=50,
@@ -1,4 +1,3 @@
-from django.db.models import Count, Q
 from rest_framework.filters import OrderingFilter
 
 
@@ -18,17 +17,12 @@ class PostCustomOrdering(OrderingFilter):
         return self.get_default_ordering(view)
 
     def filter_queryset(self, request, queryset, view):
-
         ordering = self.get_ordering(request, queryset, view)
-        print(ordering)
         if not ordering:
             return queryset
-        for order in ordering:
-            if 'comments_count' in order:
-                queryset = queryset.annotate(comments_count=Count('comments'))
-            if 'rating' in order:
-                queryset = queryset.annotate(
-                    rating=(Count('votes', filter=Q(votes__vote__gt=0)) -
-                            Count('votes', filter=Q(votes__vote__lt=0)))
-                )
+        if not any(order.lstrip('-') == 'pub_date' for order in ordering):
+            # equal counters are ordered by date in the same direction,
+            # so the (counter, pub_date) indexes serve the whole ordering
+            direction = '-' if ordering[-1].startswith('-') else ''
+            ordering = [*ordering, f'{direction}pub_date']
         return queryset.order_by(*ordering)
@@ -1,11 +1,80 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from hashlib import md5
 from math import ceil
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .cache import count_namespace, get_generation
+
+
+def cached_count(queryset):
+    """Count a stripped queryset and cache the result for a short time.
+
+    Annotations and ordering don't change the count, so they are dropped.
+    The cache key is the count SQL, so every filter and search has its
+    own entry, and the model generation bumped on create/delete.
+    """
+    queryset = queryset.order_by().values('pk')
+    estimate = estimate_count(queryset)
+    if estimate is not None:
+        return estimate
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'entries_count:{}:{}'.format(
+        get_generation(count_namespace(queryset.model)),
+        md5(f'{sql}{params}'.encode()).hexdigest(),
+    )
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.ENTRIES_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def estimate_count(queryset):
+    """pg_class.reltuples of the table for an unfiltered queryset."""
+    connection = connections[queryset.db]
+    if (not settings.ENTRIES_COUNT_ESTIMATE or
+            connection.vendor != 'postgresql' or queryset.query.where):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row and row[0] >= settings.ENTRIES_COUNT_ESTIMATE_MIN:
+        return int(row[0])
+    return None
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator with cached_count() of querysets."""
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return cached_count(self.object_list)
+        return super().count
 
 
 class CustomPagination(pagination.PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
+
     def get_paginated_response(self, data):
         return Response({
             'links': {
@@ -18,3 +87,137 @@ class CustomPagination(pagination.PageNumberPagination):
             ),
             'response': data,
         })
+
+
+class KeysetPagination(pagination.BasePagination):
+    """Seek by the ordering values of the page edge instead of OFFSET.
+
+    The key is the queryset ordering plus pk as a tie-breaker, e.g.
+    (pub_date, id) or (rating, pub_date, id). No COUNT is run, so the
+    response has only opaque next/previous cursors.
+    """
+    page_size = settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    mode = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    @classmethod
+    def is_requested(cls, request):
+        return (request.query_params.get(cls.mode_query_param) == cls.mode or
+                cls.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        self.ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.flip(order) for order in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek(ordering, values))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = has_more if not reverse else values is not None
+        self.has_previous = values is not None if not reverse else has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'links': {
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link()
+            },
+            'response': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_link(self, obj, reverse):
+        values = [
+            self.model._meta.get_field(order.lstrip('-')).value_to_string(obj)
+            for order in self.ordering
+        ]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(values, reverse),
+        )
+
+    def get_ordering(self, queryset):
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            order.replace('pk', pk_name) if order.lstrip('-') == 'pk' else order
+            for order in (queryset.query.order_by or
+                          queryset.model._meta.ordering)
+            if isinstance(order, str)
+        ]
+        if not any(order.lstrip('-') == pk_name for order in ordering):
+            direction = '-' if ordering and ordering[-1][0] == '-' else ''
+            ordering.append(f'{direction}{pk_name}')
+        return ordering
+
+    @staticmethod
+    def flip(order):
+        return order[1:] if order.startswith('-') else f'-{order}'
+
+    @staticmethod
+    def seek(ordering, values):
+        """Rows strictly after values in the lexicographic ordering."""
+        condition = Q()
+        equal = {}
+        for order, value in zip(ordering, values):
+            field = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps({'v': values, 'r': int(reverse)})
+        return urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            values = [
+                self.model._meta.get_field(order.lstrip('-')).to_python(value)
+                for order, value in zip(self.ordering, data['v'])
+            ]
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return values, bool(data['r'])
+        except (BinasciiError, KeyError, TypeError, ValueError,
+                ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class KeysetPaginationMixin:
+    """Switch the view to KeysetPagination when the request opts in."""
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if (not hasattr(self, '_paginator') and
+                self.keyset_pagination_class.is_requested(self.request)):
+            self._paginator = self.keyset_pagination_class()
+        return super().paginator
@@ -0,0 +1,321 @@
+"""Full-text search over post text without markup.
+
+Every post has a row in the post_search table with its text stripped of
+HTML and its author's username. On PostgreSQL the row keeps a weighted
+tsvector under a GIN index and results are ranked by ts_rank_cd, on
+SQLite the table is an FTS5 index ranked by bm25. Other databases fall
+back to icontains over the raw text. Rows are written by the Post and
+User signals, the rebuild_search_index command refills the table.
+
+SEARCH_BACKEND = 'index' ranks by the in-process SearchIndex of
+search_index.py instead, which also indexes tags.
+"""
+import html
+from collections import defaultdict
+from copy import copy
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, Q, Value
+from django.utils.html import escape, strip_tags
+
+from .search_index import get_search_index, make_snippet
+from .stemmer import WORD
+
+TABLE = 'api_post_post_search'
+# snippet bounds, replaced by <mark> after the snippet is escaped
+MARK_START = '\x02'
+MARK_STOP = '\x03'
+BATCH_SIZE = 1000
+
+
+def document(text):
+    """Plain text of RichText HTML."""
+    return ' '.join(html.unescape(strip_tags(text)).split())
+
+
+def highlight(snippet):
+    """Escape a snippet and turn the match bounds into <mark> tags."""
+    if snippet is None:
+        return None
+    return escape(snippet).replace(MARK_START, '<mark>').replace(
+        MARK_STOP, '</mark>'
+    )
+
+
+class PostgresSearch:
+    vector_sql = (
+        "setweight(to_tsvector(%s::regconfig, {document}), 'A') || "
+        "setweight(to_tsvector('simple', {author}), 'B')"
+    )
+    upsert_sql = f'''
+        INSERT INTO {TABLE} (post_id, document, author, vector)
+        VALUES (%s, %s, %s, {vector_sql.format(document='%s', author='%s')})
+        ON CONFLICT (post_id) DO UPDATE SET
+            document = EXCLUDED.document,
+            author = EXCLUDED.author,
+            vector = EXCLUDED.vector
+    '''
+    rename_sql = f'''
+        UPDATE {TABLE}
+        SET author = %s,
+            vector = {vector_sql.format(document='document', author='%s')}
+        WHERE post_id IN (SELECT id FROM api_post_post WHERE author_id = %s)
+            AND author <> %s
+    '''
+    query_sql = "plainto_tsquery(%s::regconfig, %s)"
+
+    def index(self, cursor, rows):
+        cursor.executemany(self.upsert_sql, [
+            (pk, text, author, settings.SEARCH_CONFIG, text, author)
+            for pk, text, author in rows
+        ])
+
+    def remove(self, cursor, post_ids):
+        # rows of deleted posts go with them by the foreign key
+        pass
+
+    def rename(self, cursor, user_id, username):
+        cursor.execute(self.rename_sql, [
+            username, settings.SEARCH_CONFIG, username, user_id, username,
+        ])
+
+    def search(self, queryset, terms):
+        query = self.query_sql
+        config = settings.SEARCH_CONFIG
+        options = (f'StartSel={MARK_START}, StopSel={MARK_STOP}, '
+                   'MaxWords=30, MinWords=10, MaxFragments=2')
+        return queryset.extra(
+            select={
+                'search_rank': f'ts_rank_cd({TABLE}.vector, {query})',
+                'search_snippet': (f'ts_headline(%s::regconfig, '
+                                   f'{TABLE}.document, {query}, %s)'),
+            },
+            select_params=(config, terms, config, config, terms, options),
+            tables=[TABLE],
+            where=[f'{TABLE}.post_id = api_post_post.id',
+                   f'{TABLE}.vector @@ {query}'],
+            params=[config, terms],
+        )
+
+
+class SQLiteSearch:
+    # bm25 is lower for better matches, text weighs more than the author
+    rank_sql = f'-bm25({TABLE}, 1.0, 0.5)'
+    snippet_sql = f"snippet({TABLE}, 0, %s, %s, '…', 24)"
+
+    def index(self, cursor, rows):
+        rows = list(rows)
+        self.remove(cursor, [pk for pk, _, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, document, author) '
+            f'VALUES (%s, %s, %s)',
+            rows,
+        )
+
+    def remove(self, cursor, post_ids):
+        cursor.executemany(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                           [(pk,) for pk in post_ids])
+
+    def rename(self, cursor, user_id, username):
+        cursor.execute(
+            f'UPDATE {TABLE} SET author = %s WHERE rowid IN ('
+            f'SELECT id FROM api_post_post WHERE author_id = %s'
+            f') AND author <> %s',
+            [username, user_id, username],
+        )
+
+    def search(self, queryset, terms):
+        """FTS5 match of queryset; bm25() and snippet() fail inside
+        subqueries, so count it with the annotations stripped, as
+        cached_count() does.
+        """
+        # every word as a prefix, FTS5 has no stemming of Russian
+        words = WORD.findall(terms.lower())
+        if not words:
+            return queryset.none()
+        match = ' '.join('"{}"*'.format(word) for word in words)
+        return queryset.extra(
+            select={'search_rank': self.rank_sql,
+                    'search_snippet': self.snippet_sql},
+            select_params=(MARK_START, MARK_STOP),
+            tables=[TABLE],
+            where=[f'{TABLE}.rowid = api_post_post.id',
+                   f'{TABLE} MATCH %s'],
+            params=[match],
+        )
+
+
+class IndexSearch:
+    """Ranks by the in-process SearchIndex, filters in the database.
+
+    Only the best SEARCH_INDEX_MAX_RESULTS matches are kept.
+    """
+
+    def search(self, queryset, terms, ranked):
+        hits = get_search_index().search(terms,
+                                         settings.SEARCH_INDEX_MAX_RESULTS)
+        queryset = queryset.annotate(
+            search_terms=Value(terms, output_field=CharField())
+        )
+        if not ranked:
+            return queryset.filter(pk__in=[pk for pk, _ in hits])
+        return RankedPosts(queryset, hits)
+
+
+class RankedPosts:
+    """Hits of the index that are in queryset, sliced by the Paginator.
+
+    One query keeps the hits queryset filters allow, a slice loads its
+    posts by id in the order of the ranks.
+    """
+
+    def __init__(self, queryset, hits):
+        allowed = set(queryset.filter(
+            pk__in=[pk for pk, _ in hits]
+        ).values_list('pk', flat=True))
+        self.queryset = queryset
+        self.hits = [(pk, score) for pk, score in hits if pk in allowed]
+
+    @property
+    def model(self):
+        return self.queryset.model
+
+    def select_related(self, *fields):
+        return self.clone(self.queryset.select_related(*fields))
+
+    def prefetch_related(self, *lookups):
+        return self.clone(self.queryset.prefetch_related(*lookups))
+
+    def clone(self, queryset):
+        ranked = copy(self)
+        ranked.queryset = queryset
+        return ranked
+
+    def count(self):
+        return len(self.hits)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        hits = self.hits[index]
+        posts = self.queryset.in_bulk([pk for pk, _ in hits])
+        page = []
+        for pk, score in hits:
+            if pk in posts:
+                posts[pk].search_rank = score
+                page.append(posts[pk])
+        return page
+
+
+BACKENDS = {'postgresql': PostgresSearch, 'sqlite': SQLiteSearch}
+
+
+def get_backend(db_connection=connection):
+    backend = BACKENDS.get(db_connection.vendor)
+    return backend() if backend else None
+
+
+def index_enabled():
+    return settings.SEARCH_BACKEND == 'index'
+
+
+def search_posts(queryset, terms, ranked=True):
+    """Posts of queryset matching terms, with search_snippet.
+
+    ranked orders them by relevance, newest first among equals, the
+    ordering of queryset is kept otherwise.
+    """
+    if index_enabled():
+        return IndexSearch().search(queryset, terms, ranked)
+    backend = get_backend()
+    if backend is None:
+        return queryset.filter(Q(text__icontains=terms) |
+                               Q(author__username__icontains=terms))
+    queryset = backend.search(queryset, terms)
+    if ranked and not queryset.query.is_empty():
+        queryset = queryset.order_by('-search_rank', '-pub_date')
+    return queryset
+
+
+def post_snippet(post):
+    """Highlighted snippet of a found post, None outside of a search."""
+    if hasattr(post, 'search_terms'):
+        return highlight(make_snippet(document(post.text), post.search_terms,
+                                      MARK_START, MARK_STOP))
+    return highlight(getattr(post, 'search_snippet', None))
+
+
+def index_posts(posts):
+    """Write the search rows of posts, a queryset of Post."""
+    backend = get_backend()
+    if backend is not None:
+        index_rows(backend, connection, posts)
+    if index_enabled():
+        index_documents(posts)
+
+
+def index_rows(backend, db_connection, posts):
+    rows = posts.values_list('pk', 'text', 'author__username')
+    with db_connection.cursor() as cursor:
+        batch = []
+        for pk, text, author in rows.iterator():
+            batch.append((pk, document(text), author))
+            if len(batch) == BATCH_SIZE:
+                backend.index(cursor, batch)
+                batch = []
+        if batch:
+            backend.index(cursor, batch)
+
+
+def index_documents(posts):
+    """Add text, author and tags of posts to the SearchIndex."""
+    index = get_search_index()
+    tags = posts.model.tags.through.objects
+    rows = posts.values_list('pk', 'text', 'author__username').iterator()
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        titles = defaultdict(list)
+        for pk, title in tags.filter(
+                post__in=[pk for pk, _, _ in batch]
+        ).values_list('post', 'tag__title'):
+            titles[pk].append(title)
+        for pk, text, author in batch:
+            index.add(pk, ' '.join((document(text), author, *titles[pk])))
+    # other processes see the change once it's in a segment
+    transaction.on_commit(index.schedule_flush)
+
+
+def reindex_tagged(post_ids):
+    """Tags are in the SearchIndex only, the database rows keep them out."""
+    if index_enabled():
+        from .models import Post
+
+        index_documents(Post.objects.filter(pk__in=post_ids))
+
+
+def remove_posts(post_ids):
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, post_ids)
+    if index_enabled():
+        index = get_search_index()
+        for pk in post_ids:
+            index.remove(pk)
+        transaction.on_commit(index.schedule_flush)
+
+
+def rename_author(user):
+    """Update the author of the user's search rows if the name changed."""
+    backend = get_backend()
+    if backend is not None:
+        with connection.cursor() as cursor:
+            backend.rename(cursor, user.pk, user.username)
+    if index_enabled():
+        index_documents(user.posts.all())
+
@@ -0,0 +1,596 @@
+"""In-process inverted index of posts with BM25 ranking.
+
+For databases without full-text search (SEARCH_BACKEND = 'index'). New
+and changed documents go to an in-memory buffer, SEARCH_INDEX_FLUSH_DOCS
+of them are written as an immutable segment file that is read through
+mmap: sorted doc ids and lengths, term offsets and postings of segment
+doc numbers and term frequencies, all uint32 arrays in native byte
+order. A manifest lists the segments and the tombstones: a doc written
+in generation g hides its versions in older segments. Writers take a
+file lock and reread the manifest, readers reload it when it changes,
+so processes share the flushed segments; a process sees its own buffer
+only. The manifest also keeps the number and total length of the live
+documents, updated by every flush. Changes made by the post signals are
+flushed SEARCH_INDEX_FLUSH_INTERVAL seconds after their transaction
+commits, together with the ones committed meanwhile. Over
+SEARCH_INDEX_MAX_SEGMENTS segments, the newest ones are merged.
+"""
+import atexit
+import fcntl
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import groupby, repeat
+from operator import itemgetter
+
+from django.conf import settings
+
+from .stemmer import stem, tokenize
+
+MAGIC = b'PSEG'
+HEADER = struct.Struct('<4sIQIII4x')
+VERSION = 1
+MANIFEST = 'manifest.json'
+LOCK = 'index.lock'
+K1 = 1.2
+B = 0.75
+SNIPPET_WORDS = 24
+
+logger = logging.getLogger(__name__)
+
+
+def analyze(text):
+    """Term frequencies and length of a document."""
+    terms = [stem(word) for word, _ in tokenize(text)]
+    return Counter(terms), len(terms)
+
+
+class Segment:
+    """Immutable postings of the documents flushed in one generation."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.generation, docs, terms,
+         postings) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a search segment')
+        view = memoryview(self.map)
+        offset = HEADER.size
+
+        def section(count):
+            nonlocal offset
+            start, offset = offset, offset + count * 4
+            return view[start:offset].cast('I')
+
+        self.doc_ids = section(docs)
+        self.doc_lengths = section(docs)
+        self.term_offsets = section(terms + 1)
+        self.postings = section(postings)
+        self.frequencies = section(postings)
+        self.terms = {
+            term: number for number, term in enumerate(
+                bytes(view[offset:]).decode().split('\n') if terms else ()
+            )
+        }
+
+    def postings_of(self, term):
+        """(doc numbers, frequencies) of term, empty if absent."""
+        number = self.terms.get(term)
+        if number is None:
+            return (), ()
+        start = self.term_offsets[number]
+        stop = self.term_offsets[number + 1]
+        return self.postings[start:stop], self.frequencies[start:stop]
+
+    def doc_number(self, doc_id):
+        number = bisect_left(self.doc_ids, doc_id)
+        if number < len(self.doc_ids) and self.doc_ids[number] == doc_id:
+            return number
+        return None
+
+    def sorted_terms(self):
+        return sorted(self.terms)
+
+    @staticmethod
+    def write(path, generation, docs, terms):
+        """Write a segment of docs [(id, length)] sorted by id and terms,
+        an iterable of (term, [(doc number, frequency)]) sorted by term.
+        """
+        doc_ids = array('I', (doc_id for doc_id, _ in docs))
+        doc_lengths = array('I', (length for _, length in docs))
+        offsets = array('I', [0])
+        postings, frequencies = array('I'), array('I')
+        names = []
+        for term, entries in terms:
+            names.append(term)
+            for number, frequency in entries:
+                postings.append(number)
+                frequencies.append(frequency)
+            offsets.append(len(postings))
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, generation, len(doc_ids),
+                                   len(names), len(postings)))
+            for section in (doc_ids, doc_lengths, offsets, postings,
+                            frequencies):
+                file.write(section.tobytes())
+            file.write('\n'.join(names).encode())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+        return Segment(path)
+
+
+class SearchIndex:
+    def __init__(self, directory, flush_docs=1000, max_segments=8,
+                 flush_interval=0):
+        self.directory = directory
+        self.flush_docs = flush_docs
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self.flush_timer = None
+        self.lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        # doc id -> (Counter of terms, length) not flushed yet
+        self.buffer = {}
+        self.buffer_postings = defaultdict(dict)
+        # docs changed or removed since the last flush
+        self.pending = set()
+        self.segments = []
+        self.deleted = {}
+        self.generation = 0
+        self.manifest_mtime = None
+        # live documents of the segments and their total length
+        self.segment_docs = 0
+        self.segment_length = 0
+        self.doc_count = 0
+        self.total_length = 0
+        self.load()
+
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST)
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path()) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'generation': 0, 'segments': [], 'deleted': {}}
+
+    def write_manifest(self):
+        tmp = f'{self.manifest_path()}.tmp'
+        with open(tmp, 'w') as file:
+            json.dump({
+                'generation': self.generation,
+                'segments': [segment.name for segment in self.segments],
+                'deleted': {str(doc): generation for doc, generation
+                            in self.deleted.items()},
+                'docs': self.segment_docs,
+                'length': self.segment_length,
+            }, file)
+        os.replace(tmp, self.manifest_path())
+        self.manifest_mtime = os.stat(self.manifest_path()).st_mtime_ns
+
+    def load(self):
+        """Open the segments of the manifest, keep the buffer."""
+        with self.lock:
+            manifest = self.read_manifest()
+            opened = {segment.name: segment for segment in self.segments}
+            self.segments = [
+                opened.get(name) or Segment(os.path.join(self.directory,
+                                                         name))
+                for name in manifest['segments']
+            ]
+            self.deleted = {int(doc): generation for doc, generation
+                            in manifest['deleted'].items()}
+            self.generation = manifest['generation']
+            if 'docs' in manifest:
+                self.segment_docs = manifest['docs']
+                self.segment_length = manifest['length']
+            else:
+                # written before the manifest kept the counts
+                self.count_segment_docs()
+            try:
+                self.manifest_mtime = os.stat(
+                    self.manifest_path()
+                ).st_mtime_ns
+            except FileNotFoundError:
+                self.manifest_mtime = None
+            self.count_docs()
+
+    def refresh(self):
+        """Reload the manifest if another process has changed it."""
+        try:
+            mtime = os.stat(self.manifest_path()).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self.manifest_mtime:
+            try:
+                self.load()
+            except FileNotFoundError:
+                # a merge removed a segment between the reads, reread
+                # under the lock of the writers
+                with self.file_lock():
+                    self.load()
+
+    def count_segment_docs(self):
+        """Count the live documents of every segment."""
+        count = length = 0
+        for segment in self.segments:
+            for doc_id, doc_length in zip(segment.doc_ids,
+                                          segment.doc_lengths):
+                if self.is_stored(doc_id, segment.generation):
+                    count += 1
+                    length += doc_length
+        self.segment_docs, self.segment_length = count, length
+
+    def count_docs(self):
+        """Number and total length of live documents for BM25."""
+        count, length = self.segment_docs, self.segment_length
+        for doc_id in self.pending:
+            stored = self.stored_length(doc_id)
+            if stored is not None:
+                count -= 1
+                length -= stored
+        for _, doc_length in self.buffer.values():
+            count += 1
+            length += doc_length
+        self.doc_count, self.total_length = count, length
+
+    def is_stored(self, doc_id, generation):
+        """Whether no tombstone hides the version of doc_id in generation."""
+        return generation >= self.deleted.get(doc_id, 0)
+
+    def is_live(self, doc_id, generation):
+        return doc_id not in self.pending and self.is_stored(doc_id,
+                                                             generation)
+
+    def stored_length(self, doc_id):
+        """Length of the live version of doc_id in the segments."""
+        for segment in reversed(self.segments):
+            if self.is_stored(doc_id, segment.generation):
+                number = segment.doc_number(doc_id)
+                if number is not None:
+                    return segment.doc_lengths[number]
+        return None
+
+    def live_length(self, doc_id):
+        """Length of the current version of doc_id, None if absent."""
+        if doc_id in self.buffer:
+            return self.buffer[doc_id][1]
+        if doc_id in self.pending:
+            return None
+        return self.stored_length(doc_id)
+
+    def add(self, doc_id, text):
+        """Index text as the new version of doc_id."""
+        frequencies, length = analyze(text)
+        with self.lock:
+            self.forget(doc_id)
+            self.buffer[doc_id] = (frequencies, length)
+            for term, frequency in frequencies.items():
+                self.buffer_postings[term][doc_id] = frequency
+            self.doc_count += 1
+            self.total_length += length
+            if len(self.buffer) >= self.flush_docs:
+                self.flush()
+
+    def remove(self, doc_id):
+        with self.lock:
+            self.forget(doc_id)
+
+    def forget(self, doc_id):
+        length = self.live_length(doc_id)
+        if length is None:
+            return
+        self.doc_count -= 1
+        self.total_length -= length
+        entry = self.buffer.pop(doc_id, None)
+        if entry is None:
+            # the live version is in a segment, hide it with a tombstone
+            self.pending.add(doc_id)
+            return
+        for term in entry[0]:
+            postings = self.buffer_postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.buffer_postings[term]
+
+    def clear(self):
+        """Drop every document, used before a full rebuild."""
+        with self.lock, self.file_lock():
+            self.load()
+            self.buffer.clear()
+            self.buffer_postings.clear()
+            self.pending.clear()
+            old, self.segments = self.segments, []
+            self.deleted = {}
+            self.segment_docs = self.segment_length = 0
+            self.generation += 1
+            self.write_manifest()
+            self.remove_files(old)
+            self.count_docs()
+
+    def flush(self):
+        """Write the buffer as a segment, merge segments if needed."""
+        with self.lock:
+            if self.buffer or self.pending:
+                with self.file_lock():
+                    self.write_buffer()
+
+    def schedule_flush(self):
+        """Flush in flush_interval seconds with whatever comes meanwhile."""
+        if not self.flush_interval:
+            self.flush()
+            return
+        with self.lock:
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.flush_interval,
+                                                   self.timed_flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def timed_flush(self):
+        with self.lock:
+            self.flush_timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Search index flush failed')
+
+    def write_buffer(self):
+        buffer, pending = self.buffer, self.pending
+        # another process may have flushed meanwhile
+        self.load()
+        generation = self.generation
+        # hide the stored versions, including ones another process wrote
+        for doc_id in pending | buffer.keys():
+            length = self.stored_length(doc_id)
+            if length is not None:
+                self.deleted[doc_id] = generation
+                self.segment_docs -= 1
+                self.segment_length -= length
+        if buffer:
+            docs = sorted((doc_id, length) for doc_id, (_, length)
+                          in buffer.items())
+            numbers = {doc_id: number
+                       for number, (doc_id, _) in enumerate(docs)}
+            terms = (
+                (term, sorted((numbers[doc_id], frequency)
+                              for doc_id, frequency
+                              in self.buffer_postings[term].items()))
+                for term in sorted(self.buffer_postings)
+            )
+            self.segments.append(Segment.write(
+                self.segment_path(generation), generation, docs, terms
+            ))
+            self.segment_docs += len(docs)
+            self.segment_length += sum(length for _, length in docs)
+        self.generation = generation + 1
+        self.buffer, self.pending = {}, set()
+        self.buffer_postings = defaultdict(dict)
+        if len(self.segments) > self.max_segments:
+            self.merge(self.merge_start())
+        else:
+            self.write_manifest()
+        self.count_docs()
+
+    def merge_start(self):
+        """Index of the first segment to merge.
+
+        The newest segments are merged until an older one is larger than
+        all of them, so sizes grow geometrically and a document is
+        rewritten a logarithmic number of times. All of them are merged
+        if there would still be too many.
+        """
+        start = len(self.segments) - 2
+        merged = sum(len(segment.doc_ids)
+                     for segment in self.segments[start:])
+        while start and len(self.segments[start - 1].doc_ids) <= merged:
+            start -= 1
+            merged += len(self.segments[start].doc_ids)
+        return start if start + 1 <= self.max_segments else 0
+
+    def merge(self, start=0):
+        """Rewrite the segments from start as one without dead postings."""
+        old = self.segments[start:]
+        generation = max(segment.generation for segment in old)
+        live = []
+        for index, segment in enumerate(old):
+            for number, doc_id in enumerate(segment.doc_ids):
+                if self.is_stored(doc_id, segment.generation):
+                    live.append((doc_id, segment.doc_lengths[number],
+                                 index, number))
+        live.sort()
+        docs = [(doc_id, length) for doc_id, length, _, _ in live]
+        numbers = [dict() for _ in old]
+        for merged, (_, _, index, number) in enumerate(live):
+            numbers[index][number] = merged
+
+        def terms():
+            names = heapq.merge(*(
+                zip(segment.sorted_terms(), repeat(index))
+                for index, segment in enumerate(old)
+            ))
+            for term, group in groupby(names, key=itemgetter(0)):
+                entries = []
+                for _, index in group:
+                    postings, frequencies = old[index].postings_of(term)
+                    mapping = numbers[index]
+                    entries.extend(
+                        (mapping[number], frequency)
+                        for number, frequency in zip(postings, frequencies)
+                        if number in mapping
+                    )
+                if entries:
+                    entries.sort()
+                    yield term, entries
+
+        path = self.segment_path(generation, merged=old[0].generation)
+        self.segments[start:] = [Segment.write(path, generation, docs,
+                                               terms())]
+        if not start:
+            # older segments keep the versions the tombstones hide
+            self.deleted = {doc_id: deleted for doc_id, deleted
+                            in self.deleted.items() if deleted > generation}
+        self.write_manifest()
+        self.remove_files(old)
+
+    def segment_path(self, generation, merged=None):
+        """Path of a segment, merged ones name their oldest generation."""
+        suffix = '' if merged is None else f'-merged-{merged:010d}'
+        return os.path.join(self.directory,
+                            f'{generation:010d}{suffix}.seg')
+
+    def remove_files(self, segments):
+        # open maps stay readable after unlink until they are collected
+        for segment in segments:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+
+    def file_lock(self):
+        return FileLock(os.path.join(self.directory, LOCK))
+
+    def search(self, query, limit):
+        """[(doc id, score)] of docs with every query term, best first."""
+        terms = {stem(word) for word, _ in tokenize(query)}
+        if not terms:
+            return []
+        with self.lock:
+            self.refresh()
+            if not self.doc_count:
+                return []
+            average = self.total_length / self.doc_count
+            sources = {term: self.term_sources(term) for term in terms}
+            # dead postings count until a merge, as in most engines
+            frequencies = {
+                term: sum(len(postings) for _, postings, _, _ in source)
+                for term, source in sources.items()
+            }
+            scores = None
+            for term in sorted(terms, key=frequencies.get):
+                if not frequencies[term]:
+                    return []
+                idf = math.log(1 + (self.doc_count - frequencies[term] + 0.5)
+                               / (frequencies[term] + 0.5))
+                matched = {}
+                for generation, postings, counts, lookup in sources[term]:
+                    for posting, frequency in zip(postings, counts):
+                        doc_id, length = lookup(posting)
+                        if scores is not None and doc_id not in scores:
+                            continue
+                        if generation is not None and not self.is_live(
+                                doc_id, generation):
+                            continue
+                        matched[doc_id] = (scores[doc_id] if scores else 0) + (
+                            idf * frequency * (K1 + 1) / (
+                                frequency + K1 * (1 - B + B * length / average)
+                            )
+                        )
+                scores = matched
+                if not scores:
+                    return []
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    def term_sources(self, term):
+        """(generation, postings, frequencies, posting -> (id, length))
+        of term in every segment and the buffer.
+        """
+        sources = []
+        for segment in self.segments:
+            postings, frequencies = segment.postings_of(term)
+            if postings:
+                sources.append((
+                    segment.generation, postings, frequencies,
+                    lambda number, segment=segment: (
+                        segment.doc_ids[number], segment.doc_lengths[number]
+                    ),
+                ))
+        buffered = self.buffer_postings.get(term)
+        if buffered:
+            sources.append((
+                None, list(buffered), list(buffered.values()),
+                lambda doc_id: (doc_id, self.buffer[doc_id][1]),
+            ))
+        return sources
+
+
+class FileLock:
+    """Exclusive flock of a file, held by one writing process."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def make_snippet(text, query, mark_start, mark_stop, words=SNIPPET_WORDS):
+    """The window of text with most query words, matches marked."""
+    terms = {stem(word) for word, _ in tokenize(query)}
+    tokens = list(tokenize(text))
+    if not tokens:
+        return ''
+    hits = [stem(word) in terms for word, _ in tokens]
+    best = max(range(max(1, len(tokens) - words + 1)),
+               key=lambda start: (sum(hits[start:start + words]), -start))
+    window = range(best, min(len(tokens), best + words))
+    parts, position = [], tokens[best][1][0]
+    for index in window:
+        start, end = tokens[index][1]
+        if hits[index]:
+            parts += [text[position:start], mark_start, text[start:end],
+                      mark_stop]
+            position = end
+    end = tokens[window[-1]][1][1]
+    parts.append(text[position:end])
+    prefix = '…' if best else ''
+    suffix = '…' if end < len(text.rstrip()) else ''
+    return f'{prefix}{"".join(parts)}{suffix}'
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index():
+    directory = settings.SEARCH_INDEX_DIR
+    index = _indexes.get(directory)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(directory)
+            if index is None:
+                index = _indexes[directory] = SearchIndex(
+                    directory,
+                    flush_docs=settings.SEARCH_INDEX_FLUSH_DOCS,
+                    max_segments=settings.SEARCH_INDEX_MAX_SEGMENTS,
+                    flush_interval=settings.SEARCH_INDEX_FLUSH_INTERVAL,
+                )
+    return index
+
+
+@atexit.register
+def flush_indexes():
+    """Write the buffers of the process before it exits."""
+    for directory, index in list(_indexes.items()):
+        if os.path.isdir(directory):
+            index.flush()
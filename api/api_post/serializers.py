@@ -1,6 +1,39 @@
+from django.db import models
 from rest_framework import serializers
 
+from .instrumentation import TimedSerializerMixin
 from .models import Comment, Follow, Group, Post, User, Tag, LikeDislike
+from .search import post_snippet
+from .vote_buffer import overlay_pending_votes
+
+
+def attach_votes(objects, context):
+    """Votes of the viewer, none on a page shared between viewers."""
+    user = None
+    if not context.get('shared_page'):
+        user = getattr(context.get('request'), 'user', None)
+    LikeDislike.objects.attach_votes(objects, user)
+    overlay_pending_votes(objects, user)
+
+
+class VoteStateListSerializer(TimedSerializerMixin,
+                              serializers.ListSerializer):
+    """Resolve the viewer's votes for the whole page with one query."""
+
+    def to_representation(self, data):
+        objects = list(data.all() if isinstance(data, models.Manager)
+                       else data)
+        attach_votes(objects, self.context)
+        return super().to_representation(objects)
+
+
+class VoteStateMixin(TimedSerializerMixin):
+    """liked/disliked for a single object outside of a list."""
+
+    def to_representation(self, instance):
+        if not hasattr(instance, 'liked'):
+            attach_votes([instance], self.context)
+        return super().to_representation(instance)
 
 
 class GroupPostSerializer(serializers.ModelSerializer):
@@ -28,52 +61,47 @@ class PostCreateUpdateSerializer(serializers.ModelSerializer):
         extra_kwargs = {'author': {'required': False}}
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(VoteStateMixin, serializers.ModelSerializer):
     author = AuthorPostSerializer(read_only=True)
     group = GroupPostSerializer(required=False)
     tags = TagSerializer(required=False, many=True)
-    likes_count = serializers.IntegerField(source='votes.likes.count',
-                                           read_only=True)
-    dislikes_count = serializers.IntegerField(source='votes.dislikes.count',
-                                              read_only=True)
-    comments_count = serializers.IntegerField(source='comments.count',
-                                              read_only=True)
-    liked = serializers.BooleanField()
-    disliked = serializers.BooleanField()
+    liked = serializers.BooleanField(read_only=True)
+    disliked = serializers.BooleanField(read_only=True)
+    # text around the matches of ?search=, null without a search
+    snippet = serializers.SerializerMethodField()
 
     class Meta:
         fields = '__all__'
         extra_kwargs = {'text_preview': {'read_only': True}}
+        list_serializer_class = VoteStateListSerializer
         model = Post
 
+    def get_snippet(self, post):
+        return post_snippet(post)
+
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(VoteStateMixin, serializers.ModelSerializer):
     author = serializers.SlugRelatedField(slug_field='username',
                                           read_only=True)
-    likes_count = serializers.IntegerField(source='votes.likes.count',
-                                           read_only=True)
-    dislikes_count = serializers.IntegerField(source='votes.dislikes.count',
-                                              read_only=True)
     liked = serializers.BooleanField(read_only=True)
     disliked = serializers.BooleanField(read_only=True)
-    # children = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
-        exclude = ('lft', 'rght', 'tree_id')
+        exclude = ('lft', 'rght', 'tree_id', 'path')
         extra_kwargs = {'post': {'required': False}}
         # since we have post_id in params
+        list_serializer_class = VoteStateListSerializer
         model = Comment
 
-    # def get_children(self, obj):
-    #     children = self.context['children'].get(obj.id, [])
-    #     serializer = CommentSerializer(children, many=True,
-    #                                    context=self.context)
-    #     return serializer.data
+    def update(self, instance, validated_data):
+        # a moved reply would keep the path and counters of its thread
+        validated_data.pop('parent', None)
+        return super().update(instance, validated_data)
 
 
 class GroupSerializer(serializers.ModelSerializer):
-    posts_count = serializers.IntegerField(source='posts.count',
-                                           read_only=True)
+    # annotated by GroupViewSet, a new group has no posts
+    posts_count = serializers.IntegerField(read_only=True, default=0)
 
     class Meta:
         fields = ('id', 'title', 'slug', 'description', 'posts_count')
@@ -0,0 +1,192 @@
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import feed, search, votes
+from .cache import (bump_generation, count_namespace, invalidate_votes,
+                    list_namespace, object_namespace, response_namespace)
+from .models import Comment, FeedEntry, Follow, Group, Post, Tag, User
+from .suggest import suggest_index
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    if suggest_index.is_loaded and not instance._state.adding:
+        instance._old_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    search.index_posts(Post.objects.filter(pk=instance.pk))
+    bump_generation(response_namespace(Post))
+    bump_generation(object_namespace(Post, instance.pk))
+    if created:
+        bump_generation(list_namespace(Post))
+        suggest_index.add_posts('user', instance.author_id, 1)
+        suggest_index.add_posts('group', instance.group_id, 1)
+        bump_generation(count_namespace(Post))
+        feed.forget_author_posts(instance.author_id)
+        feed.fan_out(instance)
+    elif getattr(instance, '_old_group_id', None) != instance.group_id:
+        suggest_index.add_posts('group', instance._old_group_id, -1)
+        suggest_index.add_posts('group', instance.group_id, 1)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    # the tags of the post are gone by post_delete
+    if suggest_index.is_loaded:
+        instance._tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    search.remove_posts([instance.pk])
+    bump_generation(response_namespace(Post))
+    bump_generation(list_namespace(Post))
+    suggest_index.add_posts('user', instance.author_id, -1)
+    suggest_index.add_posts('group', instance.group_id, -1)
+    for tag_id in getattr(instance, '_tag_ids', ()):
+        suggest_index.add_posts('tag', tag_id, -1)
+    bump_generation(count_namespace(Post))
+    feed.forget_author_posts(instance.author_id)
+    # feed entries of the post are deleted by cascade
+    bump_generation(count_namespace(FeedEntry))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    bump_generation(count_namespace(Post))
+    if created:
+        feed.follow_added(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_generation(count_namespace(Post))
+    feed.follow_removed(instance)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    if not instance._state.adding and (update_fields is None or
+                                       'username' in update_fields):
+        instance._old_username = User.objects.filter(
+            pk=instance.pk
+        ).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if instance.is_active:
+        suggest_index.put('user', instance.pk, instance.username,
+                          instance.username)
+    else:
+        suggest_index.remove('user', instance.pk)
+    old_username = getattr(instance, '_old_username', None)
+    instance._old_username = None
+    if old_username is not None and old_username != instance.username:
+        search.rename_author(instance)
+        bump_generation(response_namespace(User))
+        bump_generation(object_namespace(User, instance.pk))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    bump_generation(response_namespace(Post))
+    bump_generation(object_namespace(type(instance), instance.pk))
+    if not reverse:
+        search.reindex_tagged([instance.pk])
+    elif pk_set:
+        search.reindex_tagged(pk_set)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    delta = {'post_add': 1, 'post_remove': -1, 'pre_clear': -1}.get(action)
+    if delta is None or not suggest_index.is_loaded:
+        return
+    if action == 'pre_clear':
+        pk_set = set(instance.posts.values_list('pk', flat=True) if reverse
+                     else instance.tags.values_list('pk', flat=True))
+    if reverse:
+        suggest_index.add_posts('tag', instance.pk, delta * len(pk_set))
+    else:
+        for tag_id in pk_set:
+            suggest_index.add_posts('tag', tag_id, delta)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    suggest_index.put('tag', instance.pk, instance.title, instance.slug)
+    bump_generation(response_namespace(Tag))
+    bump_generation(object_namespace(Tag, instance.pk))
+    if not created:
+        search.reindex_tagged(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # the cascade deletes votes and comments without updating counters
+    for model, object_ids in votes.withdraw_votes(instance).items():
+        for object_id in object_ids:
+            invalidate_votes(model, object_id)
+    removed_paths = ()
+    comments = Comment.objects.filter(author=instance).exclude(
+        post__author=instance
+    ).order_by('path')
+    for comment in comments:
+        if comment.path.startswith(removed_paths):
+            continue
+        comment.uncount(Comment.objects.filter(
+            path__startswith=comment.path
+        ).count())
+        removed_paths += (comment.path,)
+        comments_counted(comment.post_id)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    suggest_index.remove('user', instance.pk)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    suggest_index.remove('tag', instance.pk)
+    bump_generation(response_namespace(Tag))
+    bump_generation(object_namespace(Tag, instance.pk))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    suggest_index.put('group', instance.pk, instance.title, instance.slug)
+    bump_generation(response_namespace(Group))
+    bump_generation(object_namespace(Group, instance.pk))
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    suggest_index.remove('group', instance.pk)
+    bump_generation(response_namespace(Group))
+    bump_generation(object_namespace(Group, instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        comments_counted(instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    comments_counted(instance.post_id)
+
+
+def comments_counted(post_id):
+    bump_generation(response_namespace(Post))
+    bump_generation(object_namespace(Post, post_id))
+    bump_generation(list_namespace(Post, 'comments_count'))
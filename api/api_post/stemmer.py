@@ -0,0 +1,178 @@
+"""Tokenizer with Russian and English stemming for the search index.
+
+Russian words go through the Snowball Russian algorithm, Latin ones
+through step 1 of Porter2 (plurals, -ed, -ing), which is enough to match
+the word forms of a query without a dictionary.
+"""
+import re
+from functools import lru_cache
+
+WORD = re.compile(r'[^\W_]+')
+CYRILLIC = re.compile('[а-я]')
+
+RU_VOWELS = 'аеиоуыэюя'
+RU_PERFECTIVE_GERUND = (('в', 'вши', 'вшись'),
+                        ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+RU_ADJECTIVE = ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой',
+                'ем', 'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их',
+                'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+RU_PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+RU_REFLEXIVE = ('ся', 'сь')
+RU_VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+            'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+           ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+            'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+            'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+RU_NOUN = ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+           'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+           'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+           'ья', 'я')
+RU_SUPERLATIVE = ('ейше', 'ейш')
+RU_DERIVATIONAL = ('ость', 'ост')
+
+EN_VOWELS = 'aeiouy'
+EN_DOUBLES = ('bb', 'dd', 'ff', 'gg', 'mm', 'nn', 'pp', 'rr', 'tt')
+
+
+def tokenize(text):
+    """Lowercased words of text with their (start, end) offsets."""
+    for match in WORD.finditer(text):
+        yield match.group().lower().replace('ё', 'е'), match.span()
+
+
+@lru_cache(maxsize=100000)
+def stem(word):
+    if CYRILLIC.search(word):
+        return stem_russian(word)
+    if word.isascii() and word.isalpha():
+        return stem_english(word)
+    return word
+
+
+def _longest(word, start, endings):
+    """The longest of endings word has at or after start."""
+    for ending in _by_length(endings):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            return ending
+    return None
+
+
+@lru_cache(maxsize=None)
+def _by_length(endings):
+    return sorted(endings, key=len, reverse=True)
+
+
+def _remove_grouped(word, start, groups):
+    """Remove the longest ending of (after а/я, any) groups, or None."""
+    preceded, free = groups
+    ending = _longest(word, start, preceded + free)
+    if ending is None:
+        return None
+    stripped = word[:-len(ending)]
+    if ending in free:
+        return stripped
+    if len(stripped) > start and stripped[-1] in 'ая':
+        return stripped
+    return None
+
+
+def _regions(word, vowels):
+    """Start of the region after the first vowel, R1 and R2."""
+    def after_vowel_consonant(start):
+        for i in range(start + 1, len(word)):
+            if word[i] not in vowels and word[i - 1] in vowels:
+                return i + 1
+        return len(word)
+
+    rv = next((i + 1 for i, char in enumerate(word) if char in vowels),
+              len(word))
+    r1 = after_vowel_consonant(0)
+    return rv, r1, after_vowel_consonant(r1)
+
+
+def stem_russian(word):
+    rv, _, r2 = _regions(word, RU_VOWELS)
+    # step 1
+    stripped = _remove_grouped(word, rv, RU_PERFECTIVE_GERUND)
+    if stripped is not None:
+        word = stripped
+    else:
+        ending = _longest(word, rv, RU_REFLEXIVE)
+        if ending:
+            word = word[:-len(ending)]
+        ending = _longest(word, rv, RU_ADJECTIVE)
+        if ending:
+            word = word[:-len(ending)]
+            stripped = _remove_grouped(word, rv, RU_PARTICIPLE)
+            if stripped is not None:
+                word = stripped
+        else:
+            stripped = _remove_grouped(word, rv, RU_VERB)
+            if stripped is not None:
+                word = stripped
+            else:
+                ending = _longest(word, rv, RU_NOUN)
+                if ending:
+                    word = word[:-len(ending)]
+    # step 2
+    if word.endswith('и') and len(word) - 1 >= rv:
+        word = word[:-1]
+    # step 3
+    ending = _longest(word, r2, RU_DERIVATIONAL)
+    if ending:
+        word = word[:-len(ending)]
+    # step 4
+    ending = _longest(word, rv, RU_SUPERLATIVE)
+    if ending:
+        word = word[:-len(ending)]
+    if word.endswith('нн') and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif word.endswith('ь') and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def stem_english(word):
+    """Porter2 step 1: possessives, plurals, -ed/-ing and final y."""
+    if len(word) <= 2:
+        return word
+    for suffix in ("'s'", "'s", "'"):
+        if word.endswith(suffix):
+            word = word[:-len(suffix)]
+            break
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith(('ied', 'ies')):
+        word = word[:-2] if len(word) > 4 else word[:-1]
+    elif word.endswith('s') and not word.endswith(('us', 'ss')):
+        if any(char in EN_VOWELS for char in word[:-2]):
+            word = word[:-1]
+    _, r1, _ = _regions(word, EN_VOWELS)
+    if word.endswith(('eedly', 'eed')):
+        ending = 'eedly' if word.endswith('eedly') else 'eed'
+        if len(word) - len(ending) >= r1:
+            word = word[:-len(ending)] + 'ee'
+    else:
+        for ending in ('ingly', 'edly', 'ing', 'ed'):
+            stripped = word[:-len(ending)]
+            if word.endswith(ending) and any(char in EN_VOWELS
+                                             for char in stripped):
+                word = stripped
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif word.endswith(EN_DOUBLES):
+                    word = word[:-1]
+                elif len(word) <= 3 and _short_syllable(word):
+                    word += 'e'
+                break
+    if (len(word) > 2 and word[-1] in 'yY' and
+            word[-2] not in EN_VOWELS):
+        word = word[:-1] + 'i'
+    return word
+
+
+def _short_syllable(word):
+    return (len(word) == 2 and word[0] in EN_VOWELS and
+            word[1] not in EN_VOWELS) or (
+        len(word) >= 3 and word[-3] not in EN_VOWELS and
+        word[-2] in EN_VOWELS and word[-1] not in EN_VOWELS + 'wx')
@@ -0,0 +1,232 @@
+"""Search-as-you-type suggestions of tags, groups and authors.
+
+Every process keeps the names in sorted arrays, one entry per name and
+per later word of it, so a prefix is a bisect away. The arrays are
+loaded on the first request and then kept up to date by the signals of
+this process; SUGGEST_INDEX_MAX_AGE bounds how long changes made by
+other processes stay unseen. An older index is reloaded by a background
+thread while requests keep reading it.
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .stemmer import WORD
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('tag', 'group', 'user')
+# short prefixes match too many names to rank them per request, their
+# best TOP_SIZE names are kept and updated instead
+TOP_PREFIX = 2
+TOP_SIZE = 50
+# sorts after every character a prefix can continue with
+LAST = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def name_keys(title):
+    """Keys of a name: itself and its tail from every later word."""
+    key = normalize(title)
+    return [key[match.start():] for match in WORD.finditer(key)]
+
+
+class Names:
+    """Sorted (key, id) entries of one kind with titles and post counts."""
+
+    def __init__(self, rows=()):
+        self.names = {}
+        self.counts = {}
+        self.top = {}
+        entries = []
+        for pk, title, slug, posts_count in rows:
+            self.names[pk] = (title, slug)
+            self.counts[pk] = posts_count
+            entries.extend((key, pk) for key in name_keys(title))
+        entries.sort()
+        self.entries = entries
+
+    def put(self, pk, title, slug):
+        if self.names.get(pk, (None,))[0] != title:
+            count = self.counts.get(pk, 0)
+            self.remove(pk)
+            for key in name_keys(title):
+                insort(self.entries, (key, pk))
+            self.counts[pk] = count
+            self.forget_top(title)
+        self.names[pk] = (title, slug)
+        self.counts.setdefault(pk, 0)
+
+    def remove(self, pk):
+        name = self.names.pop(pk, None)
+        self.counts.pop(pk, None)
+        if name is None:
+            return
+        for key in name_keys(name[0]):
+            index = bisect_left(self.entries, (key, pk))
+            if self.entries[index:index + 1] == [(key, pk)]:
+                del self.entries[index]
+        self.forget_top(name[0])
+
+    def add_posts(self, pk, delta):
+        if pk not in self.counts:
+            return
+        self.counts[pk] = max(self.counts[pk] + delta, 0)
+        for prefix in self.top_prefixes(self.names[pk][0]):
+            top = self.top.get(prefix)
+            if top is None:
+                continue
+            if pk in top:
+                if delta < 0 and len(top) == TOP_SIZE:
+                    # a name out of the list may be ahead now
+                    del self.top[prefix]
+                else:
+                    top.sort(key=self.order)
+            elif self.order(pk) < self.order(top[-1]):
+                # a list shorter than TOP_SIZE has every match already
+                top[-1] = pk
+                top.sort(key=self.order)
+
+    def order(self, pk):
+        return -self.counts[pk], self.names[pk][0].lower()
+
+    def matches(self, prefix):
+        """Ids of names with a key starting with prefix."""
+        start = bisect_left(self.entries, (prefix,))
+        stop = bisect_left(self.entries, (prefix + LAST,), start)
+        return {pk for _, pk in self.entries[start:stop]}
+
+    def best(self, prefix, limit):
+        """Ids of the limit names starting with prefix, most posts first."""
+        if len(prefix) > TOP_PREFIX:
+            return heapq.nsmallest(limit, self.matches(prefix),
+                                   key=self.order)
+        top = self.top.get(prefix)
+        if top is None:
+            top = self.top[prefix] = heapq.nsmallest(
+                TOP_SIZE, self.matches(prefix), key=self.order
+            )
+        return top[:limit]
+
+    @staticmethod
+    def top_prefixes(title):
+        return {key[:length] for key in name_keys(title)
+                for length in range(1, TOP_PREFIX + 1)}
+
+    def forget_top(self, title):
+        for prefix in self.top_prefixes(title):
+            self.top.pop(prefix, None)
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.kinds = {}
+        self.loaded = 0
+        self.reloading = None
+
+    @property
+    def is_loaded(self):
+        return bool(self.kinds)
+
+    def load(self):
+        from .models import Group, Tag, User
+
+        def counted(queryset, *fields):
+            return queryset.annotate(
+                posts_count=Count('posts')
+            ).order_by().values_list('pk', *fields, 'posts_count')
+
+        kinds = {
+            'tag': Names(counted(Tag.objects.all(), 'title', 'slug')),
+            'group': Names(counted(Group.objects.all(), 'title', 'slug')),
+            'user': Names(
+                (pk, username, username, posts_count)
+                for pk, username, posts_count in counted(
+                    User.objects.filter(is_active=True), 'username'
+                )
+            ),
+        }
+        with self.lock:
+            self.kinds = kinds
+            self.loaded = time.monotonic()
+
+    def reset(self):
+        with self.lock:
+            self.kinds = {}
+
+    def ensure_loaded(self):
+        if not self.is_loaded:
+            self.load()
+        elif time.monotonic() - self.loaded > settings.SUGGEST_INDEX_MAX_AGE:
+            with self.lock:
+                if self.reloading is not None:
+                    return
+                self.reloading = threading.Thread(
+                    target=self.reload, name='suggest-reload', daemon=True
+                )
+            self.reloading.start()
+
+    def reload(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception('Suggest index reload failed')
+            with self.lock:
+                # retried after another SUGGEST_INDEX_MAX_AGE
+                self.loaded = time.monotonic()
+        finally:
+            connection.close()
+            with self.lock:
+                self.reloading = None
+
+    def suggest(self, query, kinds=KINDS, limit=10):
+        """The limit names of kinds starting with query, most posts first.
+
+        Items are (kind, title, slug, posts_count).
+        """
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        self.ensure_loaded()
+        found = []
+        with self.lock:
+            for kind in kinds:
+                names = self.kinds[kind]
+                found.extend(
+                    (names.counts[pk], kind, *names.names[pk])
+                    for pk in names.best(prefix, limit)
+                )
+        found = heapq.nsmallest(
+            limit, found, key=lambda item: (-item[0], item[2].lower())
+        )
+        return [(kind, title, slug, count)
+                for count, kind, title, slug in found]
+
+    def update(self, kind, method, *args):
+        """Apply a change to a loaded index, a later load sees it anyway."""
+        with self.lock:
+            if self.kinds:
+                getattr(self.kinds[kind], method)(*args)
+
+    def put(self, kind, pk, title, slug):
+        self.update(kind, 'put', pk, title, slug)
+
+    def remove(self, kind, pk):
+        self.update(kind, 'remove', pk)
+
+    def add_posts(self, kind, pk, delta):
+        if pk is not None:
+            self.update(kind, 'add_posts', pk, delta)
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,88 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.cache import bump_generation, get_generation
+from api.api_post.cache_backends import cache_stats
+from api.api_post.models import User
+
+TIERED = 'api.api_post.cache_backends.TieredCache'
+
+
+def tiered(location):
+    return {'BACKEND': TIERED, 'LOCATION': location,
+            'OPTIONS': {'L1_PREFIXES': ('response:',)}}
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # two workers with their own L1 over one file cache
+        settings = override_settings(CACHES={
+            'default': tiered('worker'),
+            'other': tiered('other-worker'),
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.filebased.'
+                           'FileBasedCache',
+                'LOCATION': directory,
+            },
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        caches['other'].clear()
+        cache_stats.reset()
+
+    def test_generations_are_shared(self):
+        """Сброс поколения в одном процессе виден в другом."""
+        generation = get_generation('posts')
+        caches['other'].get('generation:posts')
+        bump_generation('posts')
+        self.assertNotEqual(caches['other'].get('generation:posts'),
+                            generation)
+
+    def test_versioned_keys_are_kept_in_process(self):
+        """Версионированные ключи читаются из памяти процесса,
+        остальные — из общего кэша."""
+        cache.set('response:page', b'page')
+        cache.set('author_posts:1', [1])
+        caches['shared'].delete_many(['response:page', 'author_posts:1'])
+        self.assertEqual(cache.get('response:page'), b'page')
+        self.assertIsNone(cache.get('author_posts:1'))
+        caches['other'].set('response:list', b'list')
+        self.assertEqual(cache.get_many(['response:list', 'generation:x']),
+                         {'response:list': b'list'})
+        self.assertEqual(cache_stats.snapshot(), {
+            'total': {'gets': 4, 'l1_hits': 1, 'hits': 1, 'misses': 2,
+                      'hit_rate': 0.5},
+            'kinds': {
+                'author_posts': {'gets': 1, 'l1_hits': 0, 'hits': 0,
+                                 'misses': 1, 'hit_rate': 0.0},
+                'generation': {'gets': 1, 'l1_hits': 0, 'hits': 0,
+                               'misses': 1, 'hit_rate': 0.0},
+                'response': {'gets': 2, 'l1_hits': 1, 'hits': 1,
+                             'misses': 0, 'hit_rate': 1.0},
+            },
+        })
+
+
+class CacheStatsViewTest(TestCase):
+    def test_stats_are_admin_only(self):
+        """Статистика кэша доступна только администратору."""
+        client = APIClient()
+        url = reverse('cache_stats')
+        self.assertEqual(client.get(url).status_code, 401)
+        client.force_authenticate(User.objects.create(
+            username='admin', email='admin@example.com', is_staff=True
+        ))
+        client.get(reverse('tag-list'))
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('response', response.data['kinds'])
+        self.assertEqual(client.delete(url).status_code, 204)
+        self.assertEqual(client.get(url).data['kinds'], {})
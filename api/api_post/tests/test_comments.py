@@ -0,0 +1,167 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Comment, LikeDislike, Post, User
+
+TEXT = 'Тестовый текст'
+
+
+class CommentTreeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT)
+        cls.roots = [cls.comment() for _ in range(2)]
+        cls.chain = [cls.roots[0]]
+        for _ in range(Comment.MAX_LEVEL):
+            cls.chain.append(cls.comment(cls.chain[-1]))
+        cls.sibling = cls.comment(cls.roots[0])
+        LikeDislike.objects.create(content_object=cls.chain[2],
+                                   user=cls.user, vote=LikeDislike.LIKE)
+
+    @classmethod
+    def comment(cls, parent=None):
+        return Comment.objects.create(post=cls.post, author=cls.user,
+                                      text=TEXT, parent=parent)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('comments-list', args=[self.post.pk])
+
+    def test_tree_is_nested_in_one_query(self):
+        """Дерево комментариев собирается из одного запроса."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'tree': 1})
+        # the post lookup, comments with authors, viewer votes
+        self.assertEqual(len(context.captured_queries), 3)
+        roots = response.data
+        self.assertEqual([root['id'] for root in roots],
+                         [root.pk for root in self.roots])
+        self.assertEqual([child['id'] for child in roots[0]['children']],
+                         [self.chain[1].pk, self.sibling.pk])
+        node = roots[0]
+        for comment in self.chain[1:]:
+            node = node['children'][0]
+            self.assertEqual(node['id'], comment.pk)
+        self.assertEqual(node['children'], [])
+        self.assertTrue(roots[0]['children'][0]['children'][0]['liked'])
+
+    def test_max_depth(self):
+        """max_depth ограничивает глубину дерева."""
+        response = self.client.get(self.url, {'tree': 1, 'max_depth': 0})
+        self.assertEqual([root['children'] for root in response.data],
+                         [[], []])
+        response = self.client.get(self.url, {'tree': 1, 'max_depth': 9})
+        self.assertEqual(response.status_code, 400)
+
+    def test_counters_follow_the_subtree(self):
+        """Счётчики ответов и комментариев поста учитывают всё поддерево."""
+        self.assertEqual(
+            Comment.objects.get(pk=self.roots[0].pk).replies_count,
+            len(self.chain)
+        )
+        Comment.objects.get(pk=self.chain[1].pk).delete()
+        self.assertEqual(
+            Comment.objects.get(pk=self.roots[0].pk).replies_count, 1
+        )
+        self.assertEqual(Post.objects.get(pk=self.post.pk).comments_count, 3)
+        self.assertFalse(
+            Comment.objects.filter(pk__in=[c.pk for c in self.chain[1:]])
+        )
+
+    def test_parent_is_read_only_on_update(self):
+        """Ответ нельзя перенести в другой тред при редактировании."""
+        response = self.client.patch(
+            reverse('comments-detail', args=[self.post.pk, self.sibling.pk]),
+            {'parent': self.roots[1].pk, 'text': 'Новый текст'}
+        )
+        self.assertEqual(response.status_code, 200)
+        sibling = Comment.objects.get(pk=self.sibling.pk)
+        self.assertEqual(sibling.text, 'Новый текст')
+        self.assertEqual(sibling.parent_id, self.roots[0].pk)
+        self.assertEqual(sibling.path, self.sibling.path)
+        self.assertEqual(
+            Comment.objects.get(pk=self.roots[1].pk).replies_count, 0
+        )
+
+
+@override_settings(COMMENTS_PREVIEW=2)
+class CommentThreadsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT)
+        cls.roots = [cls.comment() for _ in range(settings.PAGE_SIZE + 1)]
+        cls.replies = [cls.comment(cls.roots[0])
+                       for _ in range(settings.PAGE_SIZE + 1)]
+        cls.nested = cls.comment(cls.replies[0])
+
+    @classmethod
+    def comment(cls, parent=None):
+        return Comment.objects.create(post=cls.post, author=cls.user,
+                                      text=TEXT, parent=parent)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('comments-list', args=[self.post.pk])
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(context.captured_queries)
+
+    def test_threads_are_paginated_by_root(self):
+        """Треды пагинируются по корневым комментариям с превью ответов."""
+        data, queries = self.get(self.url, {'tree': 1,
+                                            'pagination': 'cursor'})
+        # the post, roots, previews, viewer votes skipped for anonymous
+        self.assertEqual(queries, 3)
+        first = data['response']
+        self.assertEqual([root['id'] for root in first],
+                         [root.pk for root in self.roots[:-1]])
+        # the first two replies in preorder
+        self.assertEqual([reply['id'] for reply in first[0]['children']],
+                         [self.replies[0].pk])
+        self.assertEqual(
+            [reply['id'] for reply in first[0]['children'][0]['children']],
+            [self.nested.pk]
+        )
+        self.assertEqual(first[0]['replies_count'], len(self.replies) + 1)
+        data, _ = self.get(data['links']['next'])
+        self.assertEqual([root['id'] for root in data['response']],
+                         [self.roots[-1].pk])
+        self.assertIsNone(data['links']['next'])
+
+    def test_more_replies(self):
+        """Ответы поддерева подгружаются постранично в порядке дерева."""
+        url = reverse('comments-replies', args=[self.post.pk,
+                                                self.roots[0].pk])
+        data, queries = self.get(url)
+        # the post, the comment, replies
+        self.assertEqual(queries, 3)
+        # the nested reply takes a place on the first page
+        self.assertEqual([reply['id'] for reply in data['response']],
+                         [reply.pk for reply in self.replies[:-2]])
+        self.assertEqual(data['response'][0]['children'][0]['id'],
+                         self.nested.pk)
+        data, _ = self.get(data['links']['next'])
+        self.assertEqual([reply['id'] for reply in data['response']],
+                         [reply.pk for reply in self.replies[-2:]])
+
+
+@override_settings(COMMENTS_TREE_STORAGE='path')
+class PathCommentTreeTest(CommentTreeTest):
+    """Те же проверки при хранении тредов материализованным путём."""
+
+
+@override_settings(COMMENTS_TREE_STORAGE='path')
+class PathCommentThreadsTest(CommentThreadsTest):
+    """Те же проверки при хранении тредов материализованным путём."""
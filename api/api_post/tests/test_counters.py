@@ -0,0 +1,195 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Comment, LikeDislike, Post, User
+from api.api_post.votes import toggle_vote
+
+TEXT = 'Тестовый текст'
+
+
+def counters(obj):
+    return type(obj).objects.values_list(
+        'likes_count', 'dislikes_count', 'rating'
+    ).get(pk=obj.pk)
+
+
+def reconcile(dry_run=False):
+    out = StringIO()
+    call_command('reconcile_counters', dry_run=dry_run, stdout=out)
+    return out.getvalue()
+
+
+class VoteCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.other = User.objects.create(username='other',
+                                        email='other@example.com')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT)
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.user,
+                                             text=TEXT)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def vote(self, url_name, args, action, user):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse(f'{url_name}-{action}', args=args))
+
+    def test_votes_update_counters(self):
+        """Голоса за запись и комментарий меняют их счётчики."""
+        for url_name, args, obj in (
+            ('posts', [self.post.pk], self.post),
+            ('comments', [self.post.pk, self.comment.pk], self.comment),
+        ):
+            with self.subTest(url_name=url_name):
+                self.vote(url_name, args, 'like', self.user)
+                response = self.vote(url_name, args, 'dislike', self.other)
+                self.assertEqual(
+                    (response.data['likes_count'],
+                     response.data['dislikes_count']),
+                    (1, 1)
+                )
+                self.assertEqual(counters(obj), (1, 1, 0))
+                self.vote(url_name, args, 'like', self.other)
+                self.assertEqual(counters(obj), (2, 0, 2))
+                self.vote(url_name, args, 'like', self.user)
+                self.assertEqual(counters(obj), (1, 0, 1))
+        self.assertNotRegex(reconcile(dry_run=True), r': [1-9]')
+
+    def test_drift_is_reconciled(self):
+        """reconcile_counters пересчитывает разошедшиеся счётчики."""
+        LikeDislike.objects.create(content_object=self.post,
+                                   user=self.user, vote=LikeDislike.DISLIKE)
+        self.assertIn('Post: 1 with drifted vote counters.',
+                      reconcile(dry_run=True))
+        self.assertEqual(counters(self.post), (0, 0, 0))
+        self.assertIn('Post: 1 with drifted vote counters fixed.',
+                      reconcile())
+        self.assertEqual(counters(self.post), (0, 1, -1))
+        self.assertNotRegex(reconcile(dry_run=True), r': [1-9]')
+
+
+class CommentsCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.other = User.objects.create(username='other',
+                                        email='other@example.com')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('comments-list', args=[self.post.pk])
+
+    def add_comment(self, parent=None):
+        data = {'text': TEXT}
+        if parent is not None:
+            data['parent'] = parent
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def comments_count(self):
+        return Post.objects.values_list(
+            'comments_count', flat=True
+        ).get(pk=self.post.pk)
+
+    def test_comments_are_counted(self):
+        """Комментарии и ответы считаются, удаление убирает поддерево."""
+        root = self.add_comment()
+        reply = self.add_comment(root)
+        self.add_comment(reply)
+        other = self.add_comment()
+        self.assertEqual(self.comments_count(), 4)
+        response = self.client.delete(
+            reverse('comments-detail', args=[self.post.pk, root])
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.comments_count(), 1)
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)),
+                         [other])
+        self.assertNotRegex(reconcile(dry_run=True), r': [1-9]')
+
+    def test_comments_of_deleted_user_are_uncounted(self):
+        """Удаление пользователя убирает из счётчика его комментарии
+        вместе с ответами на них."""
+        kept = self.add_comment()
+        self.client.force_authenticate(self.other)
+        root = self.add_comment()
+        self.add_comment(kept)
+        self.client.force_authenticate(self.user)
+        self.add_comment(root)
+        self.assertEqual(self.comments_count(), 4)
+        self.other.delete()
+        self.assertEqual(self.comments_count(), 1)
+        self.assertEqual(list(Comment.objects.values_list('pk', flat=True)),
+                         [kept])
+        self.assertNotRegex(reconcile(dry_run=True), r': [1-9]')
+
+
+class CascadeCountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.reader = User.objects.create(username='reader',
+                                         email='reader@example.com')
+        cls.post = Post.objects.create(author=cls.author, text=TEXT)
+        cls.own_post = Post.objects.create(author=cls.reader, text=TEXT)
+        cls.root = cls.comment(cls.author)
+        cls.reply = cls.comment(cls.reader, cls.root)
+        cls.answer = cls.comment(cls.author, cls.reply)
+        cls.nested = cls.comment(cls.reader, cls.answer)
+        cls.comment(cls.author)
+        Comment.objects.create(post=cls.own_post, author=cls.reader,
+                               text=TEXT)
+        for obj, vote in ((cls.post, LikeDislike.LIKE),
+                          (cls.root, LikeDislike.DISLIKE),
+                          (cls.answer, LikeDislike.LIKE)):
+            toggle_vote(type(obj), obj.pk, cls.reader, vote)
+        toggle_vote(Post, cls.post.pk, cls.author, LikeDislike.LIKE)
+
+    @classmethod
+    def comment(cls, author, parent=None):
+        return Comment.objects.create(post=cls.post, author=author,
+                                      text=TEXT, parent=parent)
+
+    def assertNoDrift(self):
+        self.assertNotRegex(reconcile(dry_run=True), r': [1-9]')
+
+    def test_deleted_user_is_taken_off_counters(self):
+        """Удаление пользователя убирает его голоса и комментарии
+        из счётчиков."""
+        self.assertEqual(counters(self.post), (2, 0, 2))
+        self.assertEqual(counters(self.root), (0, 1, -1))
+        self.reader.delete()
+        self.assertEqual(counters(self.post), (1, 0, 1))
+        self.assertEqual(counters(self.root), (0, 0, 0))
+        self.post.refresh_from_db()
+        self.root.refresh_from_db()
+        # the reply of the reader takes the answer of the author with it
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertEqual(self.root.replies_count, 0)
+        self.assertNoDrift()
+
+    def test_deleted_comment_is_taken_off_counters(self):
+        """Удаление комментария уменьшает счётчики на всё поддерево."""
+        self.reply.delete()
+        self.post.refresh_from_db()
+        self.root.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+        self.assertEqual(self.root.replies_count, 0)
+        self.assertNoDrift()
+
+
+@override_settings(COMMENTS_TREE_STORAGE='path')
+class PathCascadeCountersTest(CascadeCountersTest):
+    pass
@@ -0,0 +1,158 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import FeedEntry, Follow, Post, User
+
+TEXT = 'Тестовый текст'
+
+
+@override_settings(FEED_FANOUT_LIMIT=2, FEED_FANOUT_RESUME=1,
+                   FEED_BACKFILL=3, FEED_AUTHOR_POSTS=10)
+class FollowFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.writer = User.objects.create(username='writer',
+                                         email='writer@example.com')
+        cls.others = [
+            User.objects.create(username=f'other{i}',
+                                email=f'other{i}@example.com')
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_posts(self, count, author=None):
+        return [Post.objects.create(author=author or self.author, text=TEXT)
+                for _ in range(count)]
+
+    def feed_ids(self, query=''):
+        response = self.client.get(reverse('posts-follow') + query)
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['response']]
+
+    def sync_feeds(self):
+        out = StringIO()
+        call_command('sync_feeds', stdout=out)
+        return out.getvalue()
+
+    def pulled(self):
+        return not Follow.objects.filter(author=self.author,
+                                         fanout=True).exists()
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        """Подписка копирует последние записи в ленту, более ранние
+        читаются из записей автора, отписка удаляет ленту."""
+        posts = self.add_posts(5)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 3)
+        expected = [post.pk for post in reversed(posts)]
+        self.assertEqual(self.feed_ids(), expected)
+        self.assertEqual(self.feed_ids('?pagination=cursor'), expected)
+        self.assertEqual(self.feed_ids('?ordering=pub_date'),
+                         expected[::-1])
+        follow.delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(self.feed_ids(), [])
+
+    def test_new_post_fans_out(self):
+        """Новая запись попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = self.add_posts(1)[0]
+        self.assertEqual(self.feed_ids(), [post.pk])
+        self.assertEqual(self.feed_ids('?pagination=cursor'), [post.pk])
+
+    def test_celebrity_is_read_on_request(self):
+        """Записи автора с большим числом подписчиков не копируются."""
+        Follow.objects.create(user=self.user, author=self.author)
+        for other in self.others:
+            Follow.objects.create(user=other, author=self.author)
+        self.assertTrue(self.pulled())
+        self.assertFalse(FeedEntry.objects.exists())
+        posts = self.add_posts(4)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_ids(),
+                         [post.pk for post in reversed(posts)])
+        # the cached posts of the author are dropped on a new post
+        posts += self.add_posts(1)
+        self.assertEqual(self.feed_ids()[0], posts[-1].pk)
+
+        # between the limits nothing changes either way
+        Follow.objects.get(user=self.others[0]).delete()
+        self.assertIn('Follow: 0 authors', self.sync_feeds())
+        self.assertTrue(self.pulled())
+        follow = Follow.objects.create(user=self.others[0],
+                                       author=self.author)
+        self.assertFalse(follow.fanout)
+        follow.delete()
+        Follow.objects.get(user=self.others[1]).delete()
+        self.assertTrue(self.pulled())
+        self.assertIn('Follow: 1 authors', self.sync_feeds())
+        self.assertFalse(self.pulled())
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(self.feed_ids(),
+                         [post.pk for post in reversed(posts)])
+
+    def test_copies_of_celebrity_are_deleted_by_sync(self):
+        """Скопированные записи ставшего популярным автора удаляет
+        sync_feeds, до этого лента их пропускает."""
+        posts = self.add_posts(2)
+        Follow.objects.create(user=self.user, author=self.author)
+        for other in self.others:
+            Follow.objects.create(user=other, author=self.author)
+        self.assertTrue(self.pulled())
+        self.assertEqual(FeedEntry.objects.count(), 4)
+        expected = [post.pk for post in reversed(posts)]
+        response = self.client.get(reverse('posts-follow'))
+        self.assertEqual(response.data['entries_count'], 2)
+        self.assertEqual(self.feed_ids(), expected)
+        self.assertIn('FeedEntry: 4 of pulled authors deleted.',
+                      self.sync_feeds())
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), expected)
+
+    def test_timeline_is_merged_with_pulled_authors(self):
+        """Лента подписок сливается с записями популярных авторов."""
+        Follow.objects.create(user=self.user, author=self.writer)
+        Follow.objects.create(user=self.user, author=self.author)
+        for other in self.others:
+            Follow.objects.create(user=other, author=self.author)
+        posts = []
+        for _ in range(8):
+            posts += self.add_posts(1) + self.add_posts(1, self.writer)
+        expected = [post.pk for post in reversed(posts)]
+        self.assertEqual(self.feed_ids() + self.feed_ids('?page=2'),
+                         expected)
+        # pages past the cached posts read them from the database
+        with self.settings(FEED_AUTHOR_POSTS=3):
+            cache.clear()
+            self.assertEqual(self.feed_ids() + self.feed_ids('?page=2'),
+                             expected)
+
+    def test_older_posts_are_read_past_the_horizon(self):
+        """Записи старше скопированных читаются из записей всех авторов
+        подписки в общем порядке."""
+        posts = []
+        for _ in range(7):
+            posts += self.add_posts(1) + self.add_posts(1, self.writer)
+        Follow.objects.create(user=self.user, author=self.writer)
+        Follow.objects.create(user=self.user, author=self.author)
+        posts += self.add_posts(1, self.writer)
+        expected = [post.pk for post in reversed(posts)]
+        self.assertEqual(self.feed_ids() + self.feed_ids('?page=2'),
+                         expected)
+        for other in self.others:
+            Follow.objects.create(user=other, author=self.author)
+        self.assertEqual(self.feed_ids() + self.feed_ids('?page=2'),
+                         expected)
@@ -0,0 +1,59 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.instrumentation import QueryBudgetExceeded, request_stats
+from api.api_post.models import Post, User
+
+TEXT = 'Тестовый текст'
+
+
+class InstrumentationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.admin = User.objects.create(username='admin', is_staff=True,
+                                        email='admin@example.com')
+        Post.objects.create(author=cls.user, text=TEXT)
+
+    def setUp(self):
+        cache.clear()
+        request_stats.reset()
+        self.client = APIClient()
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(self.admin)
+
+    def test_server_timing_header(self):
+        """Ответ содержит число запросов и время в Server-Timing."""
+        response = self.client.get(reverse('posts-list'))
+        self.assertIn('Server-Timing', response)
+        for metric in ('db;desc="', 'serializer;dur=', 'render;dur=',
+                       'total;dur='):
+            self.assertIn(metric, response['Server-Timing'])
+
+    def test_stats_are_admin_only(self):
+        """Статистика доступна только администратору."""
+        self.client.get(reverse('posts-list'))
+        url = reverse('request_stats')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.admin_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['posts-list']['requests'], 1)
+        self.assertGreater(response.data['posts-list']['avg_queries'], 0)
+
+    @override_settings(QUERY_BUDGET_STRICT=True,
+                       QUERY_BUDGETS={'posts-list': 1})
+    def test_strict_budget_raises(self):
+        """Превышение бюджета запросов в строгом режиме — ошибка."""
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('posts-list'))
+
+    @override_settings(QUERY_BUDGET_STRICT=True,
+                       QUERY_BUDGETS={'posts-list': 0})
+    def test_budget_is_for_reads(self):
+        """Бюджет запросов не применяется к записи."""
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('posts-list'), {'text': 'Текст'})
+        self.assertEqual(response.status_code, 201)
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.api_post.models import Post, User
+
+TEXT = 'Тестовый текст'
+
+
+class RatingOrderingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(username='user', email='user@example.com')
+        now = timezone.now()
+        cls.posts = []
+        for rating, age in ((1, 3), (5, 2), (1, 1), (-2, 0)):
+            post = Post.objects.create(author=user, text=TEXT)
+            Post.objects.filter(pk=post.pk).update(
+                rating=rating, pub_date=now - timedelta(days=age)
+            )
+            cls.posts.append(post.pk)
+
+    def ids(self, ordering):
+        response = APIClient().get(reverse('posts-list'),
+                                   {'ordering': ordering})
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['response']]
+
+    def test_equal_ratings_are_ordered_by_date(self):
+        """Записи с равным рейтингом упорядочены по дате в ту же сторону."""
+        old, best, new, worst = self.posts
+        self.assertEqual(self.ids('-rating'), [best, new, old, worst])
+        self.assertEqual(self.ids('rating'), [worst, old, new, best])
+
+    def test_rating_ordering_uses_the_index(self):
+        """Сортировка по рейтингу читает индекс, а не сортирует таблицу."""
+        plan = Post.objects.order_by('-rating', '-pub_date').explain()
+        self.assertIn('post_rating_idx', plan)
@@ -0,0 +1,106 @@
+from base64 import urlsafe_b64encode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.api_post.models import Comment, Post, User
+
+TEXT = 'Тестовый текст'
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        for _ in range(settings.PAGE_SIZE * 2 + 3):
+            Post.objects.create(author=cls.user, text=TEXT)
+        # equal dates, ratings and counters leave only the pk to order by
+        Post.objects.update(pub_date=timezone.now())
+        commented = Post.objects.order_by('pk')[:settings.PAGE_SIZE + 1]
+        for post in commented:
+            Comment.objects.create(post=post, author=cls.user, text=TEXT)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('posts-list')
+
+    def walk(self, ordering):
+        """Pages of ids forward by next links, then back by previous."""
+        response = self.client.get(self.url, {'pagination': 'cursor',
+                                              'ordering': ordering})
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('entries_count', response.data)
+            pages.append([post['id'] for post in response.data['response']])
+            if response.data['links']['next'] is None:
+                break
+            response = self.client.get(response.data['links']['next'])
+        back = [pages[-1]]
+        while response.data['links']['previous'] is not None:
+            response = self.client.get(response.data['links']['previous'])
+            back.append([post['id'] for post in response.data['response']])
+        self.assertEqual(back, pages[::-1])
+        return pages
+
+    def test_cursor_pages_follow_the_ordering(self):
+        """Курсоры обходят все записи без пропусков и повторов,
+        в том числе при равных рейтинге и числе комментариев."""
+        for ordering, expected in (
+            ('-pub_date', ('-pub_date', '-pk')),
+            ('-rating', ('-rating', '-pub_date', '-pk')),
+            ('comments_count', ('comments_count', 'pub_date', 'pk')),
+            ('-comments_count', ('-comments_count', '-pub_date', '-pk')),
+        ):
+            with self.subTest(ordering=ordering):
+                pages = self.walk(ordering)
+                self.assertEqual(
+                    [len(page) for page in pages],
+                    [settings.PAGE_SIZE, settings.PAGE_SIZE, 3]
+                )
+                self.assertEqual(
+                    sum(pages, []),
+                    list(Post.objects.order_by(*expected)
+                         .values_list('pk', flat=True))
+                )
+
+    def test_invalid_cursor_is_not_found(self):
+        """Неверный курсор даёт 404."""
+        for cursor in ('not-a-cursor',
+                       urlsafe_b64encode(b'{"v": [1], "r": 0}').decode(),
+                       urlsafe_b64encode(b'{"v": ["x", 1]}').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(self.url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+class CachedCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        Post.objects.create(author=cls.user, text=TEXT)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('posts-list')
+
+    def entries_count(self):
+        return self.client.get(self.url).data['entries_count']
+
+    def test_count_follows_writes(self):
+        """Закэшированное число записей обновляется после записи."""
+        self.assertEqual(self.entries_count(), 1)
+        response = self.client.post(self.url, {'text': TEXT})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.entries_count(), 2)
+        Post.objects.latest().delete()
+        self.assertEqual(self.entries_count(), 1)
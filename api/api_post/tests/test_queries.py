@@ -0,0 +1,123 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Comment, Follow, Group, Post, Tag, User
+
+USERNAME = 'user'
+AUTHOR_USERNAME = 'author'
+SLUG = 'test-slug'
+TEXT = 'Тестовый текст'
+# count (cached after the first request), page, tags, viewer votes
+LIST_BUDGET = 4
+# the follows, counts and latest posts of pulled authors (cached), the
+# timeline count (cached), timeline entries, posts, tags, viewer votes
+MERGED_FEED_BUDGET = 8
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username=USERNAME,
+                                       email='user@example.com')
+        cls.author = User.objects.create(username=AUTHOR_USERNAME,
+                                         email='author@example.com')
+        cls.group = Group.objects.create(title=SLUG, slug=SLUG,
+                                         description=TEXT)
+        cls.tags = [Tag.objects.create(title=f'{SLUG}{i}', slug=f'{SLUG}{i}')
+                    for i in range(3)]
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(self.user)
+
+    def add_posts(self, count):
+        for _ in range(count):
+            post = Post.objects.create(author=self.author, group=self.group,
+                                       text=TEXT)
+            post.tags.set(self.tags)
+            Comment.objects.create(post=post, author=self.user, text=TEXT)
+        return post
+
+    def count_queries(self, client, url):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_lists_fit_budget_for_any_page_size(self):
+        """Число запросов списков не зависит от размера страницы."""
+        post = self.add_posts(1)
+        urls = {
+            reverse('posts-list'): LIST_BUDGET,
+            # the pulled authors check, the timeline page joins the posts
+            reverse('posts-follow'): LIST_BUDGET + 1,
+            reverse('posts-list') + '?ordering=-rating': LIST_BUDGET,
+            reverse('posts-list') + '?pagination=cursor': LIST_BUDGET - 1,
+            # the author lookup of the profile
+            reverse('profile', args=[AUTHOR_USERNAME]): LIST_BUDGET + 1,
+            # the post lookup, comments with authors, viewer votes
+            reverse('comments-list', args=[post.pk]): 3,
+        }
+        single = {url: self.count_queries(self.authorized_client, url)
+                  for url in urls}
+        self.add_posts(20)
+        for url, budget in urls.items():
+            with self.subTest(url=url):
+                queries = self.count_queries(self.authorized_client, url)
+                self.assertLessEqual(queries, budget)
+                self.assertLessEqual(queries, single[url])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_merged_feed_fits_budget_for_any_authors(self):
+        """Лента с популярными авторами укладывается в бюджет при любом
+        их числе."""
+        url = reverse('posts-follow')
+        self.add_posts(1)
+
+        def pull(number):
+            author = User.objects.create(username=f'celebrity{number}',
+                                         email=f'celebrity{number}@ex.com')
+            Follow.objects.create(user=self.user, author=author)
+            Post.objects.create(author=author, text=TEXT)
+
+        pull(0)
+        self.count_queries(self.authorized_client, url)
+        cache.clear()
+        single = self.count_queries(self.authorized_client, url)
+        self.assertLessEqual(single, MERGED_FEED_BUDGET)
+        for number in range(1, 4):
+            pull(number)
+        cache.clear()
+        self.assertLessEqual(
+            self.count_queries(self.authorized_client, url), single
+        )
+        # the authors' posts and the timeline count are cached
+        self.assertLessEqual(
+            self.count_queries(self.authorized_client, url),
+            MERGED_FEED_BUDGET - 3
+        )
+
+    def test_anonymous_list_skips_votes(self):
+        """Для анонима голоса не запрашиваются."""
+        self.add_posts(10)
+        self.assertLessEqual(
+            self.count_queries(self.client, reverse('posts-list')),
+            LIST_BUDGET - 1
+        )
+
+    def test_post_detail_fits_budget(self):
+        """Запись загружается вместе с автором, сообществом и тегами."""
+        post = self.add_posts(1)
+        self.assertLessEqual(
+            self.count_queries(self.authorized_client,
+                               reverse('posts-detail', args=[post.pk])),
+            3
+        )
@@ -0,0 +1,245 @@
+import threading
+import time
+from hashlib import md5
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post import cache as cache_module
+from api.api_post.cache import (acquire_lock, cached_value, get_generation,
+                                get_generations, list_namespace,
+                                object_namespace, release_lock)
+from api.api_post.models import Comment, Group, Post, Tag, User
+from api.api_post.vote_buffer import get_vote_buffer
+
+TEXT = 'Тестовый текст'
+
+
+class ResponseCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='')
+        cls.tag = Tag.objects.create(title='Тег', slug='tag')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT,
+                                       group=cls.group)
+        cls.post.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user_client = APIClient()
+        self.user_client.force_authenticate(self.user)
+
+    def posts(self, query=''):
+        response = self.client.get(reverse('posts-list') + query)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['response']
+
+    def test_anonymous_list_is_cached(self):
+        """Повторный анонимный запрос отдаётся из кэша без запросов к базе,
+        порядок параметров не важен."""
+        url = reverse('posts-list')
+        first = self.client.get(url + '?ordering=-rating&page=1')
+        with self.assertNumQueries(0):
+            second = self.client.get(url + '?page=1&ordering=-rating')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_signed_in_viewers_share_the_page(self):
+        """Вошедшие пользователи получают общую страницу из кэша, свои
+        голоса подставляются одним запросом."""
+        url = reverse('posts-list')
+        self.client.get(url)
+        self.user_client.post(reverse('posts-like', args=[self.post.pk]))
+        anonymous = self.client.get(url).json()
+        with self.assertNumQueries(1):
+            response = self.user_client.get(url)
+        signed_in = response.json()
+        self.assertTrue(signed_in['response'][0]['liked'])
+        self.assertFalse(anonymous['response'][0]['liked'])
+        signed_in['response'][0]['liked'] = False
+        self.assertEqual(signed_in, anonymous)
+        other = APIClient()
+        other.force_authenticate(User.objects.create(
+            username='other', email='other@example.com'
+        ))
+        post, = other.get(url).json()['response']
+        self.assertFalse(post['liked'])
+        self.assertEqual(post['likes_count'], 1)
+
+    @override_settings(VOTES_WRITE_BEHIND=True, VOTES_FLUSH_INTERVAL=3600)
+    def test_pending_votes_are_overlaid(self):
+        """Ещё не записанный голос виден в общей странице пользователя."""
+        self.user_client.get(reverse('posts-list'))
+        self.user_client.post(reverse('posts-dislike', args=[self.post.pk]))
+        post, = self.user_client.get(reverse('posts-list')).json()['response']
+        self.assertTrue(post['disliked'])
+        self.assertEqual(post['dislikes_count'], 1)
+        get_vote_buffer().flush()
+
+    def test_writes_invalidate(self):
+        """Записи, голоса, комментарии, теги и сообщества сбрасывают кэш."""
+        self.posts()
+        self.user_client.post(reverse('posts-like', args=[self.post.pk]))
+        post, = self.posts()
+        self.assertEqual(post['likes_count'], 1)
+        self.assertFalse(post['liked'])
+        Comment.objects.create(post=self.post, author=self.user, text=TEXT)
+        self.assertEqual(self.posts()[0]['comments_count'], 1)
+        tag = Tag.objects.get(pk=self.tag.pk)
+        tag.title = 'Новый тег'
+        tag.save()
+        self.assertEqual(self.posts()[0]['tags'][0]['title'], 'Новый тег')
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новая группа'
+        group.save()
+        self.assertEqual(self.posts()[0]['group']['title'], 'Новая группа')
+        groups = self.client.get(reverse('group-list')).json()
+        self.assertEqual(groups[0]['posts_count'], 1)
+        Post.objects.create(author=self.user, text=TEXT, group=self.group)
+        self.assertEqual(len(self.posts()), 2)
+        groups = self.client.get(reverse('group-list')).json()
+        self.assertEqual(groups[0]['posts_count'], 2)
+
+    def test_vote_keeps_other_pages(self):
+        """Голос пересчитывает только страницы со своей записью и
+        сортировку по рейтингу."""
+        group = Group.objects.create(title='Другая', slug='other',
+                                     description='')
+        Post.objects.create(author=self.user, text=TEXT, group=group)
+        for query in ('?group=group', '?group=other', '?ordering=-rating'):
+            self.posts(query)
+        self.user_client.post(reverse('posts-like', args=[self.post.pk]))
+        with self.assertNumQueries(0):
+            self.posts('?group=other')
+        post, = self.posts('?group=group')
+        self.assertEqual(post['likes_count'], 1)
+        self.assertEqual(self.posts('?ordering=-rating')[0]['id'],
+                         self.post.pk)
+
+    def test_outdated_page_while_recomputed(self):
+        """Пока другой процесс пересчитывает страницу, отдаётся старая."""
+        url = reverse('posts-list')
+        self.posts()
+        Post.objects.create(author=self.user, text=TEXT)
+        key = 'response:' + md5(f'{url}?'.encode()).hexdigest()
+        token = acquire_lock(key)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self.posts()), 1)
+        release_lock(key, token)
+        self.assertEqual(len(self.posts()), 2)
+
+
+class CacheVersionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.first = Post.objects.create(author=cls.user, text=TEXT)
+        cls.second = Post.objects.create(author=cls.user, text=TEXT)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.namespaces = [
+            object_namespace(Post, self.first.pk),
+            object_namespace(Post, self.second.pk),
+            list_namespace(Post),
+            list_namespace(Post, 'rating'),
+            list_namespace(Post, 'comments_count'),
+        ]
+
+    def bumped(self, write):
+        before = get_generations(self.namespaces)
+        write()
+        return [old != new for old, new in
+                zip(before, get_generations(self.namespaces))]
+
+    def test_writes_bump_their_namespaces(self):
+        """Запись меняет версии только затронутых записей и списков."""
+        self.assertEqual(self.bumped(lambda: self.client.post(
+            reverse('posts-like', args=[self.first.pk])
+        )), [True, False, False, True, False])
+        self.assertEqual(self.bumped(lambda: Comment.objects.create(
+            post=self.second, author=self.user, text=TEXT
+        )), [False, True, False, False, True])
+        self.assertEqual(self.bumped(lambda: Post.objects.create(
+            author=self.user, text=TEXT
+        )), [False, False, True, False, False])
+
+
+class GenerationCommitTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generation_is_bumped_on_commit(self):
+        """После коммита версии меняются ещё раз: данные, закэшированные
+        до коммита, не читаются."""
+        user = User.objects.create(username='user', email='user@example.com')
+        post = Post.objects.create(author=user, text=TEXT)
+        namespace = object_namespace(Post, post.pk)
+        with transaction.atomic():
+            Comment.objects.create(post=post, author=user, text=TEXT)
+            # what a reader would cache before the commit
+            before_commit = get_generation(namespace)
+        self.assertNotEqual(get_generation(namespace), before_commit)
+
+
+class CachedValueTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_one_worker_computes(self):
+        """Одновременные промахи вычисляют значение один раз."""
+        calls = []
+        values = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: values.append(
+            cached_value('key', compute, 60)
+        )) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(values, ['value'] * 5)
+
+    def test_stale_value_while_locked(self):
+        """Под чужой блокировкой отдаётся старая версия, без неё —
+        значение вычисляется, даже если никто его не дождался."""
+        cached_value('key', lambda: 'old', 60, version='1')
+        token = acquire_lock('key')
+        self.assertEqual(cached_value('key', lambda: 'new', 60, '2'), 'old')
+        with override_settings(CACHE_LOCK_WAIT=0.05):
+            self.assertEqual(cached_value('other', lambda: 'new', 60),
+                             'new')
+        release_lock('key', token)
+        self.assertEqual(cached_value('key', lambda: 'new', 60, '2'), 'new')
+        self.assertEqual(cached_value('key', lambda: 'newer', 60, '2'),
+                         'new')
+
+    def test_early_expiration(self):
+        """Значение пересчитывается до истечения тем вероятнее, чем ближе
+        срок и дольше вычисление."""
+        cache.set('key', ('old', time.time() + 10, 5.0), 60)
+        random = mock.patch.object(cache_module.random, 'random')
+        with random as value:
+            value.return_value = 0.5
+            self.assertEqual(cached_value('key', lambda: 'new', 60), 'old')
+            value.return_value = 0.99
+            self.assertEqual(cached_value('key', lambda: 'new', 60), 'new')
@@ -0,0 +1,96 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Post, User
+
+
+class PostSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.markup = Post.objects.create(
+            author=cls.author,
+            text='<p class="lead">Новости <b>джанго</b> &lt;b&gt;</p>',
+        )
+        cls.once = Post.objects.create(author=cls.author,
+                                       text='<p>Релиз джанго</p>')
+        cls.twice = Post.objects.create(
+            author=cls.author, text='<p>Джанго, джанго и релиз джанго</p>'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, terms, **params):
+        response = self.client.get(reverse('posts-list'),
+                                   {'search': terms, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['response']
+
+    def ids(self, terms, **params):
+        return [post['id'] for post in self.search(terms, **params)]
+
+    def test_markup_is_not_searched(self):
+        """Поиск идёт по тексту записи без разметки."""
+        self.assertEqual(self.ids('lead'), [])
+        self.assertEqual(self.ids('новости'), [self.markup.pk])
+
+    def test_results_are_ranked(self):
+        """Результаты упорядочены по релевантности, ?ordering её отменяет."""
+        self.assertEqual(self.ids('джанго релиз'),
+                         [self.twice.pk, self.once.pk])
+        self.assertEqual(self.ids('джанго', ordering='-pub_date'),
+                         [self.twice.pk, self.once.pk, self.markup.pk])
+        self.assertEqual(self.ids('джанго', ordering='pub_date'),
+                         [self.markup.pk, self.once.pk, self.twice.pk])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        """Сниппет выделяет совпадения и экранирует текст записи."""
+        post, = self.search('новости')
+        self.assertIn('<mark>Новости</mark>', post['snippet'])
+        self.assertIn('&lt;b&gt;', post['snippet'])
+        response = self.client.get(reverse('posts-list'))
+        self.assertIsNone(response.data['response'][0]['snippet'])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении записи."""
+        post = Post.objects.get(pk=self.once.pk)
+        post.text = '<p>Выпуск фреймворка</p>'
+        post.save()
+        self.assertEqual(self.ids('релиз'), [self.twice.pk])
+        self.assertEqual(self.ids('фреймворк'), [post.pk])
+        post.delete()
+        self.assertEqual(self.ids('фреймворк'), [])
+
+    def test_author_is_searched(self):
+        """Записи находятся по имени автора, в том числе после смены имени."""
+        self.assertEqual(len(self.ids('author')), 3)
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'writer'
+        author.save()
+        self.assertEqual(self.ids('author'), [])
+        self.assertEqual(len(self.ids('writer')), 3)
+
+    def test_author_is_reindexed_on_rename_only(self):
+        """Записи автора переиндексируются, только если сменилось имя."""
+        author = User.objects.get(pk=self.author.pk)
+        with mock.patch('api.api_post.search.rename_author') as rename:
+            author.first_name = 'Имя'
+            author.save()
+            author.username = 'author'
+            author.save()
+            rename.assert_not_called()
+            author.username = 'writer'
+            author.save()
+            rename.assert_called_once_with(author)
+
+    def test_cursor_keeps_ordering(self):
+        """Курсорная пагинация поиска идёт по дате, а не по рангу."""
+        self.assertEqual(self.ids('джанго', pagination='cursor'),
+                         [self.twice.pk, self.once.pk, self.markup.pk])
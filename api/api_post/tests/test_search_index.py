@@ -0,0 +1,227 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Post, Tag, User
+from api.api_post.search_index import SearchIndex, get_search_index
+from api.api_post.stemmer import stem
+
+
+class SearchIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.index = SearchIndex(self.directory, flush_docs=2,
+                                 max_segments=2)
+
+    def ids(self, query, index=None):
+        return [doc for doc, _ in (index or self.index).search(query, 10)]
+
+    def test_word_forms_match(self):
+        """Формы русских и английских слов сводятся к одной основе."""
+        self.assertEqual(stem('новости'), stem('новостей'))
+        self.assertEqual(stem('красивейший'), stem('красивая'))
+        self.assertEqual(stem('testing'), stem('tests'))
+        self.index.add(1, 'Новости сообщества')
+        self.assertEqual(self.ids('новость'), [1])
+
+    def test_bm25_ranking(self):
+        """Частый в документе и редкий в индексе термин ранжируется выше."""
+        self.index.add(1, 'джанго релиз')
+        self.index.add(2, 'джанго джанго джанго релиз')
+        self.index.add(3, 'питон релиз')
+        self.assertEqual(self.ids('джанго релиз'), [2, 1])
+        self.assertEqual(self.ids('джанго питон'), [])
+
+    def test_segments_are_persisted(self):
+        """Сброшенные сегменты читаются другим экземпляром индекса."""
+        for doc in range(1, 6):
+            self.index.add(doc, f'запись номер {doc}')
+        self.index.flush()
+        reopened = SearchIndex(self.directory)
+        self.assertEqual(sorted(self.ids('запись', reopened)),
+                         [1, 2, 3, 4, 5])
+        self.assertEqual(reopened.doc_count, 5)
+
+    def test_updates_hide_old_versions(self):
+        """Изменённые и удалённые документы не находятся по старому тексту,
+        в том числе после слияния сегментов."""
+        for doc in range(1, 5):
+            self.index.add(doc, 'старый текст')
+        self.index.add(1, 'новый текст')
+        self.index.remove(2)
+        self.assertEqual(sorted(self.ids('старый')), [3, 4])
+        self.assertEqual(self.ids('новый'), [1])
+        for doc in range(5, 9):
+            self.index.add(doc, 'другой текст')
+        self.index.flush()
+        self.assertLessEqual(len(self.index.segments), 2)
+        self.assertEqual(sorted(self.ids('старый')), [3, 4])
+        self.index.merge()
+        self.assertEqual(len(self.index.segments), 1)
+        self.assertEqual(self.index.deleted, {})
+        self.assertEqual(sorted(self.ids('старый')), [3, 4])
+        self.assertEqual(self.index.doc_count, 7)
+        reopened = SearchIndex(self.directory)
+        self.assertEqual(self.ids('новый', reopened), [1])
+
+    def test_merges_rewrite_the_newest_segments(self):
+        """Слияние переписывает только новые сегменты, пока старый
+        больше их."""
+        index = SearchIndex(self.directory, flush_docs=100, max_segments=3)
+        for doc in range(1, 9):
+            index.add(doc, 'большой сегмент')
+        index.flush()
+        first = index.segments[0].name
+        for doc in range(9, 13):
+            index.add(doc, 'маленький сегмент')
+            index.flush()
+        self.assertEqual(index.segments[0].name, first)
+        self.assertLessEqual(len(index.segments), 3)
+        self.assertEqual(len(self.ids('сегмент', index)), 10)
+
+    def test_counts_are_kept_in_the_manifest(self):
+        """Число и длина живых документов хранятся в манифесте и не
+        пересчитываются обходом сегментов."""
+        for doc in range(1, 6):
+            self.index.add(doc, 'первая версия')
+        self.index.flush()
+        with mock.patch.object(SearchIndex, 'count_segment_docs',
+                               side_effect=AssertionError):
+            self.index.add(1, 'вторая версия текста')
+            self.index.remove(2)
+            self.index.flush()
+            reopened = SearchIndex(self.directory)
+        expected = (self.index.doc_count, self.index.total_length)
+        self.assertEqual(expected, (4, 9))
+        self.assertEqual((reopened.doc_count, reopened.total_length),
+                         expected)
+        reopened.count_segment_docs()
+        reopened.count_docs()
+        self.assertEqual((reopened.doc_count, reopened.total_length),
+                         expected)
+
+    def test_same_doc_from_two_processes(self):
+        """Документ, записанный двумя процессами, считается один раз."""
+        other = SearchIndex(self.directory)
+        self.index.add(1, 'старый текст')
+        other.add(1, 'новый текст')
+        self.index.flush()
+        other.flush()
+        self.index.refresh()
+        self.assertEqual(self.index.doc_count, 1)
+        self.assertEqual(self.ids('старый'), [])
+        self.assertEqual(self.ids('новый'), [1])
+
+    def test_other_process_flush_is_seen(self):
+        """Индекс перечитывает сегменты, сброшенные другим процессом."""
+        other = SearchIndex(self.directory)
+        self.index.add(1, 'общий текст')
+        self.index.flush()
+        self.assertEqual(self.ids('общий', other), [1])
+
+
+class IndexPostSearchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author',
+                                         email='author@example.com')
+        cls.tag = Tag.objects.create(title='фреймворки', slug='frameworks')
+        cls.post = Post.objects.create(
+            author=cls.author, text='<p>Релизы <b>джанго</b> вышли</p>'
+        )
+        cls.other = Post.objects.create(author=cls.author,
+                                        text='<p>Питон</p>')
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(SEARCH_BACKEND='index',
+                                     SEARCH_INDEX_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        get_search_index().add(self.post.pk, 'Релизы джанго вышли')
+        get_search_index().add(self.other.pk, 'Питон')
+        self.client = APIClient()
+
+    def search(self, terms):
+        response = self.client.get(reverse('posts-list'), {'search': terms})
+        self.assertEqual(response.status_code, 200)
+        return response.data['response']
+
+    def test_search_by_word_form(self):
+        """Поиск через индекс находит запись по другой форме слова."""
+        post, = self.search('релиз')
+        self.assertEqual(post['id'], self.post.pk)
+        self.assertIn('<mark>Релизы</mark>', post['snippet'])
+
+    def test_index_follows_signals(self):
+        """Индекс обновляется сигналами записи и её тегов."""
+        post = Post.objects.get(pk=self.other.pk)
+        post.text = '<p>Питон и джанго</p>'
+        post.save()
+        self.assertEqual(len(self.search('джанго')), 2)
+        post.tags.add(self.tag)
+        self.assertEqual([found['id'] for found in self.search('фреймворк')],
+                         [post.pk])
+        post.delete()
+        self.assertEqual(self.search('питон'), [])
+
+
+class IndexCommitTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(SEARCH_BACKEND='index',
+                                     SEARCH_INDEX_DIR=directory,
+                                     SEARCH_INDEX_FLUSH_INTERVAL=3600)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # the index of another process
+        self.other = SearchIndex(directory)
+
+    def ids(self, query):
+        return [doc for doc, _ in self.other.search(query, 10)]
+
+    def fire_timer(self):
+        index = get_search_index()
+        self.assertIsNotNone(index.flush_timer)
+        index.flush_timer.cancel()
+        index.timed_flush()
+
+    def test_commits_are_seen_by_other_processes(self):
+        """Изменения записей видны другим процессам после сброса по
+        таймеру."""
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        post = Post.objects.create(author=author, text='<p>Релиз джанго</p>')
+        self.assertEqual(self.ids('джанго'), [])
+        self.fire_timer()
+        self.assertEqual(self.ids('джанго'), [post.pk])
+        post.text = '<p>Питон</p>'
+        post.save()
+        self.fire_timer()
+        self.assertEqual(self.ids('джанго'), [])
+        self.assertEqual(self.ids('питон'), [post.pk])
+        post.delete()
+        self.fire_timer()
+        self.assertEqual(self.ids('питон'), [])
+
+    def test_commits_are_flushed_together(self):
+        """Изменения нескольких коммитов пишутся одним сегментом."""
+        author = User.objects.create(username='author',
+                                     email='author@example.com')
+        posts = [Post.objects.create(author=author, text='<p>Релиз</p>')
+                 for _ in range(3)]
+        self.fire_timer()
+        self.assertEqual(sorted(self.ids('релиз')),
+                         [post.pk for post in posts])
+        self.assertEqual(len(self.other.segments), 1)
+        self.assertEqual(self.other.doc_count, 3)
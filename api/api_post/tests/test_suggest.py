@@ -0,0 +1,100 @@
+import threading
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Group, Post, Tag, User
+from api.api_post.suggest import suggest_index
+
+TEXT = 'Тестовый текст'
+
+
+class SuggestTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='django_fan',
+                                         email='fan@example.com')
+        cls.group = Group.objects.create(title='Джанго и питон',
+                                         slug='django', description='')
+        cls.tag = Tag.objects.create(title='Django', slug='django')
+        cls.other_tag = Tag.objects.create(title='Новости Django',
+                                           slug='django-news')
+        post = Post.objects.create(author=cls.author, text=TEXT,
+                                   group=cls.group)
+        post.tags.add(cls.other_tag)
+
+    def setUp(self):
+        cache.clear()
+        suggest_index.reset()
+        self.addCleanup(suggest_index.reset)
+        self.client = APIClient()
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('suggest'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['slug'], item['posts_count'])
+                for item in response.data]
+
+    def test_prefix_of_any_word(self):
+        """Подсказки ищутся по началу любого слова, больше записей выше."""
+        self.assertEqual(self.suggest('DJ'), [
+            ('user', 'django_fan', 1),
+            ('tag', 'django-news', 1),
+            ('tag', 'django', 0),
+        ])
+        self.assertEqual(self.suggest('питон'), [('group', 'django', 1)])
+        self.assertEqual(self.suggest('dj', type='tag,group', limit=1),
+                         [('tag', 'django-news', 1)])
+        self.assertEqual(self.suggest(' '), [])
+
+    def test_invalid_params(self):
+        """Неизвестный тип и неверный limit отклоняются."""
+        url = reverse('suggest')
+        for params in ({'type': 'post'}, {'limit': 0}, {'limit': 'all'}):
+            response = self.client.get(url, {'q': 'dj', **params})
+            self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется без перезагрузки и без запросов к базе."""
+        self.suggest('dj')
+        tag = Tag.objects.get(pk=self.tag.pk)
+        tag.title = 'Фреймворки'
+        tag.save()
+        Tag.objects.create(title='Фронтенд', slug='frontend')
+        self.other_tag.delete()
+        post = Post.objects.create(author=self.author, text=TEXT)
+        post.tags.add(tag)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('ф'), [
+                ('tag', 'django', 1),
+                ('tag', 'frontend', 0),
+            ])
+            self.assertEqual(self.suggest('dj'), [('user', 'django_fan', 2)])
+        post.group = self.group
+        post.save()
+        post.delete()
+        self.assertEqual(self.suggest('ф'), [
+            ('tag', 'django', 0),
+            ('tag', 'frontend', 0),
+        ])
+        self.assertEqual(self.suggest('джанго'), [('group', 'django', 1)])
+
+    def test_old_index_is_served_while_reloading(self):
+        """Устаревший индекс отвечает, пока один поток его
+        перезагружает."""
+        self.suggest('dj')
+        suggest_index.loaded -= settings.SUGGEST_INDEX_MAX_AGE + 1
+        release = threading.Event()
+        with mock.patch.object(suggest_index, 'load',
+                               side_effect=lambda: release.wait(5)) as load:
+            self.assertEqual(self.suggest('питон'), [('group', 'django', 1)])
+            thread = suggest_index.reloading
+            self.assertEqual(self.suggest('питон'), [('group', 'django', 1)])
+            release.set()
+            thread.join(5)
+        load.assert_called_once_with()
+        self.assertIsNone(suggest_index.reloading)
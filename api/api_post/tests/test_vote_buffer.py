@@ -0,0 +1,108 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from api.api_post import vote_buffer
+from api.api_post.models import LikeDislike, Post, User
+from api.api_post.vote_buffer import VoteBuffer
+from api.api_post.votes import toggle_vote
+
+TEXT = 'Тестовый текст'
+
+
+class VoteBufferTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.other = User.objects.create(username='other',
+                                        email='other@example.com')
+        cls.post = Post.objects.create(author=cls.user, text=TEXT)
+
+    def setUp(self):
+        self.buffer = VoteBuffer(3600)
+        # flushed by the tests, not by the thread
+        patcher = mock.patch.object(self.buffer, 'start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def toggle(self, user, vote):
+        return self.buffer.toggle(Post, self.post.pk, user, vote)
+
+    def counters(self):
+        return Post.objects.values_list(
+            'likes_count', 'dislikes_count', 'rating'
+        ).get(pk=self.post.pk)
+
+    def overlaid(self, user=None):
+        post = Post.objects.get(pk=self.post.pk)
+        self.buffer.overlay([post], user)
+        return post.likes_count, post.dislikes_count, post.rating
+
+    def test_toggles_are_coalesced(self):
+        """Повторные нажатия одного пользователя сводятся к итоговому
+        голосу, запись в базу — одна на объект."""
+        self.assertEqual(self.toggle(self.user, LikeDislike.LIKE),
+                         (None, LikeDislike.LIKE, 1, 0))
+        self.assertEqual(self.toggle(self.user, LikeDislike.DISLIKE),
+                         (LikeDislike.LIKE, LikeDislike.DISLIKE, 0, 1))
+        self.toggle(self.other, LikeDislike.LIKE)
+        self.toggle(self.other, LikeDislike.LIKE)
+        self.assertEqual(len(self.buffer.pending), 2)
+        self.assertEqual(self.counters(), (0, 0, 0))
+        self.assertEqual(self.overlaid(), (0, 1, -1))
+        self.buffer.flush()
+        self.assertEqual(self.counters(), (0, 1, -1))
+        self.assertEqual(
+            list(LikeDislike.objects.values_list('user', 'vote')),
+            [(self.user.pk, LikeDislike.DISLIKE)]
+        )
+        self.assertEqual(self.overlaid(), (0, 1, -1))
+
+    def test_failed_flush_is_requeued(self):
+        """Неудачная запись возвращает голоса в очередь."""
+        self.toggle(self.user, LikeDislike.LIKE)
+        with mock.patch.object(VoteBuffer, 'write',
+                               side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.flushing, {})
+        self.assertEqual(self.overlaid(), (1, 0, 1))
+        self.toggle(self.other, LikeDislike.DISLIKE)
+        self.buffer.flush()
+        self.assertEqual(self.counters(), (1, 1, 0))
+        self.assertEqual(self.buffer.pending, {})
+
+    def test_committed_deltas_are_not_counted_twice(self):
+        """Сразу после записи счётчики не учитываются дважды."""
+        self.toggle(self.user, LikeDislike.LIKE)
+        seen = []
+        invalidate = vote_buffer.invalidate_votes
+
+        def read_after_commit(model, object_id):
+            seen.append(self.overlaid())
+            invalidate(model, object_id)
+
+        with mock.patch.object(vote_buffer, 'invalidate_votes',
+                               side_effect=read_after_commit):
+            self.buffer.flush()
+        self.assertEqual(seen, [(1, 0, 1)])
+
+    def test_conflicting_insert_is_counted_once(self):
+        """Голос, записанный другим процессом после чтения буфером,
+        не сбивает счётчики."""
+        self.toggle(self.user, LikeDislike.LIKE)
+        insert_votes = vote_buffer.insert_votes
+
+        def insert_after_other_worker(votes):
+            toggle_vote(Post, self.post.pk, self.user, LikeDislike.DISLIKE)
+            return insert_votes(votes)
+
+        with mock.patch.object(vote_buffer, 'insert_votes',
+                               side_effect=insert_after_other_worker):
+            self.buffer.flush()
+        self.assertEqual(self.counters(), (1, 0, 1))
+        self.assertEqual(
+            list(LikeDislike.objects.values_list('user', 'vote')),
+            [(self.user.pk, LikeDislike.LIKE)]
+        )
@@ -0,0 +1,110 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.api_post.models import Comment, LikeDislike, Post, User
+
+TEXT = 'Тестовый текст'
+
+
+@override_settings(VOTES_WRITE_BEHIND=0)
+class VotesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user',
+                                       email='user@example.com')
+        cls.other = User.objects.create(username='other',
+                                        email='other@example.com')
+        cls.posts = [Post.objects.create(author=cls.user, text=TEXT)
+                     for _ in range(4)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def vote(self, post, action, user=None):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.post(reverse(f'posts-{action}', args=[post.pk]))
+
+    def test_vote_state_is_one_query_per_page(self):
+        """Голоса читателя для страницы читаются одним запросом."""
+        liked, disliked = self.posts[0], self.posts[2]
+        self.vote(liked, 'like')
+        self.vote(disliked, 'dislike')
+        self.vote(self.posts[1], 'like', self.other)
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('posts-list'))
+        votes_table = LikeDislike._meta.db_table
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if votes_table in query['sql']
+        ]), 1)
+        state = {post['id']: (post['liked'], post['disliked'])
+                 for post in response.data['response']}
+        self.assertEqual(state, {
+            liked.pk: (True, False),
+            self.posts[1].pk: (False, False),
+            disliked.pk: (False, True),
+            self.posts[3].pk: (False, False),
+        })
+
+    def test_toggles_update_counters(self):
+        """Лайк, дизлайк и отмена голоса меняют счётчики записи."""
+        # outside PostgreSQL toggle_vote takes the ORM fallback
+        post = self.posts[0]
+        self.vote(post, 'like', self.other)
+        self.client.force_authenticate(self.user)
+        for action, code, expected in (
+            ('like', 201, (True, False, 2, 0)),
+            ('dislike', 200, (False, True, 1, 1)),
+            ('dislike', 200, (False, False, 1, 0)),
+            ('like', 201, (True, False, 2, 0)),
+            ('like', 200, (False, False, 1, 0)),
+        ):
+            with self.subTest(action=action):
+                response = self.vote(post, action)
+                self.assertEqual(response.status_code, code)
+                self.assertEqual(
+                    tuple(response.data[name] for name in (
+                        'liked', 'disliked', 'likes_count', 'dislikes_count'
+                    )),
+                    expected
+                )
+                likes, dislikes = expected[2:]
+                self.assertEqual(
+                    Post.objects.values_list(
+                        'likes_count', 'dislikes_count', 'rating'
+                    ).get(pk=post.pk),
+                    (likes, dislikes, likes - dislikes)
+                )
+        self.assertEqual(
+            LikeDislike.objects.filter(user=self.user).count(), 0
+        )
+
+    def test_vote_on_missing_post_is_not_found(self):
+        """Голос за несуществующую запись даёт 404."""
+        response = self.client.post(reverse('posts-like', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_votes_are_keyed_by_object_type(self):
+        """Голоса за объекты разных типов с одним id не конфликтуют,
+        второй голос за тот же объект запрещён."""
+        object_id = self.posts[0].pk
+        for model in (Post, Comment):
+            LikeDislike.objects.create(
+                content_type=ContentType.objects.get_for_model(model),
+                object_id=object_id, user=self.user, vote=LikeDislike.LIKE
+            )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            LikeDislike.objects.create(
+                content_type=ContentType.objects.get_for_model(Post),
+                object_id=object_id, user=self.user,
+                vote=LikeDislike.DISLIKE
+            )
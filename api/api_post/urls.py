@@ -31,6 +31,15 @@ router.register(
 )
 urlpatterns = [
     path('v1/', include(router.urls)),
+    path('v1/stats/requests',
+         views.RequestStatsView.as_view(),
+         name='request_stats'),
+    path('v1/stats/cache',
+         views.CacheStatsView.as_view(),
+         name='cache_stats'),
+    path('v1/suggest',
+         views.SuggestView.as_view(),
+         name='suggest'),
     path('v1/<str:username>',
          views.ProfileViewSet.as_view({'get': 'list'}),
          name='profile'),
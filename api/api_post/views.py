@@ -1,29 +1,100 @@
+from django.conf import settings
 from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import viewsets, mixins, filters
+from rest_framework import viewsets, mixins, filters, status
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.permissions import (IsAuthenticated,
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly, AllowAny)
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from .mixins import LikeDislikeMixins
+from .cache_backends import cache_stats
+from .comment_tree import nest, previews, subtree, thread_order
+from .feed import MergedFeed, feed_posts, feed_sources, timeline
+from .mixins import (CachedResponseMixin, EagerLoadingMixin,
+                     LikeDislikeMixins, get_eager_loading)
 from .models import Follow, Group, Post, Tag, User, Comment
 from . import serializers
-from .filters import PostFilter
+from .filters import PostFilter, PostSearchFilter
+from .instrumentation import request_stats
 from .ordering import PostCustomOrdering
+from .pagination import KeysetPagination, KeysetPaginationMixin
 from .permissions import IsOwnerOrReadOnly
+from .suggest import KINDS, TOP_SIZE, suggest_index
 
 
-class CommentViewSet(viewsets.ModelViewSet,
+class CommentViewSet(EagerLoadingMixin,
+                     viewsets.ModelViewSet,
                      LikeDislikeMixins):
     pagination_class = None
     serializer_class = serializers.CommentSerializer
     permission_classes = (IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly)
+    vote_model = Comment
+    tree_query_param = 'tree'
+    max_depth_query_param = 'max_depth'
 
     def get_queryset(self):
         post = get_object_or_404(Post, pk=self.kwargs['post_id'])
-        return post.comments.filter().annotate_like_dislike(self.request.user)
+        return post.comments.all()
+
+    def list(self, request, *args, **kwargs):
+        """Flat comments, or nested threads with ?tree=1[&max_depth=N].
+
+        With ?pagination=cursor threads are paginated by their root
+        comment, every root carries a preview of its first replies.
+        """
+        if request.query_params.get(self.tree_query_param) not in (
+                '1', 'true'):
+            return super().list(request, *args, **kwargs)
+        max_depth = self.get_max_depth(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if not KeysetPagination.is_requested(request):
+            comments = thread_order(queryset.filter(level__lte=max_depth))
+            return Response(nest(self.get_serializer(comments,
+                                                     many=True).data))
+        paginator = KeysetPagination()
+        roots = paginator.paginate_queryset(
+            queryset.filter(level=0).order_by('created'), request, self
+        )
+        comments = [*roots, *previews(queryset, roots, max_depth)]
+        return paginator.get_paginated_response(
+            nest(self.get_serializer(comments, many=True).data)
+        )
+
+    @action(detail=True, methods=('get',))
+    def replies(self, request, *args, **kwargs):
+        """Replies under a comment in thread order, by cursor.
+
+        A page starts wherever the previous one stopped, so replies
+        whose parent is on an earlier page come as top-level items.
+        """
+        # the tree of the comment is within its post already
+        queryset = subtree(self.filter_queryset(Comment.objects.all()),
+                           self.get_object())
+        paginator = KeysetPagination()
+        comments = paginator.paginate_queryset(
+            queryset.filter(level__lte=self.get_max_depth(request)),
+            request, self
+        )
+        return paginator.get_paginated_response(
+            nest(self.get_serializer(comments, many=True).data)
+        )
+
+    def get_max_depth(self, request):
+        max_depth = request.query_params.get(self.max_depth_query_param)
+        if max_depth is None:
+            return Comment.MAX_LEVEL
+        try:
+            max_depth = int(max_depth)
+        except ValueError:
+            max_depth = -1
+        if not 0 <= max_depth <= Comment.MAX_LEVEL:
+            raise ValidationError({self.max_depth_query_param: (
+                f'Expected a number from 0 to {Comment.MAX_LEVEL}.'
+            )})
+        return max_depth
 
     def perform_create(self, serializer):
         parent_id = self.request.data.get('parent')
@@ -31,31 +102,31 @@ class CommentViewSet(viewsets.ModelViewSet,
             Comment,
             pk=parent_id,
         ) if parent_id else None
-        if parent_comment and parent_comment.level > 2:
+        if parent_comment and parent_comment.level >= Comment.MAX_LEVEL:
             parent_comment = parent_comment.parent
         serializer.save(author=self.request.user,
                         post_id=self.kwargs['post_id'],
                         parent=parent_comment)
 
-    # def get_serializer_context(self):
-    #     """terrible implementation of pretty nesting comments."""
-    #     context = super(CommentViewSet, self).get_serializer_context()
-    #     trees = self.get_queryset()
-    #     children_dict = defaultdict(list)
-    #     for tree in trees:
-    #         descendants = tree.get_descendants()
-    #         for descendant in descendants:
-    #             children_dict[descendant.parent.pk].append(descendant)
-    #     context.update({'children': children_dict})
-    #     return context
+    def get_vote_filters(self):
+        return {'post': self.kwargs['post_id']}
 
 
-class PostViewSet(viewsets.ModelViewSet,
+class PostViewSet(CachedResponseMixin,
+                  EagerLoadingMixin,
+                  KeysetPaginationMixin,
+                  viewsets.ModelViewSet,
                   LikeDislikeMixins):
-    filter_backends = (DjangoFilterBackend, PostCustomOrdering, SearchFilter)
+    filter_backends = (DjangoFilterBackend, PostCustomOrdering,
+                       PostSearchFilter)
     filter_class = PostFilter
     permission_classes = (IsOwnerOrReadOnly, IsAuthenticatedOrReadOnly)
-    search_fields = ('text', 'author__username')
+    vote_model = Post
+    cache_models = (Post, Group, Tag, User)
+    cache_authenticated = True
+    overlay_model = Post
+    # pagination parameters, any other one filters the feed
+    timeline_query_params = ('page', 'pagination', 'cursor')
 
     @action(
         detail=False,
@@ -63,14 +134,48 @@ class PostViewSet(viewsets.ModelViewSet,
         permission_classes=(IsAuthenticated,)
     )
     def follow(self, request, *args, **kwargs):
-        """Return all following's posts."""
-        return self.list(self, request, *args, **kwargs)
+        """Return all following's posts.
+
+        Feeds without pulled authors or a horizon are a page of the
+        timeline, others merge the timeline with the authors' cached posts
+        and the posts older than the horizon. Filtered, searched or
+        reordered feeds and cursors over a merged feed go through the
+        regular list.
+        """
+        if set(request.query_params) - set(self.timeline_query_params):
+            return self.list(request, *args, **kwargs)
+        authors, horizon = feed_sources(request.user)
+        if not authors and horizon is None:
+            select_related, prefetch_related = get_eager_loading(
+                Post, self.get_serializer_class()
+            )
+            entries = self.paginate_queryset(
+                timeline(request.user).select_related(
+                    'post', *(f'post__{name}' for name in select_related)
+                ).prefetch_related(
+                    *(f'post__{name}' for name in prefetch_related)
+                )
+            )
+            posts = [entry.post for entry in entries]
+        elif KeysetPagination.is_requested(request):
+            return self.list(request, *args, **kwargs)
+        else:
+            posts = self.paginate_queryset(
+                MergedFeed(request.user, authors, self.load_posts, horizon)
+            )
+        serializer = self.get_serializer(posts, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def load_posts(self, ids):
+        """Posts with ids in the order of ids."""
+        posts = self.filter_queryset(Post.objects.filter(pk__in=ids))
+        posts = posts.in_bulk()
+        return [posts[pk] for pk in ids if pk in posts]
 
     def get_queryset(self):
-        queryset = Post.objects.annotate_like_dislike(self.request.user)
         if self.action == 'follow':
-            return queryset.filter(author__following__user=self.request.user)
-        return queryset
+            return feed_posts(self.request.user)
+        return Post.objects.all()
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -83,22 +188,27 @@ class PostViewSet(viewsets.ModelViewSet,
         return serializers.PostSerializer
 
 
-class ProfileViewSet(mixins.ListModelMixin,
+class ProfileViewSet(CachedResponseMixin,
+                     EagerLoadingMixin,
+                     KeysetPaginationMixin,
+                     mixins.ListModelMixin,
                      viewsets.GenericViewSet):
     serializer_class = serializers.PostSerializer
     permission_classes = (AllowAny,)
     filter_backends = (DjangoFilterBackend, PostCustomOrdering)
     filter_class = PostFilter
     http_method_names = ('get',)
+    cache_models = (Post, Group, Tag, User)
+    cache_authenticated = True
+    overlay_model = Post
 
     def get_queryset(self):
         author = get_object_or_404(User, username=self.kwargs['username'])
-        return Post.objects.filter(
-            author=author
-        ).annotate_like_dislike(self.request.user)
+        return Post.objects.filter(author=author)
 
 
-class GroupViewSet(mixins.CreateModelMixin,
+class GroupViewSet(CachedResponseMixin,
+                   mixins.CreateModelMixin,
                    mixins.ListModelMixin,
                    mixins.RetrieveModelMixin,
                    viewsets.GenericViewSet):
@@ -110,9 +220,12 @@ class GroupViewSet(mixins.CreateModelMixin,
     ordering_fields = ('posts_count', 'title')
     http_method_names = ('get', 'post')
     lookup_field = 'slug'
+    cache_models = (Group, Post)
+    cache_authenticated = True
 
 
-class TagViewSet(mixins.CreateModelMixin,
+class TagViewSet(CachedResponseMixin,
+                 mixins.CreateModelMixin,
                  mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
@@ -122,6 +235,8 @@ class TagViewSet(mixins.CreateModelMixin,
     permission_classes = (IsAuthenticatedOrReadOnly,)
     http_method_names = ('get', 'post')
     lookup_field = 'slug'
+    cache_models = (Tag,)
+    cache_authenticated = True
 
 
 class FollowViewSet(mixins.CreateModelMixin,
@@ -135,3 +250,63 @@ class FollowViewSet(mixins.CreateModelMixin,
 
     def get_queryset(self):
         return Follow.objects.filter(user=self.request.user)
+
+
+class RequestStatsView(APIView):
+    """Query counts and timings per view name of this process."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(request_stats.snapshot())
+
+    def delete(self, request):
+        request_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CacheStatsView(APIView):
+    """Cache hits and misses per key kind of this process."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({'backend': settings.CACHE_BACKEND,
+                         **cache_stats.snapshot()})
+
+    def delete(self, request):
+        cache_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class SuggestView(APIView):
+    """Tags, groups and authors whose name starts with ?q=, by posts.
+
+    ?type=tag,group,user narrows the kinds, ?limit= caps the items.
+    """
+    permission_classes = (AllowAny,)
+    default_limit = 10
+    max_limit = TOP_SIZE
+
+    def get(self, request):
+        kinds = request.query_params.get('type')
+        kinds = kinds.split(',') if kinds else KINDS
+        if not set(kinds) <= set(KINDS):
+            raise ValidationError({'type': (
+                f'Expected a comma separated list of {", ".join(KINDS)}.'
+            )})
+        limit = request.query_params.get('limit', self.default_limit)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({'limit': (
+                f'Expected a number from 1 to {self.max_limit}.'
+            )})
+        suggestions = suggest_index.suggest(
+            request.query_params.get('q', ''), kinds, limit
+        )
+        return Response([
+            {'type': kind, 'title': title, 'slug': slug,
+             'posts_count': posts_count}
+            for kind, title, slug, posts_count in suggestions
+        ])
@@ -0,0 +1,290 @@
+"""Write-behind buffer for vote toggles (settings.VOTES_WRITE_BEHIND).
+
+Toggles are kept in memory of the process and written by a background
+thread every VOTES_FLUSH_INTERVAL seconds. Toggles of the same user on
+the same object are coalesced into the final vote, and every touched
+object gets a single counter UPDATE per flush. Lists overlay pending
+votes and counter deltas, so a voter reads their own writes only from
+the worker that took the vote: other workers read the database and see
+the vote after the flush.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+
+from .cache import invalidate_votes
+from .models import LikeDislike
+from .votes import vote_deltas
+
+logger = logging.getLogger(__name__)
+
+
+class VoteBuffer:
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        # (content_type_id, object_id, user_id) -> [db vote, final vote]
+        self.pending = {}
+        self.flushing = {}
+        # (content_type_id, object_id) -> [likes delta, dislikes delta]
+        self.deltas = defaultdict(lambda: [0, 0])
+        self.flushing_deltas = {}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def toggle(self, model, object_id, user, vote, **filters):
+        """Same contract as votes.toggle_vote, but nothing is written."""
+        content_type = ContentType.objects.get_for_model(model)
+        counters = model._default_manager.filter(
+            pk=object_id, **filters
+        ).values_list('likes_count', 'dislikes_count').first()
+        if counters is None:
+            raise model.DoesNotExist
+        key = (content_type.id, object_id, user.pk)
+        with self.lock:
+            entry = self.pending.get(key) or self.flushing.get(key)
+        if entry is None:
+            stored = LikeDislike.objects.filter(
+                content_type=content_type, object_id=object_id, user=user.pk,
+            ).values_list('vote', flat=True).first()
+            entry = [stored, stored]
+        with self.lock:
+            entry = self.pending.setdefault(key, list(entry))
+            old_vote = entry[1]
+            entry[1] = None if old_vote == vote else vote
+            likes, dislikes = vote_deltas(old_vote, entry[1])
+            deltas = self.deltas[key[:2]]
+            deltas[0] += likes
+            deltas[1] += dislikes
+            pending_likes, pending_dislikes = self.object_deltas(key[:2])
+        self.start()
+        return (old_vote, entry[1], counters[0] + pending_likes,
+                counters[1] + pending_dislikes)
+
+    def object_deltas(self, key):
+        deltas = [0, 0]
+        for source in (self.flushing_deltas, self.deltas):
+            if key in source:
+                deltas[0] += source[key][0]
+                deltas[1] += source[key][1]
+        return deltas
+
+    def overlay(self, objects, user):
+        """Apply pending votes of user and counter deltas to objects."""
+        if not objects or not (self.pending or self.flushing):
+            return
+        content_type = ContentType.objects.get_for_model(objects[0]).id
+        user_id = user.pk if user is not None else None
+        with self.lock:
+            for obj in objects:
+                likes, dislikes = self.object_deltas((content_type, obj.pk))
+                obj.likes_count += likes
+                obj.dislikes_count += dislikes
+                obj.rating += likes - dislikes
+                key = (content_type, obj.pk, user_id)
+                entry = self.pending.get(key) or self.flushing.get(key)
+                if entry is not None:
+                    obj.liked = entry[1] == LikeDislike.LIKE
+                    obj.disliked = entry[1] == LikeDislike.DISLIKE
+
+    def pending_votes(self, model, object_ids, user):
+        """{object_id: final vote} of user's pending toggles on objects."""
+        if not (self.pending or self.flushing):
+            return {}
+        content_type = ContentType.objects.get_for_model(model).id
+        votes = {}
+        with self.lock:
+            for object_id in object_ids:
+                key = (content_type, object_id, user.pk)
+                entry = self.pending.get(key) or self.flushing.get(key)
+                if entry is not None:
+                    votes[object_id] = entry[1]
+        return votes
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name='vote-buffer', daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Vote buffer flush failed')
+
+    def flush(self):
+        """Write pending votes, keep them readable until commit."""
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                self.flushing, self.pending = self.pending, {}
+                self.flushing_deltas = dict(self.deltas)
+                self.deltas.clear()
+            try:
+                by_type = defaultdict(dict)
+                for (content_type, object_id, user_id), (_, vote) in (
+                        self.flushing.items()):
+                    by_type[content_type][object_id, user_id] = vote
+                self.commit(by_type)
+                # other processes render the counters from the db
+                for content_type, votes in by_type.items():
+                    model = ContentType.objects.get_for_id(
+                        content_type
+                    ).model_class()
+                    for object_id in {object_id for object_id, _ in votes}:
+                        invalidate_votes(model, object_id)
+            except Exception:
+                with self.lock:
+                    # put the toggles back under the ones taken meanwhile
+                    for key, entry in self.flushing.items():
+                        if key in self.pending:
+                            self.pending[key][0] = entry[0]
+                        else:
+                            self.pending[key] = entry
+                    for key, (likes, dislikes) in (
+                            self.flushing_deltas.items()):
+                        self.deltas[key][0] += likes
+                        self.deltas[key][1] += dislikes
+                raise
+            finally:
+                with self.lock:
+                    self.flushing = {}
+                    self.flushing_deltas = {}
+
+    def commit(self, by_type):
+        """Write the flushing votes, drop them as the counters commit.
+
+        Readers add the flushing deltas to the counters they read, so
+        the deltas go in the same critical section as the commit.
+        """
+        locked = False
+        try:
+            with transaction.atomic():
+                for content_type, votes in by_type.items():
+                    self.write(content_type, votes)
+                self.lock.acquire()
+                locked = True
+            self.flushing = {}
+            self.flushing_deltas = {}
+        finally:
+            if locked:
+                self.lock.release()
+
+    @staticmethod
+    def write(content_type, votes):
+        """Bring stored votes to the final ones, recount from the db."""
+        model = ContentType.objects.get_for_id(content_type).model_class()
+        object_ids = {object_id for object_id, _ in votes}
+        existing = set(model._default_manager.filter(
+            pk__in=object_ids
+        ).values_list('pk', flat=True))
+        # locked like toggle_vote, so the deltas below hold at commit
+        stored = LikeDislike.objects.select_for_update().filter(
+            content_type=content_type,
+            object_id__in=object_ids,
+            user__in={user_id for _, user_id in votes},
+        )
+        stored = {(object_id, user_id): vote for object_id, user_id, vote
+                  in stored.values_list('object_id', 'user', 'vote')}
+
+        deleted, changed, created = Q(), defaultdict(Q), []
+        counters = defaultdict(lambda: [0, 0])
+        for (object_id, user_id), vote in votes.items():
+            old_vote = stored.get((object_id, user_id))
+            if object_id not in existing or old_vote == vote:
+                continue
+            lookup = Q(object_id=object_id, user=user_id)
+            if vote is None:
+                deleted |= lookup
+            elif old_vote is None:
+                created.append(LikeDislike(
+                    content_type_id=content_type, object_id=object_id,
+                    user_id=user_id, vote=vote,
+                ))
+            else:
+                changed[vote] |= lookup
+            likes, dislikes = vote_deltas(old_vote, vote)
+            counters[object_id][0] += likes
+            counters[object_id][1] += dislikes
+
+        votes = LikeDislike.objects.filter(content_type=content_type)
+        if deleted:
+            votes.filter(deleted).delete()
+        for vote, lookup in changed.items():
+            votes.filter(lookup).update(vote=vote)
+        for like in insert_votes(created):
+            # inserted by another transaction since the read, counted
+            # there: take it off the deltas and overwrite it
+            conflict = votes.select_for_update().filter(
+                object_id=like.object_id, user=like.user_id
+            )
+            old_vote = conflict.values_list('vote', flat=True).get()
+            conflict.update(vote=like.vote)
+            likes, dislikes = vote_deltas(old_vote, None)
+            counters[like.object_id][0] += likes
+            counters[like.object_id][1] += dislikes
+        for object_id, (likes, dislikes) in counters.items():
+            if likes or dislikes:
+                model._default_manager.filter(pk=object_id).update(
+                    likes_count=F('likes_count') + likes,
+                    dislikes_count=F('dislikes_count') + dislikes,
+                    rating=F('rating') + likes - dislikes,
+                )
+
+
+def insert_votes(votes):
+    """Insert votes, return the ones that hit a unique conflict."""
+    try:
+        with transaction.atomic():
+            LikeDislike.objects.bulk_create(votes)
+        return []
+    except IntegrityError:
+        pass
+    conflicts = []
+    for vote in votes:
+        try:
+            with transaction.atomic():
+                vote.save(force_insert=True)
+        except IntegrityError:
+            conflicts.append(vote)
+    return conflicts
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VoteBuffer(settings.VOTES_FLUSH_INTERVAL)
+    return _buffer
+
+
+def overlay_pending_votes(objects, user):
+    if settings.VOTES_WRITE_BEHIND:
+        get_vote_buffer().overlay(objects, user)
+
+
+def pending_votes(model, object_ids, user):
+    if settings.VOTES_WRITE_BEHIND:
+        return get_vote_buffer().pending_votes(model, object_ids, user)
+    return {}
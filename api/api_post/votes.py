@@ -0,0 +1,144 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import LikeDislike
+
+DELETE_VOTE_SQL = '''
+DELETE FROM {votes}
+WHERE content_type_id = %s AND object_id = %s AND user_id = %s
+RETURNING vote
+'''
+
+UPDATE_COUNTERS_SQL = '''
+UPDATE {table}
+SET likes_count = likes_count + %s,
+    dislikes_count = dislikes_count + %s,
+    rating = rating + %s - %s
+WHERE id = %s {extra}
+RETURNING likes_count, dislikes_count
+'''
+
+INSERT_VOTE_AND_UPDATE_COUNTERS_SQL = '''
+WITH inserted AS (
+    INSERT INTO {votes} (vote, user_id, content_type_id, object_id)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (content_type_id, object_id, user_id) DO NOTHING
+    RETURNING vote
+)
+UPDATE {table}
+SET likes_count = likes_count + %s
+        + (SELECT COUNT(*) FROM inserted WHERE vote > 0),
+    dislikes_count = dislikes_count + %s
+        + (SELECT COUNT(*) FROM inserted WHERE vote < 0),
+    rating = rating + %s - %s + (SELECT COALESCE(SUM(vote), 0) FROM inserted)
+WHERE id = %s {extra}
+RETURNING likes_count, dislikes_count
+'''
+
+
+def vote_deltas(old_vote, new_vote):
+    """Changes of (likes_count, dislikes_count) from old_vote to new_vote."""
+    return (
+        (new_vote == LikeDislike.LIKE) - (old_vote == LikeDislike.LIKE),
+        (new_vote == LikeDislike.DISLIKE) - (old_vote == LikeDislike.DISLIKE),
+    )
+
+
+def toggle_vote(model, object_id, user, vote, **filters):
+    """Toggle user's vote on an object and update its counters.
+
+    Returns (old_vote, new_vote, likes_count, dislikes_count), raises
+    model.DoesNotExist if no object matches object_id and filters.
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            return _toggle_vote_sql(model, content_type, object_id,
+                                    user, vote, filters)
+        return _toggle_vote_orm(model, content_type, object_id,
+                                user, vote, filters)
+
+
+def _toggle_vote_sql(model, content_type, object_id, user, vote, filters):
+    """Two round-trips: DELETE ... RETURNING, then upsert with counters."""
+    quote = connection.ops.quote_name
+    extra = ''.join(f' AND {quote(model._meta.get_field(name).column)} = %s'
+                    for name in filters)
+    tables = {'votes': quote(LikeDislike._meta.db_table),
+              'table': quote(model._meta.db_table),
+              'extra': extra}
+    with connection.cursor() as cursor:
+        cursor.execute(DELETE_VOTE_SQL.format(**tables),
+                       [content_type.id, object_id, user.pk])
+        row = cursor.fetchone()
+        old_vote = row[0] if row else None
+        likes, dislikes = vote_deltas(old_vote, None)
+        new_vote = None if old_vote == vote else vote
+        if new_vote is None:
+            cursor.execute(
+                UPDATE_COUNTERS_SQL.format(**tables),
+                [likes, dislikes, likes, dislikes, object_id,
+                 *filters.values()],
+            )
+        else:
+            cursor.execute(
+                INSERT_VOTE_AND_UPDATE_COUNTERS_SQL.format(**tables),
+                [new_vote, user.pk, content_type.id, object_id,
+                 likes, dislikes, likes, dislikes, object_id,
+                 *filters.values()],
+            )
+        counters = cursor.fetchone()
+    if counters is None:
+        raise model.DoesNotExist
+    return (old_vote, new_vote, *counters)
+
+
+def _toggle_vote_orm(model, content_type, object_id, user, vote, filters):
+    votes = LikeDislike.objects.select_for_update().filter(
+        content_type=content_type, object_id=object_id, user=user.pk,
+    )
+    old_vote = votes.values_list('vote', flat=True).first()
+    new_vote = None if old_vote == vote else vote
+    if new_vote is None:
+        votes.delete()
+    elif old_vote is None:
+        LikeDislike.objects.create(content_type=content_type,
+                                   object_id=object_id,
+                                   user=user, vote=new_vote)
+    else:
+        votes.update(vote=new_vote)
+    likes, dislikes = vote_deltas(old_vote, new_vote)
+    objects = model._default_manager.filter(pk=object_id, **filters)
+    updated = objects.update(
+        likes_count=F('likes_count') + likes,
+        dislikes_count=F('dislikes_count') + dislikes,
+        rating=F('rating') + likes - dislikes,
+    )
+    if not updated:
+        raise model.DoesNotExist
+    return (old_vote, new_vote,
+            *objects.values_list('likes_count', 'dislikes_count').get())
+
+
+def withdraw_votes(user):
+    """Take user's votes off the counters before the votes are deleted.
+
+    Returns the ids of the voted objects by model.
+    """
+    votes = LikeDislike.objects.filter(user=user.pk).order_by()
+    voted = {}
+    for content_type_id, vote in votes.values_list(
+            'content_type', 'vote').distinct():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        object_ids = list(votes.filter(
+            content_type=content_type_id, vote=vote
+        ).values_list('object_id', flat=True))
+        likes, dislikes = vote_deltas(vote, None)
+        model._default_manager.filter(pk__in=object_ids).update(
+            likes_count=F('likes_count') + likes,
+            dislikes_count=F('dislikes_count') + dislikes,
+            rating=F('rating') + likes - dislikes,
+        )
+        voted.setdefault(model, []).extend(object_ids)
+    return voted
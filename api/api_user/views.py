@@ -27,7 +27,6 @@ class AuthViewSet(viewsets.GenericViewSet):
     @action(detail=False, methods=('post',))
     def login(self, request):
         serializer = self.get_serializer(data=request.data)
-        print(request.data)
         serializer.is_valid(raise_exception=True)
         user = authenticate_user(**serializer.validated_data)
         data = serializers.AuthUserSerializer(user).data
@@ -41,7 +40,6 @@ class AuthViewSet(viewsets.GenericViewSet):
 
     @action(detail=False, methods=('post',))
     def signup(self, request):
-        print(request.data)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
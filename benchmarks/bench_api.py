@@ -0,0 +1,167 @@
+"""Latency percentiles and query counts of the main API endpoints.
+
+    python -m benchmarks.bench_api --json before.json
+    python -m benchmarks.bench_api --json after.json --compare before.json
+
+Requests go through the whole Django stack in-process, the query count
+and DB time come from the Server-Timing header of the response. The
+endpoints are measured with the response cache off, so the numbers
+compare with revisions before it, then again with warm cached pages.
+"""
+import argparse
+import json
+import re
+import subprocess
+
+from benchmarks.common import (BASE_DIR, ensure_data, measure, setup_django,
+                               summarize)
+
+SERVER_TIMING_DB = re.compile(r'db;desc="(\d+) queries";dur=([\d.]+)')
+
+
+def endpoints():
+    """(name, authenticated, url) of every benchmarked request."""
+    from django.db.models import Count
+
+    from api.api_post.models import Post, User
+    from api.api_post.ordering import PostCustomOrdering
+
+    author = User.objects.annotate(
+        followers=Count('following')
+    ).order_by('-followers').first()
+    post = Post.objects.order_by('-comments_count').first()
+    urls = [('posts', False, '/blog/api/v1/posts')]
+    urls += [(f'posts ordering={order}', False,
+              f'/blog/api/v1/posts?ordering={order}')
+             for order in PostCustomOrdering.allowed_custom_filters]
+    urls += [
+        ('posts page=100', False, '/blog/api/v1/posts?page=100'),
+        ('posts cursor', False, '/blog/api/v1/posts?pagination=cursor'),
+        ('posts as viewer', True, '/blog/api/v1/posts'),
+        ('posts/follow', True, '/blog/api/v1/posts/follow'),
+        ('post detail', True, f'/blog/api/v1/posts/{post.pk}'),
+        ('comments', True, f'/blog/api/v1/posts/{post.pk}/comments'),
+        ('profile', False, f'/blog/api/v1/{author.username}'),
+        ('groups', False, '/blog/api/v1/groups'),
+        ('tags', False, '/blog/api/v1/tags'),
+        ('users/<username>', False,
+         f'/blog/api/v1/users/{author.username}'),
+    ]
+    return urls
+
+
+def viewer():
+    """The user who follows the most authors."""
+    from django.db.models import Count
+
+    from api.api_post.models import User
+
+    return User.objects.annotate(
+        followed=Count('follower')
+    ).order_by('-followed').first()
+
+
+def run(repeat, cached=False):
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.test import override_settings
+
+    cache.clear()
+    timeout = settings.RESPONSE_CACHE_TIMEOUT if cached else 0
+    with override_settings(RESPONSE_CACHE_TIMEOUT=timeout):
+        return run_endpoints(repeat)
+
+
+def run_endpoints(repeat):
+    from rest_framework.test import APIClient
+
+    anonymous = APIClient()
+    authenticated = APIClient()
+    authenticated.force_authenticate(viewer())
+    results = {}
+    for name, auth, url in endpoints():
+        client = authenticated if auth else anonymous
+        responses = []
+
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            responses.append(response)
+
+        timings = measure(request, repeat)
+        queries, db = SERVER_TIMING_DB.search(
+            responses[-1]['Server-Timing']
+        ).groups()
+        results[name] = {**summarize(timings), 'queries': int(queries),
+                         'db_ms': float(db)}
+    return results
+
+
+def print_results(results, baseline):
+    print(f'{"endpoint":<30}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"queries":>9}' + ('   vs baseline p50 / queries'
+                               if baseline else ''))
+    for name, result in results.items():
+        line = (f'{name:<30}{result["p50"]:>10.2f}{result["p95"]:>10.2f}'
+                f'{result["p99"]:>10.2f}{result["queries"]:>9}')
+        before = baseline.get(name)
+        if before:
+            change = (result['p50'] - before['p50']) / before['p50'] * 100
+            line += (f'   {change:+.1f}% / '
+                     f'{result["queries"] - before["queries"]:+d}')
+        print(line)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'), cwd=BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--follows', type=int, default=40000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--votes', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--json', help='Write the results to this file.')
+    parser.add_argument(
+        '--compare',
+        help='Results of an earlier run (--json) to compare with.',
+    )
+    args = parser.parse_args()
+
+    setup_django('bench_api.sqlite3')
+    ensure_data(users=args.users, posts=args.posts, follows=args.follows,
+                comments=args.comments, votes=args.votes)
+
+    from api.api_post.models import Post
+
+    baseline, cached_baseline = {}, {}
+    if args.compare:
+        with open(args.compare) as file:
+            compared = json.load(file)
+        baseline = compared['results']
+        cached_baseline = compared.get('cached_results', {})
+    results = run(args.repeat)
+    cached_results = run(args.repeat, cached=True)
+    print(f'{Post.objects.count()} posts, {args.repeat} requests each')
+    print('\nresponse cache off')
+    print_results(results, baseline)
+    print('\nwarm response cache')
+    print_results(cached_results, cached_baseline)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'revision': git_revision(), 'repeat': args.repeat,
+                       'results': results,
+                       'cached_results': cached_results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
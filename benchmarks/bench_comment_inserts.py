@@ -0,0 +1,105 @@
+"""Concurrent replies to one hot thread with MPTT and path storage.
+
+    python -m benchmarks.bench_comment_inserts --threads 8 --inserts 200
+
+Every worker loads a random comment of the thread as the parent, as
+CommentViewSet.perform_create does, and saves a reply under it. MPTT
+shifts lft/rght of everything to the right of the reply, so writers of
+a thread queue on the same rows, a path insert touches only the new
+row and the ancestors' counters. SQLite takes one writer at a time,
+run it on PostgreSQL (DB_ENGINE/DB_NAME) for meaningful numbers.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import setup_django, summarize
+
+
+def insert_replies(comment_ids, inserts, seed, timings, errors):
+    from django.db import connection
+
+    from api.api_post.models import Comment
+
+    rng = random.Random(seed)
+    try:
+        for _ in range(inserts):
+            start = time.perf_counter()
+            try:
+                parent = Comment.objects.get(pk=rng.choice(comment_ids))
+                if parent.level >= Comment.MAX_LEVEL:
+                    parent = parent.parent
+                Comment.objects.create(post_id=parent.post_id,
+                                       author_id=parent.author_id,
+                                       text='reply', parent=parent)
+            except Exception as error:
+                errors.append(repr(error))
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        connection.close()
+
+
+def run(storage, threads, inserts, seed_replies):
+    from django.contrib.auth import get_user_model
+    from django.test import override_settings
+
+    from api.api_post.models import Comment, Post
+
+    with override_settings(COMMENTS_TREE_STORAGE=storage):
+        user, _ = get_user_model().objects.get_or_create(
+            username='bench_comments', defaults={'email': 'bench@example.com'}
+        )
+        post = Post.objects.create(author=user, text='bench')
+        try:
+            thread = [Comment.objects.create(post=post, author=user,
+                                             text='root')]
+            for _ in range(seed_replies):
+                thread.append(Comment.objects.create(
+                    post=post, author=user, text='reply',
+                    parent=random.choice(thread[:1 + len(thread) // 2]),
+                ))
+            comment_ids = [comment.pk for comment in thread
+                           if comment.level < Comment.MAX_LEVEL]
+            timings, errors = [], []
+            workers = [
+                threading.Thread(target=insert_replies, args=(
+                    comment_ids, inserts, seed, timings, errors
+                ))
+                for seed in range(threads)
+            ]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            Comment.objects.filter(post=post).delete()
+            post.delete()
+    summary = summarize(timings) if timings else {}
+    print(f'{storage:<6} {len(timings) / elapsed:8.1f} inserts/s '
+          f'p50={summary.get("p50", 0):8.2f}ms '
+          f'p95={summary.get("p95", 0):8.2f}ms '
+          f'errors={len(errors)}')
+    for error in sorted(set(errors))[:3]:
+        print(f'       {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--inserts', type=int, default=200,
+                        help='Replies per thread.')
+    parser.add_argument('--seed-replies', type=int, default=1000,
+                        help='Replies in the thread before the run.')
+    args = parser.parse_args()
+
+    setup_django()
+    for storage in ('mptt', 'path'):
+        run(storage, args.threads, args.inserts, args.seed_replies)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Rating ordering: stored indexed column vs per-request vote COUNT.
+
+    python -m benchmarks.bench_rating_ordering --posts 100000 --votes 5000000
+"""
+import argparse
+
+from benchmarks.common import ensure_data, measure, report, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--votes', type=int, default=5000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument(
+        '--baseline-repeat',
+        type=int,
+        default=3,
+        help='Runs of the COUNT aggregation, it takes seconds per run.',
+    )
+    parser.add_argument('--page-size', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    ensure_data(users=args.users, posts=args.posts, votes=args.votes)
+
+    from django.db.models import Count, Q
+
+    from api.api_post.models import Post
+
+    def aggregated(offset):
+        return Post.objects.annotate(
+            votes_rating=(Count('votes', filter=Q(votes__vote__gt=0)) -
+                          Count('votes', filter=Q(votes__vote__lt=0)))
+        ).order_by('-votes_rating', '-pub_date')[offset:offset + args.page_size]
+
+    def stored(offset):
+        return Post.objects.order_by(
+            '-rating', '-pub_date'
+        )[offset:offset + args.page_size]
+
+    print(f'{Post.objects.count()} posts, page size {args.page_size}')
+    print(stored(0).explain())
+    for page in (1, 10, 100):
+        offset = (page - 1) * args.page_size
+        report(f'stored rating, page {page}',
+               measure(lambda: list(stored(offset)), args.repeat))
+    if args.baseline_repeat:
+        report('count aggregation, page 1',
+               measure(lambda: list(aggregated(0)), args.baseline_repeat,
+                       warmup=False))
+
+
+if __name__ == '__main__':
+    main()
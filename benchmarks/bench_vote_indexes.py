@@ -0,0 +1,83 @@
+"""Query plans and timings of vote lookups without and with the
+(content_type, object_id, user) and (content_type, object_id, vote)
+indexes of LikeDislike.
+
+    python -m benchmarks.bench_vote_indexes --posts 100000 --votes 5000000
+"""
+import argparse
+
+from benchmarks.common import ensure_data, measure, report, setup_django
+
+
+def vote_queries(page_size):
+    from django.contrib.auth import get_user_model
+    from django.contrib.contenttypes.models import ContentType
+
+    from api.api_post.management.commands.reconcile_counters import (
+        count_votes)
+    from api.api_post.models import LikeDislike, Post
+
+    content_type = ContentType.objects.get_for_model(Post)
+    vote = LikeDislike.objects.order_by('-id').first()
+    user = get_user_model().objects.get(pk=vote.user_id)
+    page = list(Post.objects.order_by('-rating').values_list(
+        'pk', flat=True
+    )[:page_size])
+    return {
+        'viewer votes of a page': LikeDislike.objects.filter(
+            content_type=content_type, object_id__in=page, user=user,
+        ).values_list('object_id', 'vote'),
+        'vote toggle lookup': LikeDislike.objects.filter(
+            content_type=content_type, object_id=vote.object_id, user=user,
+        ),
+        'liked/disliked EXISTS': Post.objects.annotate_like_dislike(
+            user
+        ).order_by('-rating')[:page_size],
+        'likes count of a page': Post.objects.filter(pk__in=page).annotate(
+            actual_likes=count_votes(Post, vote__gt=0),
+        ),
+    }
+
+
+def run(title, page_size, repeat):
+    print(f'=== {title}')
+    for name, queryset in vote_queries(page_size).items():
+        print(f'--- {name}')
+        print(queryset.explain())
+        report(name, measure(lambda: list(queryset.all()), repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--votes', type=int, default=5000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    ensure_data(users=args.users, posts=args.posts, votes=args.votes)
+
+    from django.db import connection
+
+    from api.api_post.models import LikeDislike
+
+    unique = LikeDislike._meta.unique_together
+    indexes = LikeDislike._meta.indexes
+    with connection.schema_editor() as editor:
+        editor.alter_unique_together(LikeDislike, unique, ())
+        for index in indexes:
+            editor.remove_index(LikeDislike, index)
+    try:
+        run('without vote indexes', args.page_size, args.repeat)
+    finally:
+        with connection.schema_editor() as editor:
+            editor.alter_unique_together(LikeDislike, (), unique)
+            for index in indexes:
+                editor.add_index(LikeDislike, index)
+    run('with vote indexes', args.page_size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
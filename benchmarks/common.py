@@ -0,0 +1,69 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks run against their own database (``benchmarks/bench.sqlite3``
+unless ``DB_NAME``/``DB_ENGINE`` say otherwise), never the dev one.
+"""
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_name='bench.sqlite3'):
+    sys.path.insert(0, BASE_DIR)
+    os.environ.setdefault(
+        'DB_NAME', os.path.join(BASE_DIR, 'benchmarks', db_name)
+    )
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          '_project_settings_.settings')
+    os.environ.setdefault('DJANGO_ALLOWED_HOSTS', 'localhost testserver')
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+
+
+def ensure_data(**options):
+    """Generate the dataset once, reruns reuse the database."""
+    from django.core.management import call_command
+
+    from api.api_post.models import Post
+
+    if not Post.objects.exists():
+        call_command('generate_blog_data', **options)
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * len(ordered))))
+    return ordered[index]
+
+
+def measure(func, repeat, warmup=True):
+    """Call func repeat times, return timings in milliseconds."""
+    if warmup:
+        func()  # warm up caches and connections
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        'p50': round(percentile(timings, 50), 3),
+        'p95': round(percentile(timings, 95), 3),
+        'p99': round(percentile(timings, 99), 3),
+        'max': round(max(timings), 3),
+    }
+
+
+def report(name, timings):
+    print(f'{name:<40} p50={percentile(timings, 50):9.2f}ms '
+          f'p95={percentile(timings, 95):9.2f}ms '
+          f'max={max(timings):9.2f}ms')
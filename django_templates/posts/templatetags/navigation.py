@@ -1,16 +1,24 @@
 from django import template
+from django.conf import settings
 from django.db.models import Count
 
-from api.api_post.models import Group, Tag
+from api.api_post.cache import (cached_value, get_version, list_namespace,
+                                response_namespace)
+from api.api_post.models import Group, Post, Tag
 
 register = template.Library()
 
 
 @register.inclusion_tag('nav_groups.html')
 def get_groups(cnt=10, slug=None):
-    groups = Group.objects.annotate(
-        count=Count('posts')
-    ).order_by('-count')[:cnt]
+    groups = cached_value(
+        f'nav_groups:{cnt}',
+        lambda: list(Group.objects.annotate(
+            count=Count('posts')
+        ).order_by('-count')[:cnt]),
+        settings.NAV_GROUPS_TIMEOUT,
+        get_version([response_namespace(Group), list_namespace(Post)]),
+    )
     return {'groups': groups, 'slug': slug}
 
 
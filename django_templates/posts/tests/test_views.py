@@ -142,13 +142,14 @@ class ContextTest(TestCase):
         self.assertContains(response, 'img')
 
     def test_cache_index(self):
-        """Главная страница кэшируется."""
+        """Главная страница кэшируется до изменения её записей."""
         response = self.authorized_client.get(self.urls['index'])
         content = response.content
-        add_post(self.group, self.user, TEST_TEXT)
+        # update() sends no signals, the cached cards stay
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
         response = self.authorized_client.get(self.urls['index'])
         self.assertEqual(response.content, content)
-        cache.clear()
+        Post.objects.get(pk=self.post.pk).save()
         response = self.authorized_client.get(self.urls['index'])
         self.assertNotEqual(response.content, content)
 
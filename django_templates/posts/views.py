@@ -1,17 +1,37 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.db.models import Count, Q
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
 from .forms import CommentForm, PostForm
-from api.api_post.models import Follow, Group, Post, User, Tag, Comment
+from api.api_post.cache import (get_version, invalidate_votes,
+                                list_namespace, object_namespace)
+from api.api_post.feed import feed_posts
+from api.api_post.models import (Comment, Follow, Group, LikeDislike, Post,
+                                 Tag, User)
+from api.api_post.pagination import CachedCountPaginator
+from api.api_post.search import post_snippet, search_posts
+from api.api_post.vote_buffer import get_vote_buffer
+from api.api_post.votes import toggle_vote
 
 POSTS_PER_PAGE = 10
 
 
+def page_version(posts, sort):
+    """Version of the rendered cards of posts listed by sort."""
+    namespaces = [list_namespace(Post), list_namespace(Post, sort)]
+    for post in posts:
+        namespaces.append(object_namespace(Post, post.pk))
+        namespaces.append(object_namespace(User, post.author_id))
+        if post.group_id:
+            namespaces.append(object_namespace(Group, post.group_id))
+        namespaces.extend(object_namespace(Tag, tag.pk)
+                          for tag in post.tags.all())
+    return get_version(namespaces)
+
+
 def index(request):
     sort = request.GET.get('sort') or 'pub_date'
     if sort not in ['pub_date', 'comments_count', 'rating']:
@@ -19,16 +39,11 @@ def index(request):
     post_list = Post.objects.select_related(
         'author',
         'group',
-    ).annotate_like_dislike(request.user)
+    ).prefetch_related('tags').annotate_like_dislike(request.user)
     if sort == 'comments_count':
-        post_list = post_list.annotate(
-            count=Count('comments')
-        ).order_by('-count', '-pub_date')
+        post_list = post_list.order_by('-comments_count', '-pub_date')
     elif sort == 'rating':
-        post_list = post_list.annotate(
-            count=(Count('votes', filter=Q(votes__vote__gt=0)) -
-                   Count('votes', filter=Q(votes__vote__lt=0)))
-        ).order_by('-count', '-pub_date')
+        post_list = post_list.order_by('-rating', '-pub_date')
     param = f'sort={sort}&' if sort != 'pub_date' else ''
     paginator = Paginator(post_list, POSTS_PER_PAGE)
     page_number = request.GET.get('page')
@@ -38,6 +53,7 @@ def index(request):
         'paginator': paginator,
         'sort': sort,
         'param': param,
+        'page_version': page_version(page, sort),
     })
 
 
@@ -183,9 +199,7 @@ def add_comment(request, username, post_id, comment_id=None):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(
-        author__following__user=request.user
-    ).annotate_like_dislike(request.user)
+    posts = feed_posts(request.user).annotate_like_dislike(request.user)
     paginator = Paginator(posts, POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
@@ -233,37 +247,36 @@ def tag_posts(request, slug):
 
 @login_required
 def like(request, post_id=None, comment_id=None):
-    url = request.get_full_path()
     params = '?'
     for param in request.GET:
         params += f'{param}={request.GET[param]}&' if param != 'next' else ''
-    if request.GET.get('next') == reverse('index'):
-        cache.clear()
     redirect_to = request.GET.get('next') or reverse('index')
-    post = get_object_or_404(
-        Post,
-        pk=post_id,
-    ) if post_id else None
-    comment = get_object_or_404(
-        Comment,
-        pk=comment_id,
-    ) if comment_id else None
-    liked_obj = post or comment
-    if 'dislike' in url:
-        liked_obj.add_dislike(request.user)
-    elif 'like' in url:
-        liked_obj.add_like(request.user)
+    model, object_id = (Post, post_id) if post_id else (Comment, comment_id)
+    vote = (LikeDislike.DISLIKE if 'dislike' in request.path
+            else LikeDislike.LIKE)
+    toggle = (get_vote_buffer().toggle if settings.VOTES_WRITE_BEHIND
+              else toggle_vote)
+    try:
+        toggle(model, object_id, request.user, vote)
+    except model.DoesNotExist:
+        raise Http404
+    invalidate_votes(model, object_id)
     return redirect(f'{redirect_to}{params[:-1]}')
 
 
 def search_page(request):
-    search = request.GET.get('search')
-    post_list = Post.objects.filter(
-        text__icontains=search
+    search = request.GET.get('search', '').strip()
+    post_list = Post.objects.select_related(
+        'author', 'group'
     ).annotate_like_dislike(request.user)
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
+    if search:
+        post_list = search_posts(post_list, search)
+    # counts only the matching ids, FTS5 ranks can't go into a subquery
+    paginator = CachedCountPaginator(post_list, POSTS_PER_PAGE)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
+    for post in page:
+        post.snippet = post_snippet(post)
     return render(request, 'search.html', {
         'page': page,
         'paginator': paginator,